@@ -1,10 +1,17 @@
 name = "agstools"
 
+from .adaptive_batcher import AdaptiveBatcher
+from .async_feature_layer import AsyncFeatureLayer
 from .attachment_retriever import AttachmentRetriever
 from .attribute_mapper import AttributeMapper
 from .feature_importer import FeatureImporter
 from .feature_layer import FeatureLayer
 from .feature_mailer import FeatureMailer
+from .feature_pipeline import FeaturePipeline
 from .feature_processor import FeatureProcessor
 from .feature_retriever import FeatureRetriever
+from .feature_table import FeatureTable
 from .feature_syncer import FeatureSyncer
+from .fidelity_profile import FidelityProfile
+from .sync_state_store import SyncStateStore
+from .token_provider import TokenProvider
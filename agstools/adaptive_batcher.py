@@ -0,0 +1,123 @@
+import logging
+import threading
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveBatcher(object):
+    """Adjust batch size from observed request latency and payload size.
+
+    After each batch, the size moves toward the number of items that would take target_seconds and stay within the
+    request and response byte limits (growing or shrinking by at most a factor of two per batch). Timeouts and
+    "request too large" errors halve the size so the batch can be retried.
+    """
+
+    def __init__(self, size=500, min_size=10, max_size=10000, target_seconds=5.0,
+                 max_request_bytes=10000000, max_response_bytes=20000000):
+        """
+        Class initializer.
+
+        :param size: <int> Initial batch size
+        :param min_size: <int> Smallest batch size
+        :param max_size: <int> Largest batch size
+        :param target_seconds: <float> Target duration of a single batch request
+        :param max_request_bytes: <int> Largest serialized request payload
+        :param max_response_bytes: <int> Largest response body
+        """
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.max_request_bytes = max_request_bytes
+        self.max_response_bytes = max_response_bytes
+        self.__size = max(min_size, min(size, max_size))
+        self.__ceiling = max_size
+        self.__lock = threading.Lock()
+
+    @property
+    def size(self):
+        """
+        Current batch size.
+
+        :return: <int> Batch size
+        """
+
+        return self.__size
+
+    def record(self, count, seconds, request_bytes=0, response_bytes=0):
+        """
+        Adjust batch size from the result of a completed batch.
+
+        :param count: <int> Number of items in the batch
+        :param seconds: <float> Duration of the batch request
+        :param request_bytes: <int> Size of the serialized request payload
+        :param response_bytes: <int> Size of the response body
+        :return: <int> New batch size
+        """
+
+        if count <= 0:
+            return self.__size
+
+        ideal_sizes = [count * self.target_seconds / max(seconds, 0.001)]
+        if request_bytes:
+            ideal_sizes.append(count * self.max_request_bytes / request_bytes)
+        if response_bytes:
+            ideal_sizes.append(count * self.max_response_bytes / response_bytes)
+
+        with self.__lock:
+            new_size = int(min(ideal_sizes))
+            new_size = max(self.__size // 2, min(new_size, self.__size * 2))
+            self.__size = max(self.min_size, min(new_size, self.__ceiling))
+
+        logger.debug("Batch of {0} took {1:.2f}s; batch size now {2}.".format(count, seconds, self.__size))
+
+        return self.__size
+
+    def back_off(self, reason=None):
+        """
+        Halve the batch size after a failed batch.
+
+        After a 'too_large' failure, the batch size will not grow back to the failed size.
+
+        :param reason: <str> Failure reason from .back_off_reason(), optional
+        :return: <bool> True if the size was reduced; False if it is already at the minimum
+        """
+
+        with self.__lock:
+            if self.__size <= self.min_size:
+                return False
+            if reason == 'too_large':
+                self.__ceiling = max(self.min_size, self.__size - 1)
+            self.__size = max(self.min_size, self.__size // 2)
+
+        logger.debug("Backing off; batch size now {0}.".format(self.__size))
+
+        return True
+
+    @staticmethod
+    def back_off_reason(error):
+        """
+        Return the reason a failed request should be retried with a smaller batch.
+
+        :param error: <Exception> Request error
+        :return: <str> One of 'timeout', 'too_large' or None
+        """
+
+        if isinstance(error, requests.exceptions.Timeout):
+            return 'timeout'
+
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            if error.response.status_code == 413:
+                return 'too_large'
+            if error.response.status_code in (408, 502, 503, 504):
+                return 'timeout'
+
+        message = str(error).lower()
+
+        if 'too large' in message or 'exceeds' in message or 'maximum request' in message:
+            return 'too_large'
+        if 'timeout' in message or 'timed out' in message:
+            return 'timeout'
+
+        return None
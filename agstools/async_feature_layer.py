@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import functools
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncFeatureLayer(object):
+    """Perform FeatureLayer operations as asyncio coroutines.
+
+    Requests are made by the wrapped FeatureLayer (and its pooled session) on an executor, so many layers can be
+    synced from one event loop. At most max_concurrency requests per layer are in flight at once; pass a shared
+    semaphore to limit concurrency across several layers.
+    """
+
+    def __init__(self, feature_layer, max_concurrency=4, semaphore=None, executor=None):
+        """
+        Class initializer.
+
+        :param feature_layer: <feature_layer.FeatureLayer> Feature layer to wrap
+        :param max_concurrency: <int> Maximum number of concurrent requests
+        :param semaphore: <asyncio.Semaphore> Semaphore shared with other layers, optional
+        :param executor: <concurrent.futures.Executor> Executor for requests; event loop default if None
+        """
+
+        self.feature_layer = feature_layer
+        self.max_concurrency = max_concurrency
+        self.semaphore = semaphore
+        self.executor = executor
+
+    async def __run(self, func, *args, **kwargs):
+        """
+        Run a blocking FeatureLayer call on the executor, limited by the concurrency semaphore.
+
+        :param func: <callable> Blocking function
+        :return: <object> Function result
+        """
+
+        # create semaphore lazily so that it is bound to the running event loop
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def definition(self, refresh=False):
+        """
+        Get json feature service definition.
+
+        :param refresh: <bool> Bypass the cache and retrieve the definition from the service
+        :return: <dict> JSON feature service layer definition
+        """
+
+        return await self.__run(self.feature_layer.definition, refresh)
+
+    async def query(self, **params):
+        """
+        Get query result from feature layer.
+
+        :param params: <dict> Feature service query operation supported parameters
+        :return: <requests.Response> Request response object
+        """
+
+        return await self.__run(self.feature_layer.query, **params)
+
+    async def query_features(self, **params):
+        """
+        Get JSON features from feature layer query.
+
+        :param params: <dict> Feature service query operation supported parameters
+        :return: <list> List of JSON features
+        """
+
+        return await self.__run(self.feature_layer.query_features, **params)
+
+    async def query_features_batch(self, n=None, pagination='auto', **params):
+        """
+        Get JSON features from feature layer query in batches of size n.
+
+        Batches are requested concurrently (up to the concurrency limit) and returned in batch order. If a batch
+        fails, the remaining batches are cancelled and the error is raised.
+
+        :param n: <int> Batch size, optional
+        :param pagination: <str> Pagination strategy; one of 'auto', 'objectIds', 'offset' or 'range'
+        :param params: <dict> Feature service query operation supported parameters
+        :return: <list> List of JSON features
+        """
+
+        result = []
+
+        page_params = await self.__run(lambda: list(self.feature_layer.page_params(n, pagination, **params)))
+        tasks = [asyncio.ensure_future(self.__run(self.feature_layer.query_page, **p)) for p in page_params]
+
+        try:
+            pages = await asyncio.gather(*tasks)
+        except Exception:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        for features in pages:
+            result += features
+
+        return result
+
+    async def add_features_batch(self, n=500, **params):
+        """
+        Add JSON features to feature layer in batches of size n.
+
+        :param n: <int> Batch size
+        :param params: <dict> Feature service add operation supported parameters
+        :return: <requests.Response> Request response object (for last request)
+        """
+
+        return await self.__run(self.feature_layer.add_features_batch, n, **params)
+
+    async def update_features_batch(self, n=500, **params):
+        """
+        Update JSON features in feature layer in batches of size n.
+
+        :param n: <int> Batch size
+        :param params: <dict> Feature service update operation supported parameters
+        :return: <requests.Response> Request response object (for last request)
+        """
+
+        return await self.__run(self.feature_layer.update_features_batch, n, **params)
+
+    async def delete_features(self, **params):
+        """
+        Delete features from feature layer.
+
+        :param params: <dict> Feature service delete operation supported parameters
+        :return: <requests.Response> Request response object
+        """
+
+        return await self.__run(self.feature_layer.delete_features, **params)
+
+    async def delete_features_batch(self, object_ids, n=500, compress=False, **params):
+        """
+        Delete features from feature layer by object ID, in batches of up to n features.
+
+        :param object_ids: <iter> Object IDs of features to delete
+        :param n: <int> Batch size
+        :param compress: <bool> Send batches as range-compressed where clauses
+        :param params: <dict> Feature service delete operation supported parameters
+        :return: <dict> Combined deleteResults
+        """
+
+        return await self.__run(self.feature_layer.delete_features_batch, object_ids, n, compress, **params)
+
+    async def attachments_info(self, where='1=1', n=100, max_workers=None):
+        """
+        Get attachments info for feature layer.
+
+        :param where: <str> ESRI where clause limiting the features included
+        :param n: <int> Number of features per queryAttachments request
+        :param max_workers: <int> Maximum number of concurrent requests, optional
+        :return: <dict> Attachment info
+        """
+
+        return await self.__run(self.feature_layer.attachments_info, where, n, max_workers)
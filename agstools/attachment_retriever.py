@@ -1,10 +1,12 @@
 import os
 import re
+import json
+import time
 import urllib
 import shutil
 import logging
-from copy import deepcopy
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
@@ -12,12 +14,33 @@ logger = logging.getLogger(__name__)
 class AttachmentRetriever(object):
     """Retrieve attachments from features in a feature layer and save to file system."""
 
-    def __init__(self, feature_layer, out_path='', out_hierarchy=[]):
+    def __init__(self, feature_layer, out_path='', out_hierarchy=[], max_workers=4, manifest_path=None,
+                 token_provider=None):
+        """
+        Class initializer.
+
+        If manifest_path is given, a manifest of downloaded attachments is kept there so that later runs only
+        download new or changed attachments (see .save_attachments()).
+
+        A token_provider is used for all of the feature layer's requests (see feature_layer.FeatureLayer), so long
+        downloads continue after the first token expires.
+
+        :param feature_layer: <feature_layer.FeatureLayer> Feature layer with attachments
+        :param out_path: <str> Path to output folder
+        :param out_hierarchy: <list> Attribute names used to build the output folder hierarchy
+        :param max_workers: <int> Maximum number of concurrent downloads
+        :param manifest_path: <str> Path to attachment manifest (.json), optional
+        :param token_provider: <token_provider.TokenProvider> Token provider, optional
+        """
 
         self.feature_layer = feature_layer
-        self.oid_field = self.feature_layer.definition()['objectIdField']
+        if token_provider is not None:
+            self.feature_layer.token_provider = token_provider
+        self.oid_field = self.feature_layer.oid_field
         self.out_path = out_path
         self.out_hierarchy = out_hierarchy
+        self.max_workers = max_workers
+        self.manifest_path = manifest_path
 
     def __sanitize_string(self, value):
         """
@@ -39,8 +62,7 @@ class AttachmentRetriever(object):
         :return: <dict> Feature
         """
 
-        fields = self.feature_layer.definition()['fields']
-        date_field_names = [field['name'] for field in fields if field['type'] == 'esriFieldTypeDate']
+        date_field_names = self.feature_layer.date_fields
 
         # convert dates to formatted strings
         for attr_name in feature['attributes'].keys():
@@ -49,8 +71,8 @@ class AttachmentRetriever(object):
                 time_stamp = feature['attributes'][attr_name]
 
                 if time_stamp:
-                    time = datetime.fromtimestamp(time_stamp / 1e3)
-                    time_str = time.strftime('%Y-%m-%d')
+                    timestamp = datetime.fromtimestamp(time_stamp / 1e3)
+                    time_str = timestamp.strftime('%Y-%m-%d')
                     feature['attributes'][attr_name] = time_str
 
         # convert all attributes to strings and sanitize
@@ -72,37 +94,6 @@ class AttachmentRetriever(object):
 
         return folder_names
 
-    def __build_attachment_path(self, attachment_folders):
-        """
-        Create the folder hierarchy for this features attachments if it doesn't already exist.
-
-        :param attachment_folders: <iter> Iterable of folder names
-        :return: None
-        """
-
-        os.chdir(self.out_path)
-
-        for folder_name in attachment_folders:
-            this_path = os.path.join(os.getcwd(), folder_name)
-            try:
-                os.mkdir(folder_name)
-            except OSError as e:
-                logger.debug("Folder already exists: {0}".format(this_path))
-                raise e
-            os.chdir(folder_name)
-
-    def __download_attachment(self, url, filepath):
-        """
-        Save the resource at url to filepath.
-
-        :param url: <str> Feature service URL
-        :param filepath: <str> Target filepath
-        :return: None
-        """
-
-        auth_url = url + '?token=' + self.feature_layer.token
-        urllib.request.urlretrieve(auth_url, filepath)
-
     def __get_attachment_data(self):
         """
         Return a dict of feature info and associated attachments.
@@ -115,11 +106,10 @@ class AttachmentRetriever(object):
         attachment_data = {}
 
         query_fields = ','.join([self.oid_field] + self.out_hierarchy)
-        attachment_infos = self.feature_layer.attachments_info()
-        features = self.feature_layer.query_features_batch(where='1=1', outFields=query_fields)
-        formatted_features = [self.__format_feature(f) for f in deepcopy(features)]
+        attachment_infos = self.feature_layer.attachments_info(max_workers=self.max_workers)
+        features = self.feature_layer.iter_features(where='1=1', outFields=query_fields, prefetch=True)
 
-        for feature in formatted_features:
+        for feature in (self.__format_feature(f) for f in features):
             feature_oid = feature['attributes'][self.oid_field]
 
             try:
@@ -136,7 +126,12 @@ class AttachmentRetriever(object):
                     attachment_folders = self.__get_attachment_folders(feature)
 
                     attachment_item = {
+                        'oid': feature_oid,
+                        'id': attachment_id,
                         'name': attachment_name,
+                        'size': attachment_info.get('size'),
+                        'contentType': attachment_info.get('contentType'),
+                        'info': attachment_info,
                         'url': urllib.parse.urljoin(
                             self.feature_layer.url,
                             '/'.join([str(feature_oid), 'attachments', str(attachment_id)]))}
@@ -148,29 +143,212 @@ class AttachmentRetriever(object):
 
         return attachment_data
 
-    def save_attachments(self):
+    def __download_attachment(self, attachment_item, filepath):
         """
-        Save all attachments from self.feature_layer features to disk.
+        Save an attachment to filepath.
+
+        :param attachment_item: <dict> Attachment item from .__get_attachment_data()
+        :param filepath: <str> Target filepath
+        :return: <int> Number of bytes written
+        """
+
+        return self.feature_layer.download_attachment(attachment_item['oid'], attachment_item['id'], filepath)
+
+    def __load_manifest(self):
+        """
+        Return the attachment manifest from self.manifest_path, or an empty manifest.
 
+        :return: <dict> Manifest
+        """
+
+        if self.manifest_path and os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+
+        return {'url': self.feature_layer.url, 'lastEditDate': None, 'attachments': {}}
+
+    def __save_manifest(self, manifest):
+        """
+        Write the attachment manifest to self.manifest_path, replacing the previous manifest atomically.
+
+        :param manifest: <dict> Manifest
         :return: None
         """
 
+        temp_path = self.manifest_path + '.part'
+
+        with open(temp_path, 'w') as f:
+            f.write(json.dumps(manifest))
+
+        os.replace(temp_path, self.manifest_path)
+
+    @staticmethod
+    def __manifest_key(attachment_item):
+        """
+        Return the manifest key for an attachment.
+
+        :param attachment_item: <dict> Attachment item from .__get_attachment_data()
+        :return: <str> Key as 'oid:attachment_id'
+        """
+
+        return '{0}:{1}'.format(attachment_item['oid'], attachment_item['id'])
+
+    def __is_current(self, attachment_item, filepath, manifest):
+        """
+        Check whether an attachment has already been downloaded to filepath and has not changed since.
+
+        Without a manifest, any existing file is considered current.
+
+        :param attachment_item: <dict> Attachment item from .__get_attachment_data()
+        :param filepath: <str> Target filepath
+        :param manifest: <dict> Manifest, optional
+        :return: <bool>
+        """
+
+        if not os.path.exists(filepath):
+            return False
+
+        if manifest is None:
+            return True
+
+        entry = manifest['attachments'].get(self.__manifest_key(attachment_item))
+
+        return (entry is not None and
+                entry['path'] == os.path.relpath(filepath, self.out_path) and
+                entry['name'] == attachment_item['name'] and
+                entry['size'] == attachment_item['size'] and
+                entry['contentType'] == attachment_item['contentType'])
+
+    def __prune(self, manifest, current_keys, current_paths):
+        """
+        Delete downloaded files for attachments that no longer exist, and remove them from the manifest.
+
+        Files at a path that a current attachment is saved to (e.g. another attachment with the same folder and
+        name) are kept.
+
+        :param manifest: <dict> Manifest
+        :param current_keys: <set> Manifest keys of current attachments
+        :param current_paths: <set> Paths (relative to self.out_path) of current attachment files
+        :return: <int> Number of files deleted
+        """
+
+        prune_count = 0
+
+        for key in [k for k in manifest['attachments'] if k not in current_keys]:
+            path = manifest['attachments'].pop(key)['path']
+            filepath = os.path.join(self.out_path, path)
+            if path not in current_paths and os.path.exists(filepath):
+                os.remove(filepath)
+                prune_count += 1
+
+        return prune_count
+
+    def save_attachments(self, prune=False, force=False):
+        """
+        Save all attachments from self.feature_layer features to disk.
+
+        Attachments are downloaded concurrently (up to self.max_workers at a time) over the feature layer session.
+
+        Without a manifest, existing files are not downloaded again. With a manifest (see self.manifest_path),
+        attachments are only downloaded if they are new or their name, size, content type or folder changed, and
+        the run is skipped entirely if the layer lastEditDate has not changed since the previous run. Attachments
+        that would be saved to the same path (same folder and name) are only saved from the first of them.
+
+        :param prune: <bool> Delete files for attachments that were removed from the layer (requires a manifest)
+        :param force: <bool> Check all attachments even if the layer lastEditDate has not changed
+        :return: <dict> Download statistics (files, bytes, seconds, files_per_sec, bytes_per_sec, pruned)
+        """
+
         download_count = 0
+        download_bytes = 0
+        prune_count = 0
+        downloads = []
+        manifest = self.__load_manifest() if self.manifest_path else None
+        last_edit_date = None
+
+        if manifest is not None:
+            editing_info = self.feature_layer.refresh_definition().get('editingInfo') or {}
+            last_edit_date = editing_info.get('lastEditDate')
+
+            if not force and last_edit_date is not None and last_edit_date == manifest['lastEditDate']:
+                logger.debug("Layer has not been edited since last run; skipping attachment download.")
+                return {'files': 0, 'bytes': 0, 'seconds': 0.0, 'files_per_sec': 0.0, 'bytes_per_sec': 0.0,
+                        'pruned': 0}
+
         attachment_data = self.__get_attachment_data()
+        current_keys = set()
+        current_paths = set()
 
         for attachment_folders in attachment_data:
             attachment_path = os.path.join(self.out_path, *attachment_folders)
-
-            if not os.path.isdir(attachment_path):
-                self.__build_attachment_path(attachment_folders)
+            os.makedirs(attachment_path, exist_ok=True)
 
             for attachment_item in attachment_data[attachment_folders]:
                 attachment_name = attachment_item['name']
-                attachment_url = attachment_item['url']
                 attachment_filepath = os.path.join(attachment_path, attachment_name)
-
-                if not os.path.exists(attachment_filepath):
-                    self.__download_attachment(attachment_url, attachment_filepath)
-                    download_count += 1
-
-        logger.debug("Attachment files downloaded: {0}".format(download_count))
+                attachment_relpath = os.path.relpath(attachment_filepath, self.out_path)
+
+                # the first attachment saved to a path is kept; later attachments with the same folder and name are
+                # skipped rather than downloaded over it
+                if attachment_relpath in current_paths:
+                    logger.debug("Skipping attachment {0}; {1} is saved from another attachment."
+                                 .format(self.__manifest_key(attachment_item), attachment_relpath))
+                    continue
+
+                current_keys.add(self.__manifest_key(attachment_item))
+                current_paths.add(attachment_relpath)
+
+                if not self.__is_current(attachment_item, attachment_filepath, manifest):
+                    downloads.append((attachment_item, attachment_filepath))
+
+        start = time.monotonic()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(self.__download_attachment, item, filepath) for item, filepath in downloads]
+                try:
+                    for (item, filepath), future in zip(downloads, futures):
+                        download_bytes += future.result()
+                        download_count += 1
+
+                        if manifest is not None:
+                            key = self.__manifest_key(item)
+                            old_entry = manifest['attachments'].get(key)
+                            # delete the previous copy of an attachment that moved to another folder or name, unless
+                            # a current attachment is saved there
+                            if prune and old_entry and old_entry['path'] not in current_paths:
+                                old_filepath = os.path.join(self.out_path, old_entry['path'])
+                                if os.path.exists(old_filepath):
+                                    os.remove(old_filepath)
+                                    prune_count += 1
+                            manifest['attachments'][key] = {
+                                'path': os.path.relpath(filepath, self.out_path),
+                                'name': item['name'],
+                                'size': item['size'],
+                                'contentType': item['contentType'],
+                                'info': item['info']}
+                finally:
+                    for future in futures:
+                        future.cancel()
+
+            if manifest is not None:
+                if prune:
+                    prune_count += self.__prune(manifest, current_keys, current_paths)
+                manifest['lastEditDate'] = last_edit_date
+
+        finally:
+            if manifest is not None:
+                self.__save_manifest(manifest)
+
+        seconds = time.monotonic() - start
+        stats = {'files': download_count,
+                 'bytes': download_bytes,
+                 'seconds': seconds,
+                 'files_per_sec': download_count / seconds if seconds > 0 else 0.0,
+                 'bytes_per_sec': download_bytes / seconds if seconds > 0 else 0.0,
+                 'pruned': prune_count}
+
+        logger.debug("Attachment files downloaded: {0} ({1} bytes) in {2:.1f}s; {3:.1f} files/sec, {4:.0f} bytes/sec"
+                     .format(download_count, download_bytes, seconds, stats['files_per_sec'], stats['bytes_per_sec']))
+
+        return stats
@@ -1,8 +1,7 @@
 import logging
-from copy import deepcopy
 from agstools.feature_processor import FeatureProcessor
 from agstools.attribute_mapper import AttributeMapper
-from agstools.utility import merge_dicts
+from agstools.utility import merge_dicts, chunk_iterable, oid_where_clauses
 
 logger = logging.getLogger(__name__)
 
@@ -10,17 +9,22 @@ logger = logging.getLogger(__name__)
 class FeatureImporter(object):
     """Import features from source feature layer to target feature layer."""
 
-    def __init__(self, src_feat_layer, tgt_feat_layer, custom_attr_mapper=None):
+    def __init__(self, src_feat_layer, tgt_feat_layer, custom_attr_mapper=None, state_store=None):
         """
         Class initializer.
 
+        With a state_store, the uid and OIDs of each imported feature are recorded, and later imports use the store
+        in place of reading the target layer.
+
         :param src_feat_layer: <feature_layer.FeatureLayer> Source feature layer
         :param tgt_feat_layer: <feature_layer.FeatureLayer> Target feature layer
         :param custom_attr_mapper: <attribute_mapper.AttributeMapper> Source to Target attribute mapper
+        :param state_store: <sync_state_store.SyncStateStore> Persistent import state store, optional
         """
 
         self.src_feat_layer = src_feat_layer
         self.tgt_feat_layer = tgt_feat_layer
+        self.state_store = state_store
         self.cust_attr_mapper = custom_attr_mapper if isinstance(custom_attr_mapper, AttributeMapper) else AttributeMapper()
         self.auto_attr_mapper = self.__build_auto_attr_mapper()
         self.comp_features = {'src': {'index': {}, 'matched': [], 'unmatched': []},
@@ -52,49 +56,73 @@ class FeatureImporter(object):
         self.comp_features = {'src': {'index': {}, 'matched': [], 'unmatched': []},
                               'tgt': {'index': {}, 'matched': [], 'unmatched': []}}
 
-    def __comp_features(self, src_uid_field, tgt_uid_field):
+    def __comp_features(self, src_uid_field, tgt_uid_field, use_store=False):
         """
         Calculate and set feature comparison results.
 
+        Source and target features are streamed with only their uid and OID attributes, without geometry, so
+        comparison results hold only those attributes; full source features are read for adds only (see
+        .__iter_add_features()). With use_store, target features are taken from the state store rather than read from
+        the target layer.
+
         :param src_uid_field: <str> Source unique ID field name
         :param tgt_uid_field: <str> Target unique ID field name
+        :param use_store: <bool> Use the state store in place of the target layer
         :return: None
         """
 
         # remove previously compared features
         self.__reset_comp_features()
 
-        # get current attribute map
-        attr_map = self.__get_attr_map()
-
         # get oid field names
-        src_oid_field = self.src_feat_layer.definition()['objectIdField']
-        tgt_oid_field = self.tgt_feat_layer.definition()['objectIdField']
-
-        # get source feat layer attributes from attr map
-        src_attr = [k for k, v in sorted(attr_map.items())]
-        # get target feat layer attributes from attr map
-        tgt_attr = [v for k, v in sorted(attr_map.items())]
-
-        # get source and target json features
-        src_features = self.src_feat_layer.query_features_batch(where='1=1', outFields=', '.join(src_attr))
-        tgt_features = self.tgt_feat_layer.query_features_batch(where='1=1', outFields=', '.join(tgt_attr))
-
-        # build feature indexes with uid field as key, oid field as value
-        self.comp_features['src']['index'] = {f['attributes'][src_uid_field]: f['attributes'][src_oid_field]
-                                              for f in src_features}
-        self.comp_features['tgt']['index'] = {f['attributes'][tgt_uid_field]: f['attributes'][tgt_oid_field]
-                                              for f in tgt_features}
-
-        # process matched and unmatched features from source and target feature sets
-        self.comp_features['src']['matched'] = [
-            f for f in src_features if f['attributes'][src_uid_field] in self.comp_features['tgt']['index']]
-        self.comp_features['src']['unmatched'] = [
-            f for f in src_features if f['attributes'][src_uid_field] not in self.comp_features['tgt']['index']]
+        src_oid_field = self.src_feat_layer.oid_field
+        tgt_oid_field = self.tgt_feat_layer.oid_field
+
+        src_index = self.comp_features['src']['index']
+        tgt_index = self.comp_features['tgt']['index']
+
+        # stream target uid and oid attributes, building index with uid field as key, oid field as value
+        tgt_features = []
+        if use_store:
+            tgt_stream = ({'attributes': {tgt_uid_field: uid, tgt_oid_field: tgt_oid}}
+                          for uid, (src_oid, tgt_oid, content_hash) in self.state_store.index().items())
+        else:
+            tgt_stream = self.tgt_feat_layer.iter_features(where='1=1',
+                                                           outFields=', '.join([tgt_uid_field, tgt_oid_field]),
+                                                           fidelity='attributes', prefetch=True)
+        for f in tgt_stream:
+            tgt_index[f['attributes'][tgt_uid_field]] = f['attributes'][tgt_oid_field]
+            tgt_features.append(f)
+
+        # stream source uid and oid attributes, building index and splitting matched and unmatched features
+        for f in self.src_feat_layer.iter_features(where='1=1', outFields=', '.join([src_uid_field, src_oid_field]),
+                                                   fidelity='attributes', prefetch=True):
+            src_index[f['attributes'][src_uid_field]] = f['attributes'][src_oid_field]
+            if f['attributes'][src_uid_field] in tgt_index:
+                self.comp_features['src']['matched'].append(f)
+            else:
+                self.comp_features['src']['unmatched'].append(f)
+
+        # process matched and unmatched features from target feature set
         self.comp_features['tgt']['matched'] = [
-            f for f in tgt_features if f['attributes'][tgt_uid_field] in self.comp_features['src']['index']]
+            f for f in tgt_features if f['attributes'][tgt_uid_field] in src_index]
         self.comp_features['tgt']['unmatched'] = [
-            f for f in tgt_features if f['attributes'][tgt_uid_field] not in self.comp_features['src']['index']]
+            f for f in tgt_features if f['attributes'][tgt_uid_field] not in src_index]
+
+    def __iter_add_features(self, add_oids):
+        """
+        Yield full source features to add, one page at a time.
+
+        :param add_oids: <list> Object IDs of source features to add
+        :return: <iterator> JSON features
+        """
+
+        src_attr = [k for k, v in sorted(self.__get_attr_map().items())]
+
+        # select add features with bounded, range-compressed where clauses rather than lists of object IDs
+        for where in oid_where_clauses(self.src_feat_layer.oid_field, add_oids):
+            for f in self.src_feat_layer.iter_features(where=where, outFields=', '.join(src_attr), prefetch=True):
+                yield f
 
     def __get_attr_map(self):
         """
@@ -107,7 +135,7 @@ class FeatureImporter(object):
 
         return merge_dicts(self.auto_attr_mapper.attribute_map, self.cust_attr_mapper.attribute_map)
 
-    def import_features(self, src_uid_field, tgt_uid_field):
+    def import_features(self, src_uid_field, tgt_uid_field, use_apply_edits=False):
         """
         Import features from source to target and delete features from source.
 
@@ -115,45 +143,69 @@ class FeatureImporter(object):
         Feature in target not in source: feature ignored in target
         Feature in source and target: feature ignored in target and deleted from source
 
+        With self.state_store, target adds are always sent with applyEdits so that the new target OIDs are recorded,
+        and the target layer is only read until every target feature has been recorded (normally the first import).
+
         :param src_uid_field: <str> Source unique ID field name
         :param tgt_uid_field: <str> Target unique ID field name
+        :param use_apply_edits: <bool> Send target adds and source deletes using batched applyEdits requests
         :return: None
         """
 
-        self.__comp_features(src_uid_field, tgt_uid_field)
+        # a store only stands in for the target layer once every target feature has been recorded in it
+        use_store = self.state_store is not None and self.state_store.get_mark('seeded', False)
+        self.__comp_features(src_uid_field, tgt_uid_field, use_store)
 
         # get current attribute map
         attr_map = self.__get_attr_map()
 
         # get oid field names
-        src_oid_field = self.src_feat_layer.definition()['objectIdField']
-        tgt_oid_field = self.tgt_feat_layer.definition()['objectIdField']
-
-        # features that have not been imported
-        add_features = deepcopy(self.comp_features['src']['unmatched'])
-        # features that were previously imported but never deleted
-        old_features = deepcopy(self.comp_features['src']['matched'])
-
-        logger.debug("Adding target features ({0}).".format(len(add_features)))
-        if len(add_features) > 0:
-            # get OID values for add features to delete from source
-            add_oids = [f['attributes'][src_oid_field] for f in add_features]
-            add_oids_str = ', '.join([str(o) for o in add_oids])
-            # create a feature processor to modify add features
-            add_fp = FeatureProcessor(add_features)
-            # remap field names
-            add_fp.replace_attributes(attr_map)
-            # remove OID field (auto-generated on insert via REST addFeatures operation)
-            add_fp.remove_attributes([src_oid_field])
-            # add features to target feature layer
-            self.tgt_feat_layer.add_features_batch(features=add_fp.features)
+        src_oid_field = self.src_feat_layer.oid_field
+        tgt_oid_field = self.tgt_feat_layer.oid_field
+
+        # OID values for add features (not yet imported) and old features (previously imported but never deleted)
+        add_oids = [f['attributes'][src_oid_field] for f in self.comp_features['src']['unmatched']]
+        old_oids = [f['attributes'][src_oid_field] for f in self.comp_features['src']['matched']]
+
+        if self.state_store is not None and not use_store:
+            # record every target feature found by reading the target layer, including features no longer in the
+            # source (with no source OID), so that later imports do not add them again
+            self.state_store.upsert((f['attributes'][tgt_uid_field],
+                                     self.comp_features['src']['index'].get(f['attributes'][tgt_uid_field]),
+                                     f['attributes'][tgt_oid_field], None)
+                                    for f in self.comp_features['tgt']['matched'] +
+                                    self.comp_features['tgt']['unmatched'])
+            self.state_store.set_mark('seeded', True)
+
+        logger.debug("Adding target features ({0}).".format(len(add_oids)))
+        if len(add_oids) > 0:
+            # stream full source features, remap field names and remove OID field (auto-generated on insert via REST
+            # addFeatures operation), so that only one chunk of add features is held at a time
+            add_features = FeatureProcessor(self.__iter_add_features(add_oids)).transform(attr_map, [src_oid_field])
+            # add features to target feature layer, one chunk at a time
+            for c in chunk_iterable(add_features, 500):
+                if self.state_store is not None:
+                    result = self.tgt_feat_layer.apply_edits_batch(adds=c)
+                    # record new target OIDs; kept after the source delete so a re-appearing feature is not imported
+                    # twice
+                    self.state_store.upsert((f['attributes'][tgt_uid_field],
+                                             self.comp_features['src']['index'][f['attributes'][tgt_uid_field]],
+                                             r['objectId'], None)
+                                            for f, r in zip(c, result['addResults']) if r.get('success'))
+                elif use_apply_edits:
+                    self.tgt_feat_layer.apply_edits_batch(adds=c)
+                else:
+                    self.tgt_feat_layer.add_features_batch(features=c)
             # delete features from source feature layer
             logger.debug("Deleting source features ({0}).".format(len(add_oids)))
-            self.src_feat_layer.delete_features(objectIds=add_oids_str)
-        if len(old_features) > 0:
-            # get OID values for old features to delete from source
-            old_oids = [f['attributes'][src_oid_field] for f in old_features]
-            old_oids_str = ', '.join([str(o) for o in old_oids])
+            if not use_apply_edits:
+                self.src_feat_layer.delete_features_batch(add_oids, compress=True)
+        if len(old_oids) > 0:
             # delete features from source feature layer
             logger.debug("Deleting stale source features ({0}).".format(len(old_oids)))
-            self.src_feat_layer.delete_features(objectIds=old_oids_str)
+            if not use_apply_edits:
+                self.src_feat_layer.delete_features_batch(old_oids, compress=True)
+
+        if use_apply_edits and (add_oids or old_oids):
+            # delete imported and stale features from source feature layer in combined requests
+            self.src_feat_layer.apply_edits_batch(deletes=add_oids + old_oids)
@@ -1,10 +1,18 @@
 import os
 import json
+import time
 import urllib
 import logging
-import requests
+import threading
 from uuid import uuid4
-from agstools.utility import merge_dicts, chunk_iterable, features_as_json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from agstools.adaptive_batcher import AdaptiveBatcher
+from agstools.fidelity_profile import FidelityProfile
+from agstools.geometry import dequantize_geometry
+from agstools.json_stream import iter_array_items
+from agstools.pbf import decode_query_result
+from agstools.utility import merge_dicts, chunk_iterable, features_as_json, get_session, loads, oid_where_clause
 
 logger = logging.getLogger(__name__)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
@@ -16,103 +24,554 @@ class FeatureLayer(object):
     See ArcGIS REST API documentation for query*, add*, delete*, and update* method parameters.
     """
 
-    def __init__(self, url, token='', certificate=None, out_sr='', out_path=''):
+    def __init__(self, url, token='', certificate=None, out_sr='', out_path='', pool_size=10, session=None,
+                 definition_ttl=300, timeout=None, query_format='json', token_provider=None):
         """
         Class initializer.
 
+        Requests are sent through a pooled, keep-alive session. By default the session is shared with every other
+        FeatureLayer on the same host (and certificate); pass session to supply one explicitly.
+
+        With a token_provider, each request uses the provider's current token in place of token, and a request
+        rejected for an invalid or expired token (error 498 or 499) is retried once with a new token.
+
         :param url: <str> Feature service layer REST endpoint URL
         :param token: <str> ArcGIS Server or Portal authentication token
         :param certificate: <str> Path to certificate file (.pem)
         :param out_sr: <str> EPSG spatial reference WKID
         :param out_path: <str> Path to workspace for data storage
+        :param pool_size: <int> Maximum number of pooled connections to the host
+        :param session: <requests.Session> Session to use for all requests, optional
+        :param definition_ttl: <int> Seconds to cache the layer definition; 0 disables caching
+        :param timeout: <float> Seconds to wait for a server response, optional
+        :param query_format: <str> Default query response format; one of 'json' or 'pbf' (see .query())
+        :param token_provider: <token_provider.TokenProvider> Token provider, optional
         """
 
         self.url = url
         self.token = token
         self.certificate = certificate
+        self.session = session if session is not None else get_session(url, certificate, pool_size)
         self.params = {'f': 'json', 'token': self.token, 'outSR': out_sr}
         self.uid = str(uuid4())
         self.json_path = os.path.join(out_path, self.uid + '.json') if out_path != '' else ''
+        self.definition_ttl = definition_ttl
+        self.timeout = timeout
+        self.query_format = query_format
+        self.token_provider = token_provider
+        self.__definition = None
+        self.__definition_time = None
+        self.__definition_lock = threading.Lock()
+        self.__field_types = {}
+        self.__date_fields = frozenset()
+
+    def __request_token(self):
+        """
+        Get the token to send with a request.
+
+        :return: <str> Token
+        """
+
+        return self.token_provider.get_token() if self.token_provider is not None else self.token
+
+    @staticmethod
+    def __without_token(params):
+        """
+        Return request parameters without an explicit token, so that a retry uses a new token from the provider.
+
+        :param params: <dict> Request parameters
+        :return: <dict> Request parameters
+        """
+
+        return {k: v for k, v in params.items() if k != 'token'}
 
-    def __make_request(self, url, method, params={}):
+    def __token_rejected(self, status_code, data=None):
+        """
+        Check whether a response rejected the request token (error 498 invalid token or 499 token required) and a
+        token provider can supply a new one.
+
+        :param status_code: <int> HTTP status code
+        :param data: <dict> Parsed response body, optional
+        :return: <bool>
+        """
+
+        if self.token_provider is None:
+            return False
+
+        if status_code in (498, 499):
+            return True
+
+        error = data.get('error') if isinstance(data, dict) else None
+        return isinstance(error, dict) and error.get('code') in (498, 499)
+
+    def __make_request(self, url, method, params={}, stream=False, retry_token=True):
         """
         Return json result of request to service endpoint
 
+        The response body is parsed once; response.json() returns the parsed body without parsing it again. With
+        stream, the body is left unread for incremental decoding and service errors are not checked. A request
+        rejected for its token is retried once with a new token from self.token_provider.
+
         :param url: <str> URL for request
         :param method: <str> One of 'GET' or 'POST'
         :param params: <str> URL query string parameters
+        :param stream: <bool> Return without reading the response body
+        :param retry_token: <bool> Retry with a new token if the token is rejected
         :return: <requests.Response> Request response
         """
 
         response = None
         # merge passed params with class default params; passed params override
         request_params = merge_dicts(self.params, params)
+        if self.token_provider is not None and not params.get('token'):
+            request_params['token'] = self.__request_token()
 
-        with requests.session() as s:
-
-            if self.certificate is not None:
-                s.verify = self.certificate
-
-            if method.lower() == 'get':
-                response = s.get(url=url, params=request_params)
-            elif method.lower() == 'post':
-                response = s.post(url=url, data=request_params)
+        if method.lower() == 'get':
+            response = self.session.get(url=url, params=request_params, timeout=self.timeout, stream=stream)
+        elif method.lower() == 'post':
+            response = self.session.post(url=url, data=request_params, timeout=self.timeout, stream=stream)
 
         # check to see if an unsupported http method type was used
         if response is None:
             raise Exception('Request URL: {0} | Method type {1} not supported'.format(url, method))
 
-        # check for an error in the service response
-        if response.json().get('error'):
-            raise Exception('Request URL: {0} | Service error: {1}'.format(url, response.json().get('error')))
+        if retry_token and self.__token_rejected(response.status_code):
+            response.close()
+            self.token_provider.invalidate(request_params['token'])
+            return self.__make_request(url, method, self.__without_token(params), stream, retry_token=False)
+
+        # check for an http error status (e.g. 413 request too large, 504 gateway timeout)
+        response.raise_for_status()
+
+        if stream:
+            return response
+
+        # parse the response body once and reuse it for subsequent response.json() calls; protocol buffer query
+        # results are decoded to their ESRI JSON equivalent (service errors are still returned as JSON)
+        if request_params.get('f') == 'pbf' and not response.content.lstrip().startswith(b'{'):
+            data = decode_query_result(response.content)
+        else:
+            data = loads(response.content)
+        response.json = lambda **kwargs: data
+
+        # check for an error in the service response; retry once with a new token if the token was rejected
+        if isinstance(data, dict) and data.get('error'):
+            if retry_token and self.__token_rejected(response.status_code, data):
+                logger.debug("Token rejected; retrying with a new token.")
+                self.token_provider.invalidate(request_params['token'])
+                return self.__make_request(url, method, self.__without_token(params), stream, retry_token=False)
+            raise Exception('Request URL: {0} | Service error: {1}'.format(url, data.get('error')))
 
         return response
 
-    def attachments_info(self):
+    def __query_attachments(self, oids):
+        """
+        Get attachment infos for a list of object IDs using the layer queryAttachments operation.
+
+        If the service reports that the result was truncated, the object IDs are split and requested again.
+
+        :param oids: <list> Object IDs
+        :return: <dict> Attachment infos keyed by object ID
+        """
+
+        url = urllib.parse.urljoin(self.url, 'queryAttachments')
+        response = self.__make_request(url, 'post', {'objectIds': ','.join([str(o) for o in oids])}).json()
+
+        if response.get('exceededTransferLimit') and len(oids) > 1:
+            result = self.__query_attachments(oids[:len(oids) // 2])
+            result.update(self.__query_attachments(oids[len(oids) // 2:]))
+            return result
+
+        return {g['parentObjectId']: g['attachmentInfos']
+                for g in response.get('attachmentGroups') or [] if len(g['attachmentInfos']) > 0}
+
+    def __feature_attachments(self, oid):
+        """
+        Get attachment infos for a single feature.
+
+        :param oid: <int> Object ID
+        :return: <dict> Attachment infos keyed by object ID
+        """
+
+        attachments_url = urllib.parse.urljoin(self.url, '{0}/attachments'.format(oid))
+        attachments_infoitems = self.__make_request(attachments_url, 'get').json()['attachmentInfos']
+
+        return {oid: attachments_infoitems} if len(attachments_infoitems) > 0 else {}
+
+    def supports_query_attachments(self):
+        """
+        Check whether the layer supports the queryAttachments operation.
+
+        :return: <bool>
+        """
+
+        capabilities = self.definition().get('advancedQueryCapabilities') or {}
+        return bool(capabilities.get('supportsQueryAttachments'))
+
+    def attachments_info(self, where='1=1', n=100, max_workers=None):
         """
         Get attachments info for feature layer.
 
+        Attachment infos are requested for n features at a time with the queryAttachments operation, or one feature
+        at a time if the service does not support it. Up to max_workers requests are made concurrently.
+
+        :param where: <str> ESRI where clause limiting the features included
+        :param n: <int> Number of features per queryAttachments request
+        :param max_workers: <int> Maximum number of concurrent requests, optional
         :return: <dict> Attachment info
         """
 
         attachments_info = {}
 
-        oid_response = self.query(where='1=1', returnIdsOnly=True).json()
-        objectids = oid_response['objectIds']
+        if self.definition().get('hasAttachments') is False:
+            return attachments_info
+
+        oid_response = self.query(where=where, returnIdsOnly=True).json()
+        objectids = sorted(oid_response['objectIds'] or [])
+
+        if self.supports_query_attachments():
+            tasks = [(self.__query_attachments, c) for c in chunk_iterable(objectids, n)]
+        else:
+            logger.debug("Layer does not support queryAttachments; requesting attachments per feature.")
+            tasks = [(self.__feature_attachments, oid) for oid in objectids]
+
+        if not max_workers or max_workers < 2:
+            for func, arg in tasks:
+                attachments_info.update(func(arg))
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(func, arg) for func, arg in tasks]
+                try:
+                    for future in futures:
+                        attachments_info.update(future.result())
+                finally:
+                    for future in futures:
+                        future.cancel()
 
-        for oid in objectids:
-            attachments_url = urllib.parse.urljoin(self.url, '{0}/attachments'.format(oid))
-            attachments_response = self.__make_request(attachments_url, 'get')
-            attachments_data = attachments_response.json()
-            attachments_infoitems = attachments_data['attachmentInfos']
+        return attachments_info
 
-            if len(attachments_infoitems) > 0:
-                attachments_info[oid] = attachments_infoitems
+    def __attachment_response(self, url, retry_token=True):
+        """
+        Return a streamed attachment response, checking for an error returned as json in place of the attachment.
 
-        return attachments_info
+        A request rejected for its token is retried once with a new token from self.token_provider.
+
+        :param url: <str> Attachment URL
+        :param retry_token: <bool> Retry with a new token if the token is rejected
+        :return: <tuple> Response, and the response body if it is json (otherwise None, with the body unread)
+        """
+
+        token = self.__request_token()
+        params = {'token': token} if token else {}
+        response = self.session.get(url, params=params, timeout=self.timeout, stream=True)
+        content = None
+
+        try:
+            data = None
+            if response.headers.get('Content-Type', '').startswith('application/json'):
+                content = response.content
+                data = loads(content)
+
+            if retry_token and self.__token_rejected(response.status_code, data):
+                response.close()
+                self.token_provider.invalidate(token)
+                return self.__attachment_response(url, retry_token=False)
+
+            response.raise_for_status()
+
+            if isinstance(data, dict) and data.get('error'):
+                raise Exception('Request URL: {0} | Service error: {1}'.format(url, data.get('error')))
+        except BaseException:
+            response.close()
+            raise
+
+        return response, content
+
+    def download_attachment(self, oid, attachment_id, filepath, chunk_size=65536):
+        """
+        Save a feature attachment to filepath.
+
+        The attachment is streamed to a temporary file in the target folder, which is renamed to filepath only
+        once the download completes, so an interrupted download never leaves a partial file at filepath. Each
+        download has its own temporary file, so concurrent downloads to the same filepath do not collide.
+
+        :param oid: <int> Feature object ID
+        :param attachment_id: <int> Attachment ID
+        :param filepath: <str> Target filepath
+        :param chunk_size: <int> Number of bytes to read at a time
+        :return: <int> Number of bytes written
+        """
+
+        url = urllib.parse.urljoin(self.url, '{0}/attachments/{1}'.format(oid, attachment_id))
+        size = 0
+
+        # a unique name opened exclusively, rather than tempfile.mkstemp (which is owner-only), so the file gets the
+        # usual permissions
+        temp_path = '{0}.{1}.part'.format(filepath, uuid4().hex)
+
+        try:
+            with open(temp_path, 'xb') as f:
+                response, content = self.__attachment_response(url)
+                with response:
+                    # a json attachment has already been read while checking for an error in the service response
+                    chunks = [content] if content is not None else response.iter_content(chunk_size=chunk_size)
+
+                    for chunk in chunks:
+                        f.write(chunk)
+                        size += len(chunk)
+            os.replace(temp_path, filepath)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return size
 
-    def definition(self):
+    def definition(self, refresh=False):
         """
         Get json feature service definition.
 
+        The definition is cached for self.definition_ttl seconds after it is retrieved.
+
+        :param refresh: <bool> Bypass the cache and retrieve the definition from the service
         :return: <dict> JSON feature service layer definition
         """
 
-        url = urllib.parse.urljoin(self.url, '')
-        return self.__make_request(url, 'get', params={}).json()
+        with self.__definition_lock:
+            expired = (self.__definition is None or
+                       time.monotonic() - self.__definition_time >= self.definition_ttl)
+
+            if refresh or expired:
+                url = urllib.parse.urljoin(self.url, '')
+                definition = self.__make_request(url, 'get', params={}).json()
+                fields = definition.get('fields') or []
+
+                self.__field_types = {f['name']: f['type'] for f in fields}
+                self.__date_fields = frozenset(f['name'] for f in fields if f['type'] == 'esriFieldTypeDate')
+                self.__definition = definition
+                self.__definition_time = time.monotonic()
 
-    def query(self, **params):
+            return self.__definition
+
+    def refresh_definition(self):
+        """
+        Discard the cached layer definition and retrieve it from the service.
+
+        :return: <dict> JSON feature service layer definition
+        """
+
+        return self.definition(refresh=True)
+
+    @property
+    def oid_field(self):
+        """
+        Name of the layer object ID field (defaults to 'OBJECTID' when not reported by the service).
+
+        :return: <str> Field name
+        """
+
+        return self.definition().get('objectIdField', 'OBJECTID')
+
+    @property
+    def field_types(self):
+        """
+        Map of layer field names to ESRI field types.
+
+        :return: <dict> Field types
+        """
+
+        self.definition()
+        return self.__field_types
+
+    @property
+    def date_fields(self):
+        """
+        Set of layer date field names.
+
+        :return: <frozenset> Field names
+        """
+
+        self.definition()
+        return self.__date_fields
+
+    @property
+    def layer_id(self):
+        """
+        Layer ID within the feature service, from the layer URL.
+
+        :return: <int> Layer ID
+        """
+
+        return int(self.url.rstrip('/').rsplit('/', 1)[-1])
+
+    @property
+    def service_url(self):
+        """
+        Feature service REST endpoint URL, from the layer URL.
+
+        :return: <str> Feature service URL
+        """
+
+        return self.url.rstrip('/').rsplit('/', 1)[0] + '/'
+
+    def service_definition(self):
+        """
+        Get json feature service definition (for the service containing this layer).
+
+        :return: <dict> JSON feature service definition
+        """
+
+        return self.__make_request(self.service_url, 'get', params={}).json()
+
+    def supports_change_tracking(self):
+        """
+        Check whether the feature service supports the extractChanges operation for this layer.
+
+        :return: <bool>
+        """
+
+        capabilities = self.service_definition().get('capabilities') or ''
+        return 'ChangeTracking' in [c.strip() for c in capabilities.split(',')]
+
+    def server_gen(self):
+        """
+        Get the current change tracking server generation for this layer.
+
+        :return: <int> Server generation
+        """
+
+        change_tracking_info = self.service_definition().get('changeTrackingInfo') or {}
+
+        for layer_server_gen in change_tracking_info.get('layerServerGens') or []:
+            if layer_server_gen['id'] == self.layer_id:
+                return layer_server_gen['serverGen']
+
+        raise Exception('Service {0} reports no server generation for layer {1}.'.format(self.service_url,
+                                                                                           self.layer_id))
+
+    def extract_changes(self, server_gen, **params):
+        """
+        Get the object IDs of features added, updated and deleted since a change tracking server generation.
+
+        https://developers.arcgis.com/rest/services-reference/extract-changes-feature-service-.htm
+
+        :param server_gen: <int> Server generation from a previous call (or .server_gen())
+        :param params: <dict> Feature service extractChanges operation supported parameters
+        :return: <tuple> Dict of 'adds', 'updates' and 'deletes' object ID lists, new server generation
+        """
+
+        url = urllib.parse.urljoin(self.service_url, 'extractChanges')
+        request_params = merge_dicts({'layers': json.dumps([self.layer_id]),
+                                      'layerServerGens': json.dumps([{'id': self.layer_id, 'serverGen': server_gen}]),
+                                      'returnInserts': True,
+                                      'returnUpdates': True,
+                                      'returnDeletes': True,
+                                      'returnIdsOnly': True,
+                                      'dataFormat': 'json'}, params)
+        response = self.__make_request(url, 'post', request_params).json()
+
+        changes = {'adds': [], 'updates': [], 'deletes': []}
+        for layer_edits in response.get('edits') or []:
+            if layer_edits['id'] == self.layer_id:
+                object_ids = layer_edits.get('objectIds') or {}
+                for k in changes:
+                    changes[k] += object_ids.get(k) or []
+
+        new_server_gen = server_gen
+        for layer_server_gen in response.get('layerServerGens') or []:
+            if layer_server_gen['id'] == self.layer_id:
+                new_server_gen = layer_server_gen['serverGen']
+
+        return changes, new_server_gen
+
+    def supports_pbf(self):
+        """
+        Check whether the layer can return query results in protocol buffer format (f=pbf).
+
+        :return: <bool>
+        """
+
+        formats = self.definition().get('supportedQueryFormats') or ''
+        return 'PBF' in [f.strip().upper() for f in formats.split(',')]
+
+    def __uses_pbf(self, params):
+        """
+        Check whether a query will be requested in protocol buffer format.
+
+        :param params: <dict> Feature service query operation supported parameters
+        :return: <bool>
+        """
+
+        return params.get('f', self.query_format) == 'pbf' and self.supports_pbf()
+
+    def __fidelity_params(self, fidelity, params):
+        """
+        Return query parameters with the parameters of a fidelity profile added; params override the profile.
+
+        :param fidelity: <fidelity_profile.FidelityProfile|str> Fidelity profile, or the name of one, optional
+        :param params: <dict> Feature service query operation supported parameters
+        :return: <dict> Feature service query operation supported parameters
+        """
+
+        if fidelity is None:
+            return params
+
+        if isinstance(fidelity, str):
+            fidelity = FidelityProfile.named(fidelity)
+
+        return merge_dicts(fidelity.params(self), params)
+
+    def __query_request(self, method, params, stream=False):
+        """
+        Send a query request in the requested response format.
+
+        The format is params['f'] if given, otherwise self.query_format. Protocol buffer format is only requested if
+        the layer advertises support for it (and never when streaming); JSON is requested instead.
+
+        :param method: <str> One of 'GET' or 'POST'
+        :param params: <dict> Feature service query operation supported parameters
+        :param stream: <bool> Return without reading the response body
+        :return: <requests.Response> Request response object
+        """
+
+        url = urllib.parse.urljoin(self.url, 'query')
+        query_format = params.get('f', self.query_format)
+
+        if query_format == 'pbf' and (stream or not self.supports_pbf()):
+            query_format = 'json'
+
+        response = self.__make_request(url, method, merge_dicts(params, {'f': query_format}), stream)
+
+        # quantized JSON results hold integer coordinates relative to a transform; return map coordinates instead
+        # (protocol buffer results are dequantized when decoded)
+        if not stream and params.get('quantizationParameters'):
+            data = response.json()
+            transform = data.pop('transform', None) if isinstance(data, dict) else None
+            if transform:
+                for f in data.get('features') or []:
+                    if f.get('geometry'):
+                        f['geometry'] = dequantize_geometry(f['geometry'], transform)
+
+        return response
+
+    def query(self, fidelity=None, **params):
         """
         Get query result from feature layer.
 
         https://developers.arcgis.com/rest/services-reference/query-feature-service-.htm
 
+        With f='pbf' (or query_format='pbf'), results are transferred in protocol buffer format, when the layer
+        supports it, and decoded so that response.json() returns the same ESRI JSON result as f='json'.
+
+        A fidelity profile limits the geometry returned (see fidelity_profile.FidelityProfile); parameters given
+        explicitly override the profile. Quantized geometries are returned in map coordinates.
+
+        :param fidelity: <fidelity_profile.FidelityProfile|str> Fidelity profile, or the name of one, optional
         :param params: <dict> Feature service query operation supported parameters
         :return: <requests.Response> Request response object
         """
 
-        url = urllib.parse.urljoin(self.url, 'query')
-        return self.__make_request(url, 'get', params)
+        return self.__query_request('get', self.__fidelity_params(fidelity, params))
 
     def query_features(self, **params):
         """
@@ -126,33 +585,350 @@ class FeatureLayer(object):
 
         return self.query(**params).json()['features']
 
-    def query_features_batch(self, n=500, **params):
+    def query_page(self, **params):
         """
-        Get JSON features from feature layer query in batches of size n.
+        Get JSON features for a single page of a paged query (see .page_params()).
 
-        This method should typically be used instead of .query_features()
+        Pages are requested with POST so that long objectIds lists are not limited by URL length.
 
-        :param n: <int> Batch size
         :param params: <dict> Feature service query operation supported parameters
         :return: <list> List of JSON features
         """
 
-        result = []
+        return self.__query_request('post', params).json()['features']
+
+    def __stream_page(self, params, retry_token=True):
+        """
+        Yield JSON features for a single page of a paged query, decoding them from the response as it downloads.
+
+        A page rejected for its token is retried once with a new token from self.token_provider.
+
+        :param params: <dict> Feature service query operation supported parameters
+        :param retry_token: <bool> Retry with a new token if the token is rejected
+        :return: <iterator> JSON features
+        """
+
+        url = urllib.parse.urljoin(self.url, 'query')
+        members = {}
+        count = 0
+
+        # send an explicit token so that the same token can be invalidated if it is rejected
+        if self.token_provider is not None:
+            params = merge_dicts(params, {'token': self.__request_token()})
+
+        with self.__query_request('post', params, stream=True) as response:
+            for feature in iter_array_items(response.iter_content(chunk_size=65536), 'features', members):
+                count += 1
+                yield feature
+
+        # check for an error in the service response
+        if members.get('error'):
+            if retry_token and count == 0 and self.__token_rejected(response.status_code, members):
+                self.token_provider.invalidate(params['token'])
+                for feature in self.__stream_page(self.__without_token(params), retry_token=False):
+                    yield feature
+                return
+            raise Exception('Request URL: {0} | Service error: {1}'.format(url, members.get('error')))
+
+    def __fetch_pages(self, page_params, max_workers=None):
+        """
+        Yield JSON feature lists for each set of page query parameters, in order.
+
+        When max_workers is greater than 1, up to max_workers pages are requested concurrently. If a page request
+        fails, pages that have not started are cancelled and the error is raised.
+
+        :param page_params: <iter> Query parameters for each page
+        :param max_workers: <int> Maximum number of concurrent page requests
+        :return: <iterator> Lists of JSON features
+        """
+
+        if not max_workers or max_workers < 2:
+            for p in page_params:
+                yield self.query_page(**p)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = deque()
+
+        try:
+            for p in page_params:
+                pending.append(executor.submit(self.query_page, **p))
+                if len(pending) >= max_workers:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def max_record_count(self, result_type=None):
+        """
+        Get the maximum number of features the service returns for a single query.
+
+        :param result_type: <str> Query resultType parameter; 'standard' uses the standardMaxRecordCount limit
+        :return: <int> Maximum record count
+        """
+
+        definition = self.definition()
+        max_records = definition.get('maxRecordCount') or 1000
+
+        if result_type == 'standard':
+            max_records = definition.get('standardMaxRecordCount') or max_records
+
+        return max_records
+
+    def supports_pagination(self):
+        """
+        Check whether the layer supports resultOffset / resultRecordCount query paging.
+
+        :return: <bool>
+        """
+
+        capabilities = self.definition().get('advancedQueryCapabilities') or {}
+        return bool(capabilities.get('supportsPagination'))
+
+    def __pagination_strategy(self, pagination, params):
+        """
+        Return the pagination strategy to use for a query.
+
+        'auto' pages by resultOffset when the caller requested a custom sort order (and the layer supports it),
+        otherwise by exact lists of object IDs. Layers without an object ID field fall back to resultOffset.
+
+        :param pagination: <str> One of 'auto', 'objectIds', 'offset' or 'range'
+        :param params: <dict> Feature service query operation supported parameters
+        :return: <str> One of 'objectIds', 'offset' or 'range'
+        """
+
+        if pagination not in ('auto', 'objectIds', 'offset', 'range'):
+            raise Exception('Pagination type {0} not recognized.'.format(pagination))
+
+        if pagination == 'offset' and not self.supports_pagination():
+            raise Exception('Layer {0} does not support resultOffset pagination.'.format(self.url))
+
+        if pagination != 'auto':
+            return pagination
+
+        if params.get('orderByFields') and self.supports_pagination():
+            return 'offset'
+        if 'objectIdField' in self.definition():
+            return 'objectIds'
+        if self.supports_pagination():
+            return 'offset'
+
+        raise Exception('Layer {0} has no object ID field and does not support pagination.'.format(self.url))
+
+    def __paging_plan(self, strategy, params):
+        """
+        Return the number of features a paged query will return, and their sorted object IDs when needed.
+
+        :param strategy: <str> One of 'objectIds', 'offset' or 'range'
+        :param params: <dict> Feature service query operation supported parameters
+        :return: <tuple> Feature count, object ID field name, sorted object IDs
+        """
 
-        oid_response = self.query(returnIdsOnly=True, **params).json()
+        # use POST so that long where clauses and objectIds lists are not limited by URL length
+        if strategy == 'offset':
+            count = self.__query_request('post', merge_dicts(params, {'returnCountOnly': True})).json()['count']
+            return count, self.oid_field, None
 
-        if oid_response['objectIds']:
+        oid_response = self.__query_request('post', merge_dicts(params, {'returnIdsOnly': True})).json()
+        oid_values = sorted(oid_response['objectIds'] or [])
 
-            oid_field = oid_response['objectIdFieldName']
-            oid_values = sorted(oid_response['objectIds'])
-            oid_chunks = [c for c in chunk_iterable(oid_values, n)]
+        return len(oid_values), oid_response.get('objectIdFieldName'), oid_values
 
-            for c in oid_chunks:
+    def __page(self, strategy, params, plan, start, size):
+        """
+        Return query parameters for the page of features from position start to start + size.
+
+        :param strategy: <str> One of 'objectIds', 'offset' or 'range'
+        :param params: <dict> Feature service query operation supported parameters
+        :param plan: <tuple> Paging plan from .__paging_plan()
+        :param start: <int> Position of the first feature in the page
+        :param size: <int> Number of features in the page
+        :return: <dict> Query parameters
+        """
+
+        count, oid_field, oid_values = plan
+
+        if strategy == 'offset':
+            order_by = params.get('orderByFields') or '{0} ASC'.format(oid_field)
+            return merge_dicts(params, {'orderByFields': order_by,
+                                        'resultOffset': start,
+                                        'resultRecordCount': size})
+
+        c = oid_values[start:start + size]
+
+        if strategy == 'objectIds':
+            return merge_dicts(params, {'objectIds': ','.join([str(o) for o in c])})
+
+        where_clause = '{0} >= {1} AND {0} <= {2}'.format(oid_field, c[0], c[-1])
+        if params.get('where'):
+            where_clause = '({0}) AND {1}'.format(params['where'], where_clause)
+        return merge_dicts(params, {'where': where_clause})
+
+    def page_params(self, n=None, pagination='auto', fidelity=None, **params):
+        """
+        Yield query parameters for each page of a paged query.
+
+        See .iter_pages() for batch sizing and pagination strategies. Each page can be requested with .query_page().
+
+        :param n: <int> Batch size, optional
+        :param pagination: <str> Pagination strategy; one of 'auto', 'objectIds', 'offset' or 'range'
+        :param fidelity: <fidelity_profile.FidelityProfile|str> Fidelity profile, or the name of one, optional
+        :param params: <dict> Feature service query operation supported parameters
+        :return: <iterator> Query parameters for each page
+        """
+
+        params = self.__fidelity_params(fidelity, params)
+        max_records = self.max_record_count(params.get('resultType'))
+        page_size = min(n, max_records) if n else max_records
+        strategy = self.__pagination_strategy(pagination, params)
+        plan = self.__paging_plan(strategy, params)
+
+        for start in range(0, plan[0], page_size):
+            yield self.__page(strategy, params, plan, start, page_size)
+
+    def __adaptive_pages(self, batcher, pagination, params):
+        """
+        Yield JSON feature lists for a paged query, sizing each page with an adaptive batcher.
+
+        Pages are fetched one at a time. A page that times out or is too large is retried at a smaller size.
+
+        :param batcher: <adaptive_batcher.AdaptiveBatcher> Batch sizer
+        :param pagination: <str> Pagination strategy; one of 'auto', 'objectIds', 'offset' or 'range'
+        :param params: <dict> Feature service query operation supported parameters
+        :return: <iterator> Lists of JSON features
+        """
+
+        max_records = self.max_record_count(params.get('resultType'))
+        strategy = self.__pagination_strategy(pagination, params)
+        plan = self.__paging_plan(strategy, params)
+        start = 0
+
+        while start < plan[0]:
+            size = min(batcher.size, max_records)
+            page_params = self.__page(strategy, params, plan, start, size)
+            request_start = time.monotonic()
+
+            try:
+                response = self.__query_request('post', page_params)
+            except Exception as e:
+                reason = batcher.back_off_reason(e)
+                if reason and batcher.back_off(reason):
+                    continue
+                raise
+
+            features = response.json()['features']
+            batcher.record(len(features), time.monotonic() - request_start, response_bytes=len(response.content))
+            start += size
+
+            yield features
+
+    def iter_pages(self, n=None, max_workers=None, prefetch=False, pagination='auto', fidelity=None, **params):
+        """
+        Yield JSON features from feature layer query one batch of size n at a time.
+
+        Only the batch being consumed (plus any batches being fetched ahead of it) is held in memory. With prefetch,
+        the next batch is requested while the current one is being consumed.
+
+        Batches are sized to the service maxRecordCount (or standardMaxRecordCount for resultType='standard') unless
+        a smaller n is given. The pagination strategy is one of:
 
-                where_clause = '{0} >= {1} AND {0} <= {2}'.format(oid_field, min(c), max(c))
-                params['where'] = where_clause
-                features = self.query_features(**params)
-                result += features
+        'objectIds' - query object IDs once, then request exact lists of object IDs per batch
+        'offset' - request batches with resultOffset / resultRecordCount (requires supportsPagination)
+        'range' - query object IDs once, then request object ID ranges combined with the where clause
+        'auto' - choose based on layer capabilities and query parameters
+
+        Pass an AdaptiveBatcher (or 'auto') as n to size each batch from observed response times and sizes;
+        adaptive batches are fetched one at a time.
+
+        A fidelity profile limits the geometry returned (see .query()).
+
+        :param n: <int|AdaptiveBatcher|str> Batch size, optional
+        :param max_workers: <int> Maximum number of concurrent batch requests, optional
+        :param prefetch: <bool> Fetch the next batch while the current batch is consumed
+        :param pagination: <str> Pagination strategy; one of 'auto', 'objectIds', 'offset' or 'range'
+        :param fidelity: <fidelity_profile.FidelityProfile|str> Fidelity profile, or the name of one, optional
+        :param params: <dict> Feature service query operation supported parameters
+        :return: <iterator> Lists of JSON features
+        """
+
+        params = self.__fidelity_params(fidelity, params)
+
+        if n == 'auto':
+            n = AdaptiveBatcher(size=self.max_record_count(params.get('resultType')))
+
+        if isinstance(n, AdaptiveBatcher):
+            pages = self.__adaptive_pages(n, pagination, params)
+        else:
+            if prefetch:
+                max_workers = max(max_workers or 1, 2)
+            pages = self.__fetch_pages(self.page_params(n, pagination, **params), max_workers)
+
+        for features in pages:
+            yield features
+
+    def iter_features(self, n=None, max_workers=None, prefetch=False, pagination='auto', stream=False, fidelity=None,
+                      **params):
+        """
+        Yield JSON features from feature layer query one feature at a time, fetching in batches of size n.
+
+        See .iter_pages() for batch sizing and pagination strategies. With stream, each batch is decoded feature by
+        feature as it downloads, so a whole batch is never held in memory; streamed batches are fetched one at a time.
+        Stream is ignored for protocol buffer and quantized queries (see .query()).
+
+        :param n: <int|AdaptiveBatcher|str> Batch size, optional
+        :param max_workers: <int> Maximum number of concurrent batch requests, optional
+        :param prefetch: <bool> Fetch the next batch while the current batch is consumed
+        :param pagination: <str> Pagination strategy; one of 'auto', 'objectIds', 'offset' or 'range'
+        :param stream: <bool> Decode features incrementally from each response
+        :param fidelity: <fidelity_profile.FidelityProfile|str> Fidelity profile, or the name of one, optional
+        :param params: <dict> Feature service query operation supported parameters
+        :return: <iterator> JSON features
+        """
+
+        params = self.__fidelity_params(fidelity, params)
+
+        # protocol buffer responses are smaller than JSON but cannot be decoded incrementally; they take precedence.
+        # Quantized responses need their transform, which follows the features, before any geometry can be decoded
+        if stream and not isinstance(n, (AdaptiveBatcher, str)) and not self.__uses_pbf(params) \
+                and not params.get('quantizationParameters'):
+            for page_params in self.page_params(n, pagination, **params):
+                for feature in self.__stream_page(page_params):
+                    yield feature
+            return
+
+        for features in self.iter_pages(n, max_workers, prefetch, pagination, **params):
+            for feature in features:
+                yield feature
+
+    def query_features_batch(self, n=None, max_workers=None, pagination='auto', fidelity=None, **params):
+        """
+        Get JSON features from feature layer query in batches of size n.
+
+        This method should typically be used instead of .query_features(). Use .iter_features() or .iter_pages()
+        to process large layers without holding every feature in memory. See .iter_pages() for batch sizing and
+        pagination strategies.
+
+        Batches are fetched one at a time unless max_workers is greater than 1, in which case up to max_workers
+        batches are fetched concurrently. Features are always returned in batch order. A fidelity profile limits the
+        geometry returned (see .query()).
+
+        :param n: <int|AdaptiveBatcher|str> Batch size, optional
+        :param max_workers: <int> Maximum number of concurrent batch requests, optional
+        :param pagination: <str> Pagination strategy; one of 'auto', 'objectIds', 'offset' or 'range'
+        :param fidelity: <fidelity_profile.FidelityProfile|str> Fidelity profile, or the name of one, optional
+        :param params: <dict> Feature service query operation supported parameters
+        :return: <list> List of JSON features
+        """
+
+        result = []
+
+        for features in self.iter_pages(n, max_workers, pagination=pagination, fidelity=fidelity, **params):
+            result += features
 
         return result
 
@@ -171,27 +947,66 @@ class FeatureLayer(object):
         url = urllib.parse.urljoin(self.url, 'addFeatures')
         return self.__make_request(url, 'post', params)
 
-    def add_features_batch(self, n=500, **params):
+    def __edit_features_batch(self, edit_method, n, retry_timeouts, params):
         """
-        Add JSON features to feature layer in batches of size n.
+        Send JSON features to an edit operation in batches of size n.
 
-        This method should typically be used instead of .add_features()
+        When n is an AdaptiveBatcher (or 'auto'), batch size follows observed response times and payload sizes,
+        and a batch that is too large (or times out, if retry_timeouts) is retried at a smaller size.
 
-        :param n: <int> Batch size
-        :param params: <dict> Feature service add operation supported parameters
+        :param edit_method: <callable> Edit operation method, e.g. self.add_features
+        :param n: <int|AdaptiveBatcher|str> Batch size
+        :param retry_timeouts: <bool> Retry timed out batches; only safe for idempotent operations
+        :param params: <dict> Feature service edit operation supported parameters
         :return: <requests.Response> Request response object (for last request)
         """
 
+        result = None
         features = params.get('features')
-        feature_chunks = [c for c in chunk_iterable(features, n)]
+        batcher = AdaptiveBatcher() if n == 'auto' else n
+        start = 0
 
-        for c in feature_chunks:
+        if not isinstance(batcher, AdaptiveBatcher):
+            for c in chunk_iterable(features, n):
+                params['features'] = features_as_json(c)
+                result = edit_method(**params)
+            return result
 
+        while start < len(features):
+            c = features[start:start + batcher.size]
             params['features'] = features_as_json(c)
-            result = self.add_features(**params)
+            request_start = time.monotonic()
+
+            try:
+                result = edit_method(**params)
+            except Exception as e:
+                reason = batcher.back_off_reason(e)
+                if (reason == 'too_large' or (reason == 'timeout' and retry_timeouts)) and batcher.back_off(reason):
+                    continue
+                raise
+
+            batcher.record(len(c), time.monotonic() - request_start,
+                           request_bytes=len(params['features']), response_bytes=len(result.content))
+            start += len(c)
 
         return result
 
+    def add_features_batch(self, n=500, **params):
+        """
+        Add JSON features to feature layer in batches of size n.
+
+        This method should typically be used instead of .add_features()
+
+        Pass an AdaptiveBatcher (or 'auto') as n to size batches adaptively. Batches that are too large are retried
+        at a smaller size; timed out batches are not retried, since the features may already have been added.
+
+        :param n: <int|AdaptiveBatcher|str> Batch size
+        :param params: <dict> Feature service add operation supported parameters
+        :return: <requests.Response> Request response object (for last request)
+        """
+
+        return self.__edit_features_batch(self.add_features, n, False, params)
+
     def update_features(self, **params):
         """
         Update JSON features in feature layer.
@@ -211,20 +1026,15 @@ class FeatureLayer(object):
 
         This method should typically be used instead of .update_features()
 
-        :param n: <int> Batch size
+        Pass an AdaptiveBatcher (or 'auto') as n to size batches adaptively. Batches that are too large or time out
+        are retried at a smaller size.
+
+        :param n: <int|AdaptiveBatcher|str> Batch size
         :param params: <dict> Feature service update operation supported parameters
         :return: <requests.Response> Request response object (for last request)
         """
 
-        features = params.get('features')
-        feature_chunks = [c for c in chunk_iterable(features, n)]
-
-        for c in feature_chunks:
-
-            params['features'] = features_as_json(c)
-            result = self.update_features(**params)
-
-        return result
+        return self.__edit_features_batch(self.update_features, n, True, params)
 
     def delete_features(self, **params):
         """
@@ -237,6 +1047,107 @@ class FeatureLayer(object):
         url = urllib.parse.urljoin(self.url, 'deleteFeatures')
         return self.__make_request(url, 'post', params)
 
+    def __delete_batch(self, object_ids, compress, params):
+        """
+        Delete one batch of features by object ID.
+
+        :param object_ids: <list> Sorted object IDs
+        :param compress: <bool> Send as a range-compressed where clause rather than objectIds
+        :param params: <dict> Feature service delete operation supported parameters
+        :return: <list> deleteResults
+        """
+
+        if compress:
+            batch_params = merge_dicts(params, {'where': oid_where_clause(self.oid_field, object_ids)})
+        else:
+            batch_params = merge_dicts(params, {'objectIds': ','.join([str(o) for o in object_ids])})
+
+        return self.delete_features(**batch_params).json().get('deleteResults', [])
+
+    def delete_features_batch(self, object_ids, n=500, compress=False, max_workers=None, **params):
+        """
+        Delete features from feature layer by object ID, in batches of up to n features.
+
+        With compress, each batch is sent as a where clause in which runs of consecutive OIDs are written as
+        "OID BETWEEN a AND b" terms, rather than as a list of objectIds. With max_workers, batches are sent
+        concurrently.
+
+        :param object_ids: <iter> Object IDs of features to delete
+        :param n: <int> Batch size
+        :param compress: <bool> Send batches as range-compressed where clauses
+        :param max_workers: <int> Maximum number of concurrent requests; batches are sent in turn if None
+        :param params: <dict> Feature service delete operation supported parameters
+        :return: <dict> Combined deleteResults
+        """
+
+        batches = [c for c in chunk_iterable(sorted(set(object_ids)), n)]
+        result = {'deleteResults': []}
+
+        if max_workers is None:
+            for c in batches:
+                result['deleteResults'].extend(self.__delete_batch(c, compress, params))
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(self.__delete_batch, c, compress, params) for c in batches]
+                for future in futures:
+                    result['deleteResults'].extend(future.result())
+
+        logger.debug("Deleted features: {0} in {1} requests".format(len(result['deleteResults']), len(batches)))
+
+        return result
+
+    def apply_edits(self, **params):
+        """
+        Apply adds, updates and deletes to feature layer in a single request.
+
+        https://developers.arcgis.com/rest/services-reference/apply-edits-feature-service-layer-.htm
+
+        :param params: <dict> Feature service applyEdits operation supported parameters
+        :return: <requests.Response> Request response object
+        """
+
+        url = urllib.parse.urljoin(self.url, 'applyEdits')
+        return self.__make_request(url, 'post', params)
+
+    def apply_edits_batch(self, adds=None, updates=None, deletes=None, n=500, rollback_on_failure=True, **params):
+        """
+        Apply JSON feature adds, updates and deletes to feature layer in combined batches.
+
+        Each request carries up to n adds, n updates and n deletes. With rollback_on_failure, each request is
+        applied atomically by the service.
+
+        :param adds: <list> JSON features to add (without OID field)
+        :param updates: <list> JSON features to update (with OID field)
+        :param deletes: <list> Object IDs of features to delete
+        :param n: <int> Batch size per edit type
+        :param rollback_on_failure: <bool> Roll back all edits in a request if any edit fails
+        :param params: <dict> Feature service applyEdits operation supported parameters
+        :return: <dict> Combined addResults, updateResults and deleteResults
+        """
+
+        result = {'addResults': [], 'updateResults': [], 'deleteResults': []}
+
+        add_chunks = [c for c in chunk_iterable(adds or [], n)]
+        update_chunks = [c for c in chunk_iterable(updates or [], n)]
+        delete_chunks = [c for c in chunk_iterable(deletes or [], n)]
+
+        for i in range(max(len(add_chunks), len(update_chunks), len(delete_chunks))):
+
+            request_params = merge_dicts(params, {'rollbackOnFailure': str(rollback_on_failure).lower()})
+            if i < len(add_chunks):
+                request_params['adds'] = features_as_json(add_chunks[i])
+            if i < len(update_chunks):
+                request_params['updates'] = features_as_json(update_chunks[i])
+            if i < len(delete_chunks):
+                request_params['deletes'] = ','.join([str(o) for o in delete_chunks[i]])
+
+            response = self.apply_edits(**request_params).json()
+
+            for k in result:
+                result[k] += response.get(k) or []
+
+        return result
+
     def export_features_json(self, features):
         """
         Write json features to disk.
@@ -1,7 +1,6 @@
 import json
 import smtplib
 import logging
-from copy import deepcopy
 from datetime import datetime
 from email.mime.text import MIMEText
 
@@ -86,32 +85,32 @@ class FeatureMailer(object):
         :return: <dict> Feature
         """
 
-        fields = None
-        working = deepcopy(feature)
+        date_field_names = None
+        # reports only use attributes; copy those rather than the whole feature (geometry included)
+        working = {'attributes': dict(feature['attributes'])}
 
         if feature_type.lower() == 'src':
-            fields = self.feature_syncer.src_feat_layer.definition()['fields']
+            date_field_names = self.feature_syncer.src_feat_layer.date_fields
         elif feature_type.lower() == 'tgt':
-            fields = self.feature_syncer.tgt_feat_layer.definition()['fields']
+            date_field_names = self.feature_syncer.tgt_feat_layer.date_fields
         else:
             raise Exception('type {0} is not recognized'.format(feature_type))
 
-        result = self.__format_dates(working, fields)
+        result = self.__format_dates(working, date_field_names)
         # add additional format methods here
         # format methods can be chained using dot notation within parentheses
 
         return result
 
-    def __format_dates(self, feature, fields):
+    def __format_dates(self, feature, date_field_names):
         """
         Convert unix timestamps to strings.
 
         :param feature: <dict> JSON feature as dict
-        :param fields: <list> List of field names
+        :param date_field_names: <set> Date field names
         :return: <dict> Feature
         """
 
-        date_field_names = [fld['name'] for fld in fields if fld['type'] == 'esriFieldTypeDate']
         for attr_name in feature['attributes'].keys():
             if attr_name in date_field_names:
                 # get timestamp value
@@ -128,24 +127,35 @@ class FeatureMailer(object):
         """
         Mail feature reports to recipients based on configuration.
 
+        Only features the last sync actually updated, added or deleted (see FeatureSyncer.synced_oids) are reported,
+        so matched features left unchanged (e.g. by changed_only) and failed edits are not.
+
         :return: None
         """
 
         self.conn.connect(self.mail_server)
         self.conn.login(self.username, self.password)
 
+        comp_features = self.feature_syncer.comp_features
+        synced_oids = self.feature_syncer.synced_oids
+        src_oid_field = self.feature_syncer.src_feat_layer.oid_field
+        tgt_oid_field = self.feature_syncer.tgt_feat_layer.oid_field
+
         if self.mailer_config['send_mail']:
             if self.mailer_config['send_updated']:
-                for f in self.feature_syncer.comp_features['src']['matched']:
-                    f_form = self.__format_feature(f, 'src')
-                    self.__send_message(self.__build_message(f_form), f)
+                for f in comp_features['src']['matched']:
+                    if f['attributes'][src_oid_field] in synced_oids['updated']:
+                        f_form = self.__format_feature(f, 'src')
+                        self.__send_message(self.__build_message(f_form), f)
             if self.mailer_config['send_added']:
-                for f in self.feature_syncer.comp_features['src']['unmatched']:
-                    f_form = self.__format_feature(f, 'src')
-                    self.__send_message(self.__build_message(f_form), f)
+                for f in comp_features['src']['unmatched']:
+                    if f['attributes'][src_oid_field] in synced_oids['added']:
+                        f_form = self.__format_feature(f, 'src')
+                        self.__send_message(self.__build_message(f_form), f)
             if self.mailer_config['send_deleted']:
-                for f in self.feature_syncer.comp_features['tgt']['unmatched']:
-                    f_form = self.__format_feature(f, 'tgt')
-                    self.__send_message(self.__build_message(f_form), f)
+                for f in comp_features['tgt']['unmatched']:
+                    if f['attributes'][tgt_oid_field] in synced_oids['deleted']:
+                        f_form = self.__format_feature(f, 'tgt')
+                        self.__send_message(self.__build_message(f_form), f)
 
         self.conn.close()
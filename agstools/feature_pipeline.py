@@ -0,0 +1,220 @@
+import logging
+from agstools.feature_table import FeatureTable
+
+logger = logging.getLogger(__name__)
+
+
+class FeaturePipeline(object):
+    """Record esri json feature processing steps and apply them to each feature in a single pass.
+
+    Steps have the same behavior as the FeatureProcessor methods of the same name. They are recorded lazily, then
+    compiled into one function per feature, so a chain of steps walks the feature set once.
+    """
+
+    def __init__(self, features=None):
+        """
+        Class initializer.
+
+        :param features: <list> JSON features as list of dicts, optional (may be given to .apply() instead)
+        """
+
+        self.features = features
+        self.steps = []
+
+    def __add_step(self, kind, arg):
+        """
+        Record a step, merging it into the previous step where the two can be fused.
+
+        :param kind: <str> Step kind
+        :param arg: <object> Step argument
+        :return: <feature_pipeline.FeaturePipeline> self
+        """
+
+        if self.steps and self.steps[-1][0] == kind and kind in ('remove', 'set'):
+            prev_arg = self.steps[-1][1]
+            self.steps[-1] = (kind, prev_arg + arg if kind == 'remove' else {**prev_arg, **arg})
+        else:
+            self.steps.append((kind, arg))
+
+        return self
+
+    def remove_attributes(self, attribute_names=[]):
+        """
+        Record a step removing attributes.
+
+        :param attribute_names: <list> Attribute names
+        :return: <feature_pipeline.FeaturePipeline> self
+        """
+
+        return self.__add_step('remove', list(attribute_names))
+
+    def add_attributes(self, attribute_map={}):
+        """
+        Record a step adding attributes (with default values); an attribute that already exists raises an error.
+
+        :param attribute_map: <dict> Map of attribute names to default values
+        :return: <feature_pipeline.FeaturePipeline> self
+        """
+
+        return self.__add_step('add', dict(attribute_map))
+
+    def replace_attributes(self, replace_map={}):
+        """
+        Record a step replacing attribute names with new attribute names, keeping values.
+
+        :param replace_map: <dict> Map of old attribute names to new attribute names
+        :return: <feature_pipeline.FeaturePipeline> self
+        """
+
+        return self.__add_step('replace', {k: v for k, v in replace_map.items() if k != v})
+
+    def replace_values(self, value_map={}):
+        """
+        Record a step replacing all occurrences of old values with new values.
+
+        :param value_map: <dict> Map of old values to new values
+        :return: <feature_pipeline.FeaturePipeline> self
+        """
+
+        return self.__add_step('replace_values', dict(value_map))
+
+    def set_values(self, attribute_name, value):
+        """
+        Record a step setting the value of an attribute.
+
+        :param attribute_name: <str> Attribute name
+        :param value: <object> Attribute value
+        :return: <feature_pipeline.FeaturePipeline> self
+        """
+
+        return self.__add_step('set', {attribute_name: value})
+
+    @staticmethod
+    def __compile_step(kind, arg):
+        """
+        Return a function applying one step to an attributes dict in place.
+
+        :param kind: <str> Step kind
+        :param arg: <object> Step argument
+        :return: <callable> Step function
+        """
+
+        if kind == 'remove':
+            def step(attributes):
+                for a in arg:
+                    attributes.pop(a)
+
+        elif kind == 'add':
+            def step(attributes):
+                for k, v in arg.items():
+                    if k in attributes:
+                        raise Exception('Field {0} already exists in feature'.format(k))
+                    attributes[k] = v
+
+        elif kind == 'replace':
+            def step(attributes):
+                for v in arg.values():
+                    if v in attributes:
+                        raise Exception('Field {0} already exists in feature'.format(v))
+                values = {v: attributes.pop(k) for k, v in arg.items()}
+                attributes.update(values)
+
+        elif kind == 'replace_values':
+            def step(attributes):
+                for k, v in attributes.items():
+                    if v in arg:
+                        attributes[k] = arg[v]
+
+        elif kind == 'set':
+            def step(attributes):
+                attributes.update(arg)
+
+        else:
+            raise Exception('Step type {0} not recognized.'.format(kind))
+
+        return step
+
+    def compile(self):
+        """
+        Compile the recorded steps into a single function that processes a feature's attributes dict in place.
+
+        :return: <callable> Function taking an attributes dict
+        """
+
+        steps = tuple(self.__compile_step(kind, arg) for kind, arg in self.steps if arg)
+
+        if len(steps) == 1:
+            return steps[0]
+
+        def process(attributes):
+            for step in steps:
+                step(attributes)
+
+        return process
+
+    def __apply_table(self, table):
+        """
+        Apply the recorded steps to a feature table, column by column.
+
+        :param table: <feature_table.FeatureTable> Feature table
+        :return: <feature_table.FeatureTable> Feature table
+        """
+
+        for kind, arg in self.steps:
+            if kind == 'remove':
+                table.remove_attributes(arg)
+            elif kind == 'add':
+                table.add_attributes(arg)
+            elif kind == 'replace':
+                table.replace_attributes(arg)
+            elif kind == 'replace_values':
+                table.replace_values(arg)
+            elif kind == 'set':
+                for k, v in arg.items():
+                    table.set_values(k, v)
+
+        return table
+
+    def apply(self, features=None):
+        """
+        Apply the recorded steps to each feature in place, in a single pass.
+
+        A feature_table.FeatureTable is processed column by column instead.
+
+        :param features: <list|feature_table.FeatureTable> JSON features as list of dicts; defaults to self.features
+        :return: <list|feature_table.FeatureTable> Features
+        """
+
+        features = self.features if features is None else features
+
+        if isinstance(features, FeatureTable):
+            return self.__apply_table(features)
+
+        process = self.compile()
+
+        for f in features:
+            process(f['attributes'])
+
+        return features
+
+    def iter_features(self, features=None, copy_attributes=False):
+        """
+        Yield features with the recorded steps applied, one at a time.
+
+        With copy_attributes, each yielded feature is a copy with a new attributes dict (geometry is shared), and
+        the input features are not modified.
+
+        :param features: <iter> JSON features; defaults to self.features
+        :param copy_attributes: <bool> Yield modified copies rather than modifying features in place
+        :return: <iterator> JSON features
+        """
+
+        features = self.features if features is None else features
+        process = self.compile()
+
+        for f in features:
+            if copy_attributes:
+                f = dict(f)
+                f['attributes'] = dict(f['attributes'])
+            process(f['attributes'])
+            yield f
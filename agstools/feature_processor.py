@@ -1,4 +1,6 @@
 import logging
+from agstools.feature_pipeline import FeaturePipeline
+from agstools.feature_table import FeatureTable
 
 logger = logging.getLogger(__name__)
 
@@ -10,11 +12,39 @@ class FeatureProcessor(object):
         """
         Class initializer.
 
-        :param features: <list> JSON features as list of dicts
+        Features may also be given as a feature_table.FeatureTable, in which case each method operates on whole
+        columns rather than feature by feature.
+
+        :param features: <list|feature_table.FeatureTable> JSON features as list of dicts, or a feature table
         """
 
         self.features = features
 
+    def to_table(self, field_types=None):
+        """
+        Convert self.features to a columnar feature table, in place.
+
+        :param field_types: <dict> Map of field names to esri field types (e.g. FeatureLayer.field_types), optional
+        :return: <feature_table.FeatureTable> Feature table
+        """
+
+        if not isinstance(self.features, FeatureTable):
+            self.features = FeatureTable.from_features(self.features, field_types)
+
+        return self.features
+
+    def pipeline(self):
+        """
+        Return a feature pipeline for self.features.
+
+        Steps recorded on the pipeline (e.g. .pipeline().replace_attributes(m).set_values(k, v)) are applied to
+        each feature in a single pass by its .apply() or .iter_features() methods.
+
+        :return: <feature_pipeline.FeaturePipeline> Feature pipeline
+        """
+
+        return FeaturePipeline(self.features)
+
     def remove_attributes(self, attribute_names=[]):
         """
         Remove attributes from features in self.features.
@@ -25,6 +55,10 @@ class FeatureProcessor(object):
         :return: None
         """
 
+        if isinstance(self.features, FeatureTable):
+            self.features.remove_attributes(attribute_names)
+            return
+
         for f in self.features:
             for a in attribute_names:
                 f['attributes'].pop(a)
@@ -39,6 +73,10 @@ class FeatureProcessor(object):
         :return: None
         """
 
+        if isinstance(self.features, FeatureTable):
+            self.features.add_attributes(attribute_map)
+            return
+
         for f in self.features:
             for k, v in attribute_map.items():
                 if k not in f['attributes']:
@@ -56,14 +94,32 @@ class FeatureProcessor(object):
         :return: None
         """
 
-        clean_map = {k: v for k, v in replace_map.items() if k != v}
-        new_attribute_map = {v: None for v in clean_map.values()}
-        old_attribute_names = clean_map.keys()
-        self.add_attributes(new_attribute_map)
-        for f in self.features:
-            for k, v in clean_map.items():
-                f['attributes'][v] = f['attributes'][k]
-        self.remove_attributes(old_attribute_names)
+        if isinstance(self.features, FeatureTable):
+            self.features.replace_attributes(replace_map)
+            return
+
+        self.pipeline().replace_attributes(replace_map).apply()
+
+    def transform(self, replace_map={}, remove_names=[], set_map={}):
+        """
+        Yield transformed copies of features in self.features, one at a time, in a single pass.
+
+        Each copy has a new attributes dict with attribute names replaced (as .replace_attributes()), attributes
+        removed by new name (as .remove_attributes()) and values set (as .set_values()), applied by a
+        feature_pipeline.FeaturePipeline, so a new name that already exists in a feature raises an error. Features in
+        self.features are not modified, and geometries are shared rather than copied.
+
+        :param replace_map: <dict> Map of old attribute names to new attribute names
+        :param remove_names: <list> Attribute names (after replacement) to remove
+        :param set_map: <dict> Map of attribute names to values to set
+        :return: <iterator> JSON features
+        """
+
+        pipeline = FeaturePipeline().replace_attributes(replace_map).remove_attributes(remove_names)
+        for k, v in set_map.items():
+            pipeline.set_values(k, v)
+
+        return pipeline.iter_features(self.features, copy_attributes=True)
 
     def replace_values(self, value_map={}):
         """
@@ -75,6 +131,10 @@ class FeatureProcessor(object):
         :return: None
         """
 
+        if isinstance(self.features, FeatureTable):
+            self.features.replace_values(value_map)
+            return
+
         old_values = value_map.keys()
 
         for f in self.features:
@@ -91,5 +151,9 @@ class FeatureProcessor(object):
         :return: None
         """
 
+        if isinstance(self.features, FeatureTable):
+            self.features.set_values(attribute_name, value)
+            return
+
         for f in self.features:
             f['attributes'][attribute_name] = value
@@ -1,7 +1,8 @@
 import os
+import gzip
 import json
 import logging
-from agstools.utility import geom_esri_to_geojson
+from agstools.geometry import esri_to_geojson_feature
 
 logger = logging.getLogger(__name__)
 
@@ -24,21 +25,6 @@ class FeatureRetriever(object):
         self.tgt_name = tgt_name
         self.tgt_format = tgt_format
 
-    def __feature_json_to_geojson(self, feature, geometry_type):
-        """
-        Return input ArcGIS JSON feature reconfigured as GeoJSON.
-        
-        :param feature: <dict> JSON feature as dict
-        :param geometry_type: GeoJSON geometry type; one of 'Point', 'Multipoint', 'LineString', 'Polygon'
-        :return: <dict> GeoJSON feature as dict
-        """
-
-        feature['type'] = 'Feature'
-        feature['properties'] = feature.pop('attributes')
-        feature['geometry']['type'] = geometry_type  # Point, LineString, Polygon
-        feature['geometry']['coordinates'] = feature['geometry'].pop('rings')
-        return feature
-
     def __get_esri_json_container(self, out_fields="*"):
         """
         Return ESRI json object from feature layer with empty result set.
@@ -59,15 +45,55 @@ class FeatureRetriever(object):
         return {"type": "FeatureCollection",
                 "features": []}
 
-    def retrieve(self, where="1=1", out_fields="*", geometry=None, geometry_type=None):
+    @staticmethod
+    def __container_head(container):
+        """
+        Return the text of a container up to the start of its features array.
+
+        :param container: <dict> ESRI JSON or GeoJSON container
+        :return: <str> Container head, e.g. '{"type": "FeatureCollection", "features": ['
+        """
+
+        container = {k: v for k, v in container.items() if k != 'features'}
+        head = json.dumps(container)[:-1]
+
+        return head + (', ' if container else '') + '"features": ['
+
+    @staticmethod
+    def __open(outfile, compress=False):
+        """
+        Open a text file for writing, gzip-compressed if compress.
+
+        :param outfile: <str> Output file path
+        :param compress: <bool> Write gzip-compressed output
+        :return: <file> File object
+        """
+
+        if compress:
+            return gzip.open(outfile, 'wt', encoding='utf-8')
+
+        return open(outfile, 'w', encoding='utf-8')
+
+    def retrieve(self, where="1=1", out_fields="*", geometry=None, geometry_type=None, ndjson=False, compress=False,
+                 fidelity=None):
         """
         Get source layer features and write to ESRI JSON or GeoJSON file.
 
+        Features are streamed from the layer to the file page by page, so the layer is never held in memory. The
+        file is written under a temporary name and moved into place once complete.
+
+        With ndjson, one feature is written per line (newline-delimited JSON; .jsonl or .geojsonl) without a
+        container. With compress, output is gzip-compressed (.gz). A fidelity profile limits the geometry precision
+        exported (see feature_layer.FeatureLayer.query()).
+
         :param where: <str> ESRI where clause
         :param out_fields: <str> Comma-separated string of field names to include in output
         :param geometry: <dict> ESRI geometry, optional
         :param geometry_type: <str> ESRI geometry type, must be specified if using geometry
-        :return: None
+        :param ndjson: <bool> Write newline-delimited features
+        :param compress: <bool> Write gzip-compressed output
+        :param fidelity: <fidelity_profile.FidelityProfile|str> Fidelity profile, or the name of one, optional
+        :return: <str> Output file path
         """
 
         request_args = {'where': where,
@@ -76,26 +102,54 @@ class FeatureRetriever(object):
             request_args['geometry'] = str(geometry)
             request_args['geometryType'] = str(geometry_type)
 
-        json_features = self.src_feat_layer.query_features_batch(**request_args)
-
         if self.tgt_format == 'esrijson':
-            container = self.__get_esri_json_container(out_fields)
-            outfile = os.path.join(self.tgt_workspace, self.tgt_name + '.json')
-
-            for f in json_features:
-                container['features'].append(f)
+            extension = '.jsonl' if ndjson else '.json'
+            container = None if ndjson else self.__get_esri_json_container(out_fields)
+            convert = None
 
         elif self.tgt_format == 'geojson':
-            esri_geom_type = self.src_feat_layer.definition()['geometryType']
-            geojson_geom_type = geom_esri_to_geojson(esri_geom_type)
-            container = self.__get_geojson_container()
-            outfile = os.path.join(self.tgt_workspace, self.tgt_name + '.geojson')
-
-            for f in json_features:
-                container['features'].append(self.__feature_json_to_geojson(f, geojson_geom_type))
+            extension = '.geojsonl' if ndjson else '.geojson'
+            container = None if ndjson else self.__get_geojson_container()
+            convert = esri_to_geojson_feature
 
         else:
             raise Exception('Output format {0} not recognized.'.format(self.tgt_format))
 
-        with open(outfile, 'w') as f:
-            f.write(json.dumps(container))
+        outfile = os.path.join(self.tgt_workspace, self.tgt_name + extension + ('.gz' if compress else ''))
+        temp_path = outfile + '.part'
+        feature_count = 0
+
+        json_features = self.src_feat_layer.iter_features(prefetch=True, fidelity=fidelity, **request_args)
+
+        try:
+            with self.__open(temp_path, compress) as f:
+                if container is not None:
+                    f.write(self.__container_head(container))
+
+                for feature in json_features:
+                    if convert is not None:
+                        feature = convert(feature)
+
+                    if ndjson:
+                        f.write(json.dumps(feature))
+                        f.write('\n')
+                    else:
+                        if feature_count > 0:
+                            f.write(', ')
+                        f.write(json.dumps(feature))
+
+                    feature_count += 1
+
+                if container is not None:
+                    f.write(']}')
+
+            os.replace(temp_path, outfile)
+
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        logger.debug("Features written: {0} to {1}".format(feature_count, outfile))
+
+        return outfile
@@ -1,8 +1,11 @@
+import os
+import json
 import logging
-from copy import deepcopy
+from itertools import zip_longest
+from datetime import datetime, timezone
 from agstools.feature_processor import FeatureProcessor
 from agstools.attribute_mapper import AttributeMapper
-from agstools.utility import merge_dicts
+from agstools.utility import merge_dicts, chunk_iterable, hash_attributes, hash_geometry, oid_where_clauses
 
 logger = logging.getLogger(__name__)
 
@@ -10,19 +13,35 @@ logger = logging.getLogger(__name__)
 class FeatureSyncer(object):
     """Sync features between feature layers."""
 
-    def __init__(self, src_feat_layer, tgt_feat_layer, custom_attr_mapper=None):
+    def __init__(self, src_feat_layer, tgt_feat_layer, custom_attr_mapper=None, state_path=None, state_store=None,
+                 fidelity=None):
         """
         Class initializer.
 
+        With a state_store, the uid, OIDs and content hash of each synced feature are recorded, and later syncs use
+        the store in place of reading the target layer (see .sync()).
+
+        Source features are written to the target, so they are read at full fidelity unless a fidelity profile is
+        given. Target features are only read for matching and comparison, so they are read without geometry, or with
+        geometry at comparison precision for changed_only syncs.
+
         :param src_feat_layer: <feature_layer.FeatureLayer> Source feature layer
         :param tgt_feat_layer: <feature_layer.FeatureLayer> Target feature layer
         :param custom_attr_mapper: <attribute_mapper.AttributeMapper> Source to target attribute mapper
+        :param state_path: <str> Path to sync state file (.json); incremental sync requires this or a state_store
+        :param state_store: <sync_state_store.SyncStateStore> Persistent sync state store, optional
+        :param fidelity: <fidelity_profile.FidelityProfile|str> Source fidelity profile, or the name of one, optional
         """
 
         self.src_feat_layer = src_feat_layer
         self.tgt_feat_layer = tgt_feat_layer
         self.cust_attr_mapper = custom_attr_mapper if isinstance(custom_attr_mapper, AttributeMapper) else AttributeMapper()
         self.auto_attr_mapper = self.__build_auto_attr_mapper()
+        self.state_path = state_path
+        self.state_store = state_store
+        self.fidelity = fidelity
+        self.sync_counts = {'unchanged': 0, 'updated': 0, 'added': 0, 'deleted': 0, 'failed': 0}
+        self.synced_oids = {'updated': set(), 'added': set(), 'deleted': set()}
         self.comp_features = {'src': {'index': {}, 'matched': [], 'unmatched': []},
                               'tgt': {'index': {}, 'matched': [], 'unmatched': []}}
 
@@ -52,12 +71,30 @@ class FeatureSyncer(object):
         self.comp_features = {'src': {'index': {}, 'matched': [], 'unmatched': []},
                               'tgt': {'index': {}, 'matched': [], 'unmatched': []}}
 
-    def __comp_features(self, src_uid_field, tgt_uid_field):
+    def __stored_target_features(self, tgt_uid_field, tgt_oid_field):
+        """
+        Return target features recorded in the state store, with only the uid and OID attributes.
+
+        :param tgt_uid_field: <str> Target unique ID field name
+        :param tgt_oid_field: <str> Target OID field name
+        :return: <list> JSON features
+        """
+
+        return [{'attributes': {tgt_uid_field: uid, tgt_oid_field: tgt_oid}}
+                for uid, (src_oid, tgt_oid, content_hash) in self.state_store.index().items()]
+
+    def __comp_features(self, src_uid_field, tgt_uid_field, use_store=False, changed_only=False):
         """
         Calculate and set feature comparison results.
 
+        With use_store, target features are taken from the state store rather than read from the target layer.
+        Target features are read without geometry unless changed_only, which needs target geometry (at comparison
+        precision) to detect changes.
+
         :param src_uid_field: <str> Source unique ID field name
         :param tgt_uid_field: <str> Target unique ID field name
+        :param use_store: <bool> Use the state store in place of the target layer
+        :param changed_only: <bool> Read target geometry for change detection
         :return: None
         """
 
@@ -68,39 +105,556 @@ class FeatureSyncer(object):
         attr_map = self.__get_attr_map()
 
         # get oid field names
-        try:
-            src_oid_field = self.src_feat_layer.definition()['objectIdField']
-        except KeyError:
-            src_oid_field = 'OBJECTID'
-        try:
-            tgt_oid_field = self.tgt_feat_layer.definition()['objectIdField']
-        except KeyError:
-            tgt_oid_field = 'OBJECTID'
+        src_oid_field = self.src_feat_layer.oid_field
+        tgt_oid_field = self.tgt_feat_layer.oid_field
 
         # get source feat layer attributes from attr map
         src_attr = [k for k, v in sorted(attr_map.items())]
         # get target feat layer attributes from attr map
         tgt_attr = [v for k, v in sorted(attr_map.items())]
 
-        # get source and target json features
-        src_features = self.src_feat_layer.query_features_batch(where='1=1', outFields=', '.join(src_attr))
-        tgt_features = self.tgt_feat_layer.query_features_batch(where='1=1', outFields=', '.join(tgt_attr))
-
-        # build feature indexes with uid field as key, oid field as value
-        self.comp_features['src']['index'] = {f['attributes'][src_uid_field]: f['attributes'][src_oid_field]
-                                              for f in src_features}
-        self.comp_features['tgt']['index'] = {f['attributes'][tgt_uid_field]: f['attributes'][tgt_oid_field]
-                                              for f in tgt_features}
-
-        # process matched and exclusive features from source and target feature sets
-        self.comp_features['src']['matched'] = [
-            f for f in src_features if f['attributes'][src_uid_field] in self.comp_features['tgt']['index']]
-        self.comp_features['src']['unmatched'] = [
-            f for f in src_features if f['attributes'][src_uid_field] not in self.comp_features['tgt']['index']]
+        src_index = self.comp_features['src']['index']
+        tgt_index = self.comp_features['tgt']['index']
+
+        # stream target json features, building index with uid field as key, oid field as value
+        tgt_features = []
+        if use_store:
+            tgt_stream = self.__stored_target_features(tgt_uid_field, tgt_oid_field)
+        else:
+            tgt_stream = self.tgt_feat_layer.iter_features(where='1=1', outFields=', '.join(tgt_attr), prefetch=True,
+                                                           fidelity='compare' if changed_only else 'attributes')
+        for f in tgt_stream:
+            tgt_index[f['attributes'][tgt_uid_field]] = f['attributes'][tgt_oid_field]
+            tgt_features.append(f)
+
+        # stream source json features, building index and splitting matched and exclusive features as they arrive
+        for f in self.src_feat_layer.iter_features(where='1=1', outFields=', '.join(src_attr), prefetch=True,
+                                                   fidelity=self.fidelity):
+            src_index[f['attributes'][src_uid_field]] = f['attributes'][src_oid_field]
+            if f['attributes'][src_uid_field] in tgt_index:
+                self.comp_features['src']['matched'].append(f)
+            else:
+                self.comp_features['src']['unmatched'].append(f)
+
+        # process matched and exclusive features from target feature set
         self.comp_features['tgt']['matched'] = [
-            f for f in tgt_features if f['attributes'][tgt_uid_field] in self.comp_features['src']['index']]
+            f for f in tgt_features if f['attributes'][tgt_uid_field] in src_index]
+        self.comp_features['tgt']['unmatched'] = [
+            f for f in tgt_features if f['attributes'][tgt_uid_field] not in src_index]
+
+    def __comp_features_incremental(self, src_uid_field, tgt_uid_field, changed_oids, use_store=False,
+                                    changed_only=False):
+        """
+        Calculate and set feature comparison results from source features changed since the last sync.
+
+        Full source features are only retrieved for changed features and for features missing from the target.
+        Matched and unmatched target features include only the uid and OID attributes (no geometry), except that
+        with changed_only, the target features of changed source features are retrieved at comparison precision.
+        With use_store, target features are taken from the state store rather than read from the target layer.
+
+        :param src_uid_field: <str> Source unique ID field name
+        :param tgt_uid_field: <str> Target unique ID field name
+        :param changed_oids: <iter> Object IDs of source features added or updated since the last sync
+        :param use_store: <bool> Use the state store in place of the target layer
+        :param changed_only: <bool> Fetch target features of changed features for change detection
+        :return: None
+        """
+
+        # remove previously compared features
+        self.__reset_comp_features()
+
+        # get current attribute map
+        attr_map = self.__get_attr_map()
+
+        # get oid field names
+        src_oid_field = self.src_feat_layer.oid_field
+        tgt_oid_field = self.tgt_feat_layer.oid_field
+
+        # get source and target feat layer attributes from attr map
+        src_attr = [k for k, v in sorted(attr_map.items())]
+        tgt_attr = [v for k, v in sorted(attr_map.items())]
+
+        src_index = self.comp_features['src']['index']
+        tgt_index = self.comp_features['tgt']['index']
+
+        # build target index from uid and oid attributes only
+        tgt_features = []
+        if use_store:
+            tgt_stream = self.__stored_target_features(tgt_uid_field, tgt_oid_field)
+        else:
+            tgt_stream = self.tgt_feat_layer.iter_features(where='1=1',
+                                                           outFields=', '.join([tgt_uid_field, tgt_oid_field]),
+                                                           returnGeometry=False, prefetch=True)
+        for f in tgt_stream:
+            tgt_index[f['attributes'][tgt_uid_field]] = f['attributes'][tgt_oid_field]
+            tgt_features.append(f)
+
+        # build source index from uid and oid attributes only
+        for f in self.src_feat_layer.iter_features(where='1=1', outFields=', '.join([src_uid_field, src_oid_field]),
+                                                   returnGeometry=False, prefetch=True):
+            src_index[f['attributes'][src_uid_field]] = f['attributes'][src_oid_field]
+
+        # retrieve source features changed since the last sync, plus any that are missing from the target
+        fetch_oids = set(changed_oids) | set(oid for uid, oid in src_index.items() if uid not in tgt_index)
+        fetch_oids &= set(src_index.values())
+        self.__fetch_source_features(src_uid_field, src_attr, fetch_oids)
+
+        # process matched and exclusive features from target feature set
+        if changed_only and not use_store:
+            update_oids = [tgt_index[f['attributes'][src_uid_field]] for f in self.comp_features['src']['matched']]
+            self.comp_features['tgt']['matched'] = self.__fetch_target_features(tgt_attr, update_oids)
+        else:
+            self.comp_features['tgt']['matched'] = [
+                f for f in tgt_features if f['attributes'][tgt_uid_field] in src_index]
         self.comp_features['tgt']['unmatched'] = [
-            f for f in tgt_features if f['attributes'][tgt_uid_field] not in self.comp_features['src']['index']]
+            f for f in tgt_features if f['attributes'][tgt_uid_field] not in src_index]
+
+    def __comp_features_two_phase(self, src_uid_field, tgt_uid_field, use_store=False, changed_only=False):
+        """
+        Calculate and set feature comparison results in two phases, fetching full features only where needed.
+
+        Phase one reads the uid, OID and edit date attributes of every source and target feature, without geometry,
+        and finds the add, update and delete sets. A matched feature is an update if the source editor tracking edit
+        date is later than the value of its mapped target attribute; if the source has no edit date field, the field
+        is not mapped, or a state store is used, every matched feature is an update. Phase two fetches full source
+        features for adds and updates only, plus target features at comparison precision for changed_only.
+
+        Matched features that are not updates are counted as unchanged. Matched and unmatched target features
+        include only the uid, OID and edit date attributes, except target features fetched for changed_only.
+
+        :param src_uid_field: <str> Source unique ID field name
+        :param tgt_uid_field: <str> Target unique ID field name
+        :param use_store: <bool> Use the state store in place of the target layer
+        :param changed_only: <bool> Fetch target features of updates for change detection
+        :return: None
+        """
+
+        # remove previously compared features
+        self.__reset_comp_features()
+
+        # get current attribute map
+        attr_map = self.__get_attr_map()
+
+        # get oid field names
+        src_oid_field = self.src_feat_layer.oid_field
+        tgt_oid_field = self.tgt_feat_layer.oid_field
+
+        # get source and target feat layer attributes from attr map
+        src_attr = [k for k, v in sorted(attr_map.items())]
+        tgt_attr = [v for k, v in sorted(attr_map.items())]
+
+        src_index = self.comp_features['src']['index']
+        tgt_index = self.comp_features['tgt']['index']
+
+        # edit dates can only be compared if the target holds a copy of the source edit date; a state store must see
+        # every matched feature, so edit dates are not compared with one
+        src_edit_field = (self.src_feat_layer.definition().get('editFieldsInfo') or {}).get('editDateField')
+        tgt_edit_field = attr_map.get(src_edit_field) if src_edit_field and self.state_store is None else None
+        src_edit_fields = [src_edit_field] if tgt_edit_field else []
+        tgt_edit_fields = [tgt_edit_field] if tgt_edit_field else []
+
+        # phase one: build target index from uid, oid and edit date attributes only
+        tgt_features = []
+        if use_store:
+            tgt_stream = self.__stored_target_features(tgt_uid_field, tgt_oid_field)
+        else:
+            tgt_stream = self.tgt_feat_layer.iter_features(
+                where='1=1', outFields=', '.join([tgt_uid_field, tgt_oid_field] + tgt_edit_fields),
+                fidelity='attributes', prefetch=True)
+        for f in tgt_stream:
+            tgt_index[f['attributes'][tgt_uid_field]] = f['attributes'][tgt_oid_field]
+            tgt_features.append(f)
+
+        tgt_edit_dates = ({f['attributes'][tgt_uid_field]: f['attributes'].get(tgt_edit_field) for f in tgt_features}
+                          if tgt_edit_field else {})
+
+        # phase one: build source index, choosing adds and updates from uid, oid and edit date attributes only
+        fetch_oids = set()
+        src_fields = [src_uid_field, src_oid_field] + src_edit_fields
+        for f in self.src_feat_layer.iter_features(where='1=1', outFields=', '.join(src_fields), fidelity='attributes',
+                                                   prefetch=True):
+            uid = f['attributes'][src_uid_field]
+            src_index[uid] = f['attributes'][src_oid_field]
+
+            if uid in tgt_index and tgt_edit_field:
+                src_edit_date = f['attributes'].get(src_edit_field)
+                tgt_edit_date = tgt_edit_dates[uid]
+                if src_edit_date is not None and tgt_edit_date is not None and src_edit_date <= tgt_edit_date:
+                    self.sync_counts['unchanged'] += 1
+                    continue
+
+            fetch_oids.add(src_index[uid])
+
+        # phase two: retrieve full source features for adds and updates
+        self.__fetch_source_features(src_uid_field, src_attr, fetch_oids)
+
+        # process matched and exclusive features from target feature set
+        self.comp_features['tgt']['unmatched'] = [
+            f for f in tgt_features if f['attributes'][tgt_uid_field] not in src_index]
+
+        if changed_only and not use_store:
+            # phase two: retrieve target features of updates, with geometry at comparison precision
+            update_oids = [tgt_index[f['attributes'][src_uid_field]] for f in self.comp_features['src']['matched']]
+            self.comp_features['tgt']['matched'] = self.__fetch_target_features(tgt_attr, update_oids)
+        else:
+            self.comp_features['tgt']['matched'] = [
+                f for f in tgt_features if f['attributes'][tgt_uid_field] in src_index]
+
+    def __fetch_source_features(self, src_uid_field, src_attr, fetch_oids):
+        """
+        Retrieve full source features by object ID, adding them to the matched or unmatched comparison results.
+
+        :param src_uid_field: <str> Source unique ID field name
+        :param src_attr: <list> Source attribute names
+        :param fetch_oids: <set> Object IDs of source features to retrieve
+        :return: None
+        """
+
+        if not fetch_oids:
+            return
+
+        tgt_index = self.comp_features['tgt']['index']
+
+        # select fetch features with bounded, range-compressed where clauses rather than lists of object IDs
+        for where in oid_where_clauses(self.src_feat_layer.oid_field, fetch_oids):
+            for f in self.src_feat_layer.iter_features(where=where, outFields=', '.join(src_attr), prefetch=True,
+                                                       fidelity=self.fidelity):
+                if f['attributes'][src_uid_field] in tgt_index:
+                    self.comp_features['src']['matched'].append(f)
+                else:
+                    self.comp_features['src']['unmatched'].append(f)
+
+    def __fetch_target_features(self, tgt_attr, fetch_oids):
+        """
+        Return target features by object ID, with geometry at comparison precision.
+
+        Features deleted from the target since their OIDs were read are not returned.
+
+        :param tgt_attr: <list> Target attribute names
+        :param fetch_oids: <iter> Object IDs of target features to retrieve
+        :return: <list> JSON features
+        """
+
+        tgt_features = []
+
+        for where in oid_where_clauses(self.tgt_feat_layer.oid_field, fetch_oids):
+            tgt_features.extend(self.tgt_feat_layer.iter_features(where=where, outFields=', '.join(tgt_attr),
+                                                                  fidelity='compare', prefetch=True))
+
+        return tgt_features
+
+    def __compare_skip_fields(self, ignore_fields=()):
+        """
+        Return target attribute names that are not compared when detecting changed features.
+
+        :param ignore_fields: <iter> Additional target attribute names to skip
+        :return: <set> Attribute names
+        """
+
+        tgt_edit_fields = (self.tgt_feat_layer.definition().get('editFieldsInfo') or {}).values()
+        return set(ignore_fields) | set(tgt_edit_fields) | {self.tgt_feat_layer.oid_field}
+
+    @staticmethod
+    def __feature_hash(feature, skip_fields, precision=8):
+        """
+        Return a content hash of a mapped feature's compared attributes and geometry.
+
+        :param feature: <dict> JSON feature mapped to target attribute names
+        :param skip_fields: <set> Attribute names not compared
+        :param precision: <int> Number of decimal places compared for float values and coordinates
+        :return: <str> Hash
+        """
+
+        compare_fields = sorted(k for k in feature['attributes'] if k not in skip_fields)
+        return '{0}:{1}'.format(hash_attributes(feature['attributes'], compare_fields, precision),
+                                hash_geometry(feature.get('geometry'), precision))
+
+    @staticmethod
+    def __is_changed(feature, tgt_feature, skip_fields, precision=8):
+        """
+        Check whether an update feature's attribute values or geometry differ from its target feature.
+
+        The update feature must already be mapped to target attribute names. Attributes in skip_fields are not
+        compared. A feature whose target counterpart lacks a compared attribute or geometry is treated as changed.
+
+        :param feature: <dict> Mapped source feature with target OID
+        :param tgt_feature: <dict> Matching target feature
+        :param skip_fields: <set> Attribute names not compared
+        :param precision: <int> Number of decimal places compared for float values and coordinates
+        :return: <bool>
+        """
+
+        compare_fields = [k for k in feature['attributes'] if k not in skip_fields]
+
+        return (any(k not in tgt_feature['attributes'] for k in compare_fields) or
+                hash_attributes(feature['attributes'], compare_fields, precision) !=
+                hash_attributes(tgt_feature['attributes'], compare_fields, precision) or
+                ('geometry' in feature and ('geometry' not in tgt_feature or
+                                            hash_geometry(feature['geometry'], precision) !=
+                                            hash_geometry(tgt_feature['geometry'], precision))))
+
+    def __load_state(self):
+        """
+        Return the sync state from self.state_path, or an empty state.
+
+        :return: <dict> Sync state
+        """
+
+        if self.state_store is not None:
+            return self.state_store.get_mark('state', {})
+
+        if self.state_path is None:
+            raise Exception('Incremental sync requires a state_path or state_store.')
+
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+
+        return {}
+
+    def __save_state(self, state):
+        """
+        Write the sync state to the state store, or to self.state_path, replacing the previous state atomically.
+
+        :param state: <dict> Sync state
+        :return: None
+        """
+
+        if self.state_store is not None:
+            self.state_store.set_mark('state', state)
+            return
+
+        temp_path = self.state_path + '.part'
+
+        with open(temp_path, 'w') as f:
+            f.write(json.dumps(state))
+
+        os.replace(temp_path, self.state_path)
+
+    def __change_tracking_type(self, change_tracking):
+        """
+        Return the change tracking type to use for incremental sync.
+
+        'auto' uses extractChanges server generations if the source service supports change tracking, otherwise the
+        source layer editor tracking edit date field.
+
+        :param change_tracking: <str> One of 'auto', 'serverGen' or 'editDate'
+        :return: <str> One of 'serverGen' or 'editDate'
+        """
+
+        if change_tracking not in ('auto', 'serverGen', 'editDate'):
+            raise Exception('Change tracking type {0} not recognized.'.format(change_tracking))
+
+        if change_tracking in ('auto', 'serverGen') and self.src_feat_layer.supports_change_tracking():
+            return 'serverGen'
+        if change_tracking == 'serverGen':
+            raise Exception('Source service does not support change tracking.')
+
+        if (self.src_feat_layer.definition().get('editFieldsInfo') or {}).get('editDateField'):
+            return 'editDate'
+
+        raise Exception('Source layer has neither change tracking nor an editor tracking edit date field.')
+
+    def __edit_date_mark(self, last_edit_date):
+        """
+        Return an editDate high-water mark value.
+
+        The source layer lastEditDate is used if the layer reports one; otherwise the latest value of the editor
+        tracking edit date field, from a statistics query (0 if the layer has no edit dates).
+
+        :param last_edit_date: <int> Source layer lastEditDate at the start of this sync, or None
+        :return: <int> Mark value (milliseconds since epoch)
+        """
+
+        if last_edit_date is not None:
+            return last_edit_date
+
+        edit_date_field = self.src_feat_layer.definition()['editFieldsInfo']['editDateField']
+        statistics = [{'statisticType': 'max', 'onStatisticField': edit_date_field,
+                       'outStatisticFieldName': 'max_edit_date'}]
+        features = self.src_feat_layer.query(where='1=1', outStatistics=json.dumps(statistics)).json()['features']
+        # some services change the case of the output field name, so take the only attribute value
+        values = list(features[0]['attributes'].values()) if features else []
+
+        return values[0] if values and values[0] is not None else 0
+
+    def __changed_oids(self, mark, last_edit_date):
+        """
+        Return the object IDs of source features added or updated since a high-water mark, and the new mark.
+
+        :param mark: <dict> High-water mark from the previous sync
+        :param last_edit_date: <int> Source layer lastEditDate at the start of this sync
+        :return: <tuple> Set of object IDs, new high-water mark
+        """
+
+        if mark['type'] == 'serverGen':
+            changes, server_gen = self.src_feat_layer.extract_changes(mark['value'])
+            return set(changes['adds'] + changes['updates']), {'type': 'serverGen', 'value': server_gen}
+
+        # record the new mark before querying so that edits made during the sync are kept
+        new_mark = {'type': 'editDate', 'value': self.__edit_date_mark(last_edit_date)}
+        edit_date_field = self.src_feat_layer.definition()['editFieldsInfo']['editDateField']
+        # compare at whole-second precision; resending a feature edited in the same second is harmless
+        since = datetime.fromtimestamp(mark['value'] // 1000, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        where = "{0} >= TIMESTAMP '{1}'".format(edit_date_field, since)
+        oid_response = self.src_feat_layer.query(where=where, returnIdsOnly=True).json()
+
+        return set(oid_response['objectIds'] or []), new_mark
+
+    def __update_stream(self, attr_map, tgt_uid_field, changed_only=False, ignore_fields=(), use_store=False):
+        """
+        Yield update features built from matched source features, one at a time.
+
+        Each feature is remapped to target attribute names and given its target OID (required by REST
+        updateFeatures operation). With changed_only, features identical to their target feature (or, with
+        use_store, to their stored hash) are counted as unchanged and not yielded; with a state store they are
+        recorded in the store as they are found.
+
+        :param attr_map: <dict> Attribute map
+        :param tgt_uid_field: <str> Target unique ID field name
+        :param changed_only: <bool> Only yield features whose mapped attributes or geometry differ
+        :param ignore_fields: <iter> Target attribute names ignored when comparing features
+        :param use_store: <bool> Compare against hashes in the state store rather than target features
+        :return: <iterator> JSON features
+        """
+
+        tgt_oid_field = self.tgt_feat_layer.oid_field
+        src_index = self.comp_features['src']['index']
+        tgt_index = self.comp_features['tgt']['index']
+        skip_fields = self.__compare_skip_fields(ignore_fields)
+        stored = self.state_store.index() if changed_only and use_store else {}
+        tgt_features = ({f['attributes'][tgt_uid_field]: f for f in self.comp_features['tgt']['matched']}
+                        if changed_only and not use_store else {})
+        unchanged_records = []
+
+        for f in FeatureProcessor(self.comp_features['src']['matched']).transform(attr_map):
+            uid = f['attributes'][tgt_uid_field]
+            f['attributes'][tgt_oid_field] = tgt_index[uid]
+
+            if changed_only:
+                if use_store:
+                    changed = stored[uid][2] != self.__feature_hash(f, skip_fields)
+                else:
+                    # a target feature deleted since it was matched has no counterpart to compare; send the update
+                    changed = uid not in tgt_features or self.__is_changed(f, tgt_features[uid], skip_fields)
+
+                if not changed:
+                    self.sync_counts['unchanged'] += 1
+                    if self.state_store is not None and not use_store:
+                        # record unchanged features found by reading the target layer (first sync with a store)
+                        unchanged_records.append((uid, src_index[uid], tgt_index[uid],
+                                                  self.__feature_hash(f, skip_fields)))
+                        if len(unchanged_records) >= self.state_store.batch_size:
+                            self.state_store.upsert(unchanged_records)
+                            unchanged_records = []
+                    continue
+
+            yield f
+
+        if self.state_store is not None:
+            self.state_store.upsert(unchanged_records)
+
+    def __count_edits(self, count_name, edit_count, results, oids=None):
+        """
+        Add the edits that succeeded to a sync count and to self.synced_oids, and the rest to the failed count.
+
+        Edits without a result (e.g. a response with no results) are counted as failed.
+
+        :param count_name: <str> Count name; one of 'updated', 'added' or 'deleted'
+        :param edit_count: <int> Number of edits sent
+        :param results: <list> Edit results (e.g. updateResults), in the order the edits were sent
+        :param oids: <list> Object IDs recorded for each edit, in the same order; the result objectIds if None
+        :return: None
+        """
+
+        oids = [r.get('objectId') for r in results] if oids is None else oids
+        synced = [oid for oid, r in zip(oids, results) if r.get('success')]
+        self.sync_counts[count_name] += len(synced)
+        self.sync_counts['failed'] += edit_count - len(synced)
+        self.synced_oids[count_name].update(synced)
+
+    def __source_oids(self, features, tgt_uid_field):
+        """
+        Return the source object IDs of mapped features.
+
+        :param features: <list> Mapped features
+        :param tgt_uid_field: <str> Target unique ID field name
+        :return: <list> Source object IDs
+        """
+
+        src_index = self.comp_features['src']['index']
+
+        return [src_index[f['attributes'][tgt_uid_field]] for f in features]
+
+    def __fetch_deleted_features(self):
+        """
+        Read the mapped attributes (without geometry) of unmatched target features that hold only uid and OID.
+
+        Comparisons that only read uid and OID attributes (incremental, two_phase or store syncs) leave the target
+        features to delete without the attributes reported for them (see feature_mailer.FeatureMailer), so they are
+        read before they are deleted. Features already deleted from the target keep only their uid and OID.
+
+        :return: None
+        """
+
+        tgt_oid_field = self.tgt_feat_layer.oid_field
+        tgt_fields = sorted(set(v for k, v in self.__get_attr_map().items()) | {tgt_oid_field})
+        unmatched = self.comp_features['tgt']['unmatched']
+        fetched = {}
+
+        for where in oid_where_clauses(tgt_oid_field, [f['attributes'][tgt_oid_field] for f in unmatched]):
+            for f in self.tgt_feat_layer.iter_features(where=where, outFields=', '.join(tgt_fields),
+                                                       fidelity='attributes', prefetch=True):
+                fetched[f['attributes'][tgt_oid_field]] = f
+
+        self.comp_features['tgt']['unmatched'] = [fetched.get(f['attributes'][tgt_oid_field], f) for f in unmatched]
+
+    def __apply_edits_stream(self, update_features, add_features, delete_oids, tgt_uid_field, ignore_fields=(),
+                             n=500):
+        """
+        Apply edits to the target layer in applyEdits requests, one chunk of each edit type at a time.
+
+        With a state store, each chunk is recorded in the store (uid, OIDs and content hash) as it succeeds.
+
+        :param update_features: <iter> Mapped features to update (with target OIDs)
+        :param add_features: <iter> Mapped features to add
+        :param delete_oids: <list> Target OIDs to delete
+        :param tgt_uid_field: <str> Target unique ID field name
+        :param ignore_fields: <iter> Target attribute names not included in content hashes
+        :param n: <int> Chunk size per edit type
+        :return: None
+        """
+
+        src_index = self.comp_features['src']['index']
+        tgt_oid_field = self.tgt_feat_layer.oid_field
+        skip_fields = self.__compare_skip_fields(ignore_fields)
+        delete_uids = {f['attributes'][tgt_oid_field]: f['attributes'][tgt_uid_field]
+                       for f in self.comp_features['tgt']['unmatched']}
+
+        for updates, adds, deletes in zip_longest(chunk_iterable(update_features, n), chunk_iterable(add_features, n),
+                                                  chunk_iterable(delete_oids, n), fillvalue=[]):
+            result = self.tgt_feat_layer.apply_edits_batch(adds=adds, updates=updates, deletes=deletes, n=n)
+            self.__count_edits('updated', len(updates), result['updateResults'],
+                               self.__source_oids(updates, tgt_uid_field))
+            self.__count_edits('added', len(adds), result['addResults'], self.__source_oids(adds, tgt_uid_field))
+            self.__count_edits('deleted', len(deletes), result['deleteResults'])
+
+            if self.state_store is None:
+                continue
+
+            records = []
+            for f, r in zip(adds, result['addResults']):
+                if r.get('success'):
+                    uid = f['attributes'][tgt_uid_field]
+                    records.append((uid, src_index[uid], r['objectId'], self.__feature_hash(f, skip_fields)))
+            for f, r in zip(updates, result['updateResults']):
+                if r.get('success'):
+                    uid = f['attributes'][tgt_uid_field]
+                    records.append((uid, src_index[uid], f['attributes'][tgt_oid_field],
+                                    self.__feature_hash(f, skip_fields)))
+
+            self.state_store.upsert(records)
+            self.state_store.delete([delete_uids[r['objectId']] for r in result['deleteResults'] if r.get('success')])
 
     def __get_attr_map(self):
         """Return current, combined attribute map
@@ -110,67 +664,133 @@ class FeatureSyncer(object):
 
         return merge_dicts(self.auto_attr_mapper.attribute_map, self.cust_attr_mapper.attribute_map)
 
-    def __sync_one_way(self, src_uid_field, tgt_uid_field):
+    def __sync_one_way(self, src_uid_field, tgt_uid_field, use_apply_edits=False, incremental=False,
+                       change_tracking='auto', changed_only=False, ignore_fields=(), two_phase=False):
         """Sync features service features based on uid field matching.
 
         Feature in source not in target: feature added to target from source
         Feature in target not in source: delete feature from target
         Feature in source and target: update feature in target to match source
 
+        With incremental, only source features changed since the high-water mark saved by the previous sync are
+        updated, and the sync is skipped entirely if the source layer lastEditDate has not changed. The first
+        incremental sync (or one with a different change tracking type) compares all features.
+
+        Edits the target layer reports as failed are counted as failed rather than updated, added or deleted. If any
+        edit fails, the incremental high-water mark is not saved, so the next incremental sync retries the changes.
+        The object IDs of edits that succeeded are kept in self.synced_oids: source OIDs for 'updated' and 'added',
+        target OIDs for 'deleted'.
+
+        With a seeded self.state_store, the target layer is not read; matched and deleted target features come from
+        the store, and changed_only compares content hashes against the stored hashes. The store is seeded by the
+        first sync that compares all features and completes without failed edits; until then, every sync (including
+        an incremental one) compares all features. With a state_store, edits are always sent with applyEdits so that
+        the store is updated batch by batch as edits succeed.
+
+        With two_phase, features are first compared without geometry, and full source features are only fetched for
+        adds and for updates found from source edit dates (see .__comp_features_two_phase()).
+
         :param src_uid_field: <str> Source unique ID field name
         :param tgt_uid_field: <str> Target unique ID field name
-        :return: None
+        :param use_apply_edits: <bool> Send updates, adds and deletes together using applyEdits
+        :param incremental: <bool> Only sync source features changed since the previous sync
+        :param change_tracking: <str> Incremental change tracking type; one of 'auto', 'serverGen' or 'editDate'
+        :param changed_only: <bool> Only update target features whose mapped attributes or geometry differ
+        :param ignore_fields: <iter> Target attribute names ignored when comparing features
+        :param two_phase: <bool> Compare features without geometry before fetching full features
+        :return: <dict> Counts of unchanged, updated, added, deleted and failed features
         """
 
-        self.__comp_features(src_uid_field, tgt_uid_field)
+        self.sync_counts = {'unchanged': 0, 'updated': 0, 'added': 0, 'deleted': 0, 'failed': 0}
+        self.synced_oids = {'updated': set(), 'added': set(), 'deleted': set()}
+        # a store only stands in for the target layer once a full sync has recorded every target feature in it
+        use_store = self.state_store is not None and self.state_store.get_mark('seeded', False)
+        # only a full comparison without a store reads the mapped attributes of target features
+        partial_targets = use_store or two_phase
+
+        # compare all features in one pass, or without geometry first with two_phase
+        comp_features = self.__comp_features_two_phase if two_phase else self.__comp_features
+
+        if incremental:
+            state = self.__load_state()
+            last_edit_date = (self.src_feat_layer.refresh_definition().get('editingInfo') or {}).get('lastEditDate')
+
+            if last_edit_date is not None and state.get('lastEditDate') == last_edit_date:
+                logger.debug("Source layer has not been edited since last sync; skipping sync.")
+                return self.sync_counts
+
+            mark = state.get('mark')
+            change_tracking_type = self.__change_tracking_type(change_tracking)
+
+            # an unseeded store must see every feature, so it is seeded by a full comparison whatever the mark
+            if (mark is not None and mark['type'] == change_tracking_type and mark.get('value') is not None and
+                    (self.state_store is None or use_store)):
+                changed_oids, new_mark = self.__changed_oids(mark, last_edit_date)
+                partial_targets = True
+                self.__comp_features_incremental(src_uid_field, tgt_uid_field, changed_oids, use_store,
+                                                 changed_only)
+            else:
+                # no usable high-water mark; record one before reading so that edits made during the sync are kept
+                if change_tracking_type == 'serverGen':
+                    new_mark = {'type': 'serverGen', 'value': self.src_feat_layer.server_gen()}
+                else:
+                    new_mark = {'type': 'editDate', 'value': self.__edit_date_mark(last_edit_date)}
+                comp_features(src_uid_field, tgt_uid_field, use_store, changed_only)
+        else:
+            comp_features(src_uid_field, tgt_uid_field, use_store, changed_only)
+
+        if partial_targets:
+            self.__fetch_deleted_features()
 
         # get current attribute map
         attr_map = self.__get_attr_map()
 
-        # get oid field names
-        try:
-            src_oid_field = self.src_feat_layer.definition()['objectIdField']
-        except KeyError:
-            src_oid_field = 'OBJECTID'
-        try:
-            tgt_oid_field = self.tgt_feat_layer.definition()['objectIdField']
-        except KeyError:
-            tgt_oid_field = 'OBJECTID'
-
-        # make copies of update, add, and delete features before modification
-        update_features = deepcopy(self.comp_features['src']['matched'])
-        add_features = deepcopy(self.comp_features['src']['unmatched'])
-        delete_features = deepcopy(self.comp_features['tgt']['unmatched'])
-
-        logger.debug("Updating features ({0}).".format(len(update_features)))
-        if len(update_features) > 0:
-            # for update features, replace source OID with target OID (required by REST updateFeatures operation)
-            for f in update_features:
-                f['attributes'][src_oid_field] = self.comp_features['tgt']['index'][f['attributes'][src_uid_field]]
-            # create a feature processor to modify update features
-            update_fp = FeatureProcessor(update_features)
-            # remap field names
-            update_fp.replace_attributes(attr_map)
-            # update features in target feature layer
-            self.tgt_feat_layer.update_features_batch(features=update_fp.features)
-
-        logger.debug("Adding features ({0}).".format(len(add_features)))
-        if len(add_features) > 0:
-            # create a feature processor to modify add features
-            add_fp = FeatureProcessor(add_features)
-            # remove OID field (auto-generated on insert via REST addFeatures operation)
-            add_fp.replace_attributes(attr_map)
-            # add features to target feature layer
-            add_fp.remove_attributes([tgt_oid_field])
-            # remap field names
-            self.tgt_feat_layer.add_features_batch(features=add_fp.features)
-
-        logger.debug("Deleting features ({0}).".format(len(delete_features)))
-        if len(delete_features) > 0:
-            # create list of OIDs for target features to delete
-            delete_oids = ', '.join([str(f['attributes'][tgt_oid_field]) for f in delete_features])
-            # delete features from target feature layer
-            self.tgt_feat_layer.delete_features(objectIds=delete_oids)
+        # get oid field name
+        tgt_oid_field = self.tgt_feat_layer.oid_field
+
+        # build update and add payloads lazily in a single pass, without copying source features
+        update_features = self.__update_stream(attr_map, tgt_uid_field, changed_only, ignore_fields, use_store)
+        # remap field names and remove OID field (auto-generated on insert via REST addFeatures operation)
+        add_features = FeatureProcessor(self.comp_features['src']['unmatched']).transform(attr_map, [tgt_oid_field])
+        # create list of OIDs for target features to delete
+        delete_oids = [f['attributes'][tgt_oid_field] for f in self.comp_features['tgt']['unmatched']]
+
+        logger.debug("Updating features ({0}), adding features ({1}), deleting features ({2})."
+                     .format(len(self.comp_features['src']['matched']), len(self.comp_features['src']['unmatched']),
+                             len(delete_oids)))
+
+        if use_apply_edits or self.state_store is not None:
+            # send updates, adds and deletes to target feature layer in combined requests, one chunk at a time
+            self.__apply_edits_stream(update_features, add_features, delete_oids, tgt_uid_field, ignore_fields)
+        else:
+            # update, add and delete features in target feature layer, one chunk at a time
+            for c in chunk_iterable(update_features, 500):
+                response = self.tgt_feat_layer.update_features_batch(features=c)
+                self.__count_edits('updated', len(c), response.json().get('updateResults') or [],
+                                   self.__source_oids(c, tgt_uid_field))
+            for c in chunk_iterable(add_features, 500):
+                response = self.tgt_feat_layer.add_features_batch(features=c)
+                self.__count_edits('added', len(c), response.json().get('addResults') or [],
+                                   self.__source_oids(c, tgt_uid_field))
+            if len(delete_oids) > 0:
+                result = self.tgt_feat_layer.delete_features_batch(delete_oids, compress=True)
+                self.__count_edits('deleted', len(delete_oids), result['deleteResults'])
+
+        if changed_only:
+            logger.debug("Unchanged features ({0}).".format(self.sync_counts['unchanged']))
+
+        if self.state_store is not None and not use_store and self.sync_counts['failed'] == 0:
+            # every target feature is now recorded in the store, so later syncs use it in place of the target layer
+            self.state_store.set_mark('seeded', True)
+
+        if incremental:
+            # save the high-water mark only after all edits succeed, so that failed edits are retried by the next sync
+            if self.sync_counts['failed'] > 0:
+                logger.debug("Edits failed ({0}); high-water mark not saved.".format(self.sync_counts['failed']))
+            else:
+                self.__save_state({'lastEditDate': last_edit_date, 'mark': new_mark})
+
+        return self.sync_counts
 
     def __sync_two_way(self, src_uid_field, tgt_uid_field, reconcile_type):
         """Sync features service features based on uid field matching.
@@ -187,19 +807,38 @@ class FeatureSyncer(object):
 
         raise Exception('Two-way sync is not yet supported.')
 
-    def sync(self, src_uid_field, tgt_uid_field, sync_type='one-way', reconcile_type='source'):
+    def sync(self, src_uid_field, tgt_uid_field, sync_type='one-way', reconcile_type='source', use_apply_edits=False,
+             incremental=False, change_tracking='auto', changed_only=False, ignore_fields=(), two_phase=False):
         """
         Sync features between two feature services.
 
+        Incremental sync requires self.state_path or self.state_store, where the high-water mark is saved between
+        syncs. Changes are found with extractChanges server generations ('serverGen') or the editor tracking edit
+        date ('editDate').
+
+        With self.state_store, the target layer is read until a sync that compares all features completes without
+        failed edits; later syncs match source features against the features recorded in the store.
+
+        With two_phase, uid, OID and edit date attributes are compared first without geometry, and full features are
+        only fetched for adds and updates. Matched features whose source edit date is not later than the copy held by
+        the target (the mapped edit date attribute) are left unchanged.
+
         :param src_uid_field: <str> Source unique ID field name
         :param tgt_uid_field: <str> Target unique ID field name
         :param sync_type: <str> Synchronization type; one of 'one-way', 'two-way'
         :param reconcile_type: <str> feature layer type that will be favored; one of 'source' or 'target'
-        :return: None
+        :param use_apply_edits: <bool> Send edits to the target in combined applyEdits requests (one-way only)
+        :param incremental: <bool> Only sync source features changed since the previous sync (one-way only)
+        :param change_tracking: <str> Incremental change tracking type; one of 'auto', 'serverGen' or 'editDate'
+        :param changed_only: <bool> Only update target features whose mapped attributes or geometry differ
+        :param ignore_fields: <iter> Target attribute names ignored when comparing features
+        :param two_phase: <bool> Compare features without geometry before fetching full features (one-way only)
+        :return: <dict> Counts of unchanged, updated, added, deleted and failed features
         """
 
         if sync_type.lower() == 'one-way':
-            self.__sync_one_way(src_uid_field, tgt_uid_field)
+            return self.__sync_one_way(src_uid_field, tgt_uid_field, use_apply_edits, incremental, change_tracking,
+                                       changed_only, ignore_fields, two_phase)
         elif sync_type.lower() == 'two-way':
             self.__sync_two_way(src_uid_field, tgt_uid_field, reconcile_type)
         else:
@@ -0,0 +1,429 @@
+import sys
+import logging
+from array import array
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# mask values for a column position
+_PRESENT = 0
+_NULL = 1
+_ABSENT = 2
+
+# placeholder for features without a geometry key
+_NO_GEOMETRY = object()
+
+
+class _Column(object):
+    """Values of one attribute, stored in a typed array where possible.
+
+    Integers are stored in an array of signed 64-bit ints, floats in an array of doubles, and strings in a list of
+    interned strings; any other value (or a value that does not fit the array) moves the column to a plain list.
+    Null and absent positions are tracked in a mask that is only allocated once needed.
+    """
+
+    __slots__ = ('values', 'mask')
+
+    def __init__(self):
+        """
+        Class initializer.
+        """
+
+        self.values = None
+        self.mask = None
+
+    def __len__(self):
+        """
+        Get the number of positions in the column.
+
+        :return: <int> Length
+        """
+
+        if self.values is None:
+            return 0 if self.mask is None else len(self.mask)
+
+        return len(self.values)
+
+    @staticmethod
+    def __storage_for(value):
+        """
+        Return empty storage suited to value.
+
+        :param value: <object> First non-null value
+        :return: <array.array|list> Storage
+        """
+
+        if type(value) is int:
+            return array('q')
+        if type(value) is float:
+            return array('d')
+
+        return []
+
+    def __promote(self):
+        """
+        Move the column values from a typed array to a plain list.
+
+        :return: None
+        """
+
+        self.values = self.values.tolist()
+
+    def append(self, value, state=_PRESENT):
+        """
+        Append a value (or a null or absent position) to the column.
+
+        Storage is chosen when the first non-null value is appended; until then only the mask is kept.
+
+        :param value: <object> Value
+        :param state: <int> One of _PRESENT, _NULL or _ABSENT
+        :return: None
+        """
+
+        if value is None and state == _PRESENT:
+            state = _NULL
+
+        if state != _PRESENT:
+            if self.mask is None:
+                self.mask = bytearray(len(self))
+            self.mask.append(state)
+            if self.values is not None:
+                self.values.append(0 if isinstance(self.values, array) else None)
+            return
+
+        if self.values is None:
+            self.values = self.__storage_for(value)
+            placeholder = 0 if isinstance(self.values, array) else None
+            self.values.extend([placeholder] * len(self.mask or ()))
+
+        if self.mask is not None:
+            self.mask.append(_PRESENT)
+
+        if isinstance(self.values, array):
+            if type(value) is (int if self.values.typecode == 'q' else float):
+                try:
+                    self.values.append(value)
+                    return
+                except OverflowError:
+                    pass
+            self.__promote()
+
+        self.values.append(sys.intern(value) if type(value) is str else value)
+
+    def state(self, i):
+        """
+        Get whether a position holds a value, a null or is absent.
+
+        :param i: <int> Position
+        :return: <int> One of _PRESENT, _NULL or _ABSENT
+        """
+
+        return _PRESENT if self.mask is None else self.mask[i]
+
+    def get(self, i):
+        """
+        Get the value at a position (None for null or absent positions).
+
+        :param i: <int> Position
+        :return: <object> Value
+        """
+
+        return self.values[i] if self.state(i) == _PRESENT else None
+
+    def items(self):
+        """
+        Yield (state, value) for each position.
+
+        :return: <iterator> Tuples of (state, value)
+        """
+
+        if self.mask is None:
+            for v in self.values or ():
+                yield _PRESENT, v
+        elif self.values is None:
+            for s in self.mask:
+                yield s, None
+        else:
+            for s, v in zip(self.mask, self.values):
+                yield s, (v if s == _PRESENT else None)
+
+    @classmethod
+    def build(cls, items):
+        """
+        Return a new column from (state, value) tuples.
+
+        :param items: <iter> Tuples of (state, value)
+        :return: <feature_table._Column> Column
+        """
+
+        column = cls()
+        for s, v in items:
+            column.append(v, s)
+
+        return column
+
+
+class FeatureTable(object):
+    """Hold esri json features column-wise.
+
+    Numeric and date attributes are stored in typed arrays and strings are interned, so a large feature set uses
+    far less memory than one dict per feature. Features convert losslessly to and from esri json, including null
+    and missing attributes, and column operations (set, replace, rename, remove, date formatting) run column by
+    column.
+    """
+
+    def __init__(self, field_types=None):
+        """
+        Class initializer.
+
+        :param field_types: <dict> Map of field names to esri field types (e.g. FeatureLayer.field_types), optional
+        """
+
+        self.field_types = dict(field_types or {})
+        self.columns = {}
+        self.geometries = None
+        self.count = 0
+
+    @classmethod
+    def from_features(cls, features, field_types=None):
+        """
+        Return a new feature table holding features.
+
+        :param features: <iter> JSON features
+        :param field_types: <dict> Map of field names to esri field types, optional
+        :return: <feature_table.FeatureTable> Feature table
+        """
+
+        table = cls(field_types)
+        table.extend(features)
+
+        return table
+
+    def __len__(self):
+        """
+        Get the number of features.
+
+        :return: <int> Feature count
+        """
+
+        return self.count
+
+    def __iter__(self):
+        """
+        Iterate over features as esri json.
+
+        :return: <iterator> JSON features
+        """
+
+        return self.iter_features()
+
+    @property
+    def field_names(self):
+        """
+        Get attribute names, in the order they were first seen.
+
+        :return: <list> Attribute names
+        """
+
+        return list(self.columns)
+
+    @property
+    def date_fields(self):
+        """
+        Get attribute names of date fields.
+
+        :return: <list> Attribute names
+        """
+
+        return [k for k in self.columns if self.field_types.get(k) == 'esriFieldTypeDate']
+
+    def append(self, feature):
+        """
+        Append an esri json feature.
+
+        :param feature: <dict> JSON feature
+        :return: None
+        """
+
+        attributes = feature.get('attributes') or {}
+
+        for k, v in attributes.items():
+            if k not in self.columns:
+                column = _Column()
+                for _ in range(self.count):
+                    column.append(None, _ABSENT)
+                self.columns[k] = column
+
+        for k, column in self.columns.items():
+            if k in attributes:
+                column.append(attributes[k])
+            else:
+                column.append(None, _ABSENT)
+
+        if 'geometry' in feature:
+            if self.geometries is None:
+                self.geometries = [_NO_GEOMETRY] * self.count
+            self.geometries.append(feature['geometry'])
+        elif self.geometries is not None:
+            self.geometries.append(_NO_GEOMETRY)
+
+        self.count += 1
+
+    def extend(self, features):
+        """
+        Append esri json features.
+
+        :param features: <iter> JSON features
+        :return: None
+        """
+
+        for f in features:
+            self.append(f)
+
+    def feature(self, i):
+        """
+        Get one feature as esri json.
+
+        :param i: <int> Feature position
+        :return: <dict> JSON feature
+        """
+
+        attributes = {}
+        for k, column in self.columns.items():
+            state = column.state(i)
+            if state != _ABSENT:
+                attributes[k] = column.values[i] if state == _PRESENT else None
+
+        feature = {'attributes': attributes}
+        if self.geometries is not None and self.geometries[i] is not _NO_GEOMETRY:
+            feature['geometry'] = self.geometries[i]
+
+        return feature
+
+    def iter_features(self):
+        """
+        Yield features as esri json, one at a time.
+
+        :return: <iterator> JSON features
+        """
+
+        for i in range(self.count):
+            yield self.feature(i)
+
+    def to_features(self):
+        """
+        Get features as esri json.
+
+        :return: <list> JSON features
+        """
+
+        return list(self.iter_features())
+
+    def column(self, attribute_name):
+        """
+        Get the values of an attribute (None for null or missing values).
+
+        :param attribute_name: <str> Attribute name
+        :return: <list> Values
+        """
+
+        return [v for s, v in self.columns[attribute_name].items()]
+
+    def index(self, key_attribute_name, value_attribute_name):
+        """
+        Get a map of one attribute's values to another's, e.g. unique ID to OID.
+
+        :param key_attribute_name: <str> Key attribute name
+        :param value_attribute_name: <str> Value attribute name
+        :return: <dict> Index
+        """
+
+        return dict(zip(self.column(key_attribute_name), self.column(value_attribute_name)))
+
+    def remove_attributes(self, attribute_names=[]):
+        """
+        Remove attributes from all features.
+
+        :param attribute_names: <list> Attribute names
+        :return: None
+        """
+
+        for a in attribute_names:
+            self.columns.pop(a)
+
+    def add_attributes(self, attribute_map={}):
+        """
+        Add attributes (with default values) to all features.
+
+        :param attribute_map: <dict> Map of attribute names to default values
+        :return: None
+        """
+
+        for k in attribute_map:
+            if k in self.columns:
+                raise Exception('Field {0} already exists in feature'.format(k))
+
+        for k, v in attribute_map.items():
+            self.set_values(k, v)
+
+    def replace_attributes(self, replace_map={}):
+        """
+        Replace attribute names with new attribute names, keeping values.
+
+        :param replace_map: <dict> Map of old attribute names to new attribute names
+        :return: None
+        """
+
+        clean_map = {k: v for k, v in replace_map.items() if k != v}
+
+        for v in clean_map.values():
+            if v in self.columns:
+                raise Exception('Field {0} already exists in feature'.format(v))
+
+        renamed = {v: self.columns.pop(k) for k, v in clean_map.items()}
+        self.columns.update(renamed)
+        for k, v in clean_map.items():
+            if k in self.field_types:
+                self.field_types[v] = self.field_types.pop(k)
+
+    def replace_values(self, value_map={}, attribute_names=None):
+        """
+        Replace all occurrences of old values with new values.
+
+        :param value_map: <dict> Map of old values to new values
+        :param attribute_names: <list> Attribute names to replace values in; defaults to all attributes
+        :return: None
+        """
+
+        for k in self.columns if attribute_names is None else attribute_names:
+            column = self.columns[k]
+            if any(v in value_map for s, v in column.items() if s != _ABSENT):
+                self.columns[k] = _Column.build((_PRESENT, value_map[v]) if s != _ABSENT and v in value_map else (s, v)
+                                                for s, v in column.items())
+
+    def set_values(self, attribute_name, value):
+        """
+        Set the value of an attribute for all features.
+
+        :param attribute_name: <str> Attribute name
+        :param value: <object> Attribute value
+        :return: None
+        """
+
+        self.columns[attribute_name] = _Column.build((_PRESENT, value) for _ in range(self.count))
+
+    def format_dates(self, attribute_names=None, date_format='%Y-%m-%d', tz=None):
+        """
+        Replace date values (milliseconds since epoch) with formatted date strings.
+
+        :param attribute_names: <list> Date attribute names; defaults to self.date_fields
+        :param date_format: <str> strftime format
+        :param tz: <datetime.tzinfo> Time zone dates are formatted in; defaults to local time
+        :return: None
+        """
+
+        for k in self.date_fields if attribute_names is None else attribute_names:
+            self.columns[k] = _Column.build(
+                (s, datetime.fromtimestamp(v / 1e3, tz).strftime(date_format) if v is not None else v)
+                for s, v in self.columns[k].items())
+            self.field_types[k] = 'esriFieldTypeString'
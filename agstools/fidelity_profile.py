@@ -0,0 +1,93 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FidelityProfile(object):
+    """Describe the geometry fidelity a job needs from feature layer queries.
+
+    A profile translates to query parameters (returnGeometry, geometryPrecision, maxAllowableOffset, returnZ,
+    returnM and quantizationParameters), so that each job downloads only the precision it uses. Named profiles:
+
+    'full': full-fidelity geometry (no parameters)
+    'attributes': no geometry
+    'compare': geometry rounded to 8 decimal places, the precision used by FeatureSyncer change detection
+    """
+
+    NAMED = {'full': {},
+             'attributes': {'return_geometry': False},
+             'compare': {'geometry_precision': 8}}
+
+    def __init__(self, return_geometry=True, geometry_precision=None, max_allowable_offset=None, return_z=None,
+                 return_m=None, quantization_tolerance=None, quantization_origin='upperLeft', quantization_extent=None):
+        """
+        Class initializer.
+
+        :param return_geometry: <bool> Include geometry
+        :param geometry_precision: <int> Number of decimal places in returned coordinates, optional
+        :param max_allowable_offset: <float> Generalize geometry to this deviation (in output units), optional
+        :param return_z: <bool> Include z values (None leaves the service default)
+        :param return_m: <bool> Include m values (None leaves the service default)
+        :param quantization_tolerance: <float> Quantize coordinates to this resolution (in output units), optional
+        :param quantization_origin: <str> Quantization origin; one of 'upperLeft' or 'lowerLeft'
+        :param quantization_extent: <dict> Quantization extent; defaults to the layer extent
+        """
+
+        self.return_geometry = return_geometry
+        self.geometry_precision = geometry_precision
+        self.max_allowable_offset = max_allowable_offset
+        self.return_z = return_z
+        self.return_m = return_m
+        self.quantization_tolerance = quantization_tolerance
+        self.quantization_origin = quantization_origin
+        self.quantization_extent = quantization_extent
+
+    @classmethod
+    def named(cls, name):
+        """
+        Return a named profile.
+
+        :param name: <str> Profile name; one of 'full', 'attributes' or 'compare'
+        :return: <fidelity_profile.FidelityProfile> Profile
+        """
+
+        try:
+            return cls(**cls.NAMED[name])
+        except KeyError:
+            raise Exception('Fidelity profile {0} not recognized.'.format(name))
+
+    def params(self, feature_layer=None):
+        """
+        Get query parameters for the profile.
+
+        :param feature_layer: <feature_layer.FeatureLayer> Layer queried; supplies the default quantization extent
+        :return: <dict> Feature service query operation parameters
+        """
+
+        if not self.return_geometry:
+            return {'returnGeometry': 'false'}
+
+        params = {}
+
+        if self.geometry_precision is not None:
+            params['geometryPrecision'] = self.geometry_precision
+        if self.max_allowable_offset is not None:
+            params['maxAllowableOffset'] = self.max_allowable_offset
+        if self.return_z is not None:
+            params['returnZ'] = str(bool(self.return_z)).lower()
+        if self.return_m is not None:
+            params['returnM'] = str(bool(self.return_m)).lower()
+
+        if self.quantization_tolerance is not None:
+            quantization = {'mode': 'view',
+                            'originPosition': self.quantization_origin,
+                            'tolerance': self.quantization_tolerance}
+            extent = self.quantization_extent
+            if extent is None and feature_layer is not None:
+                extent = feature_layer.definition().get('extent')
+            if extent is not None:
+                quantization['extent'] = extent
+            params['quantizationParameters'] = json.dumps(quantization)
+
+        return params
@@ -0,0 +1,304 @@
+import logging
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+def _pack(coordinates, dims=None):
+    """
+    Return coordinates as a packed array (a NumPy array when available, otherwise a list of lists).
+
+    :param coordinates: <list> Coordinates as [x, y, ...] lists
+    :param dims: <int> Number of dimensions to keep (2 or 3); all if None
+    :return: <numpy.ndarray|list> Packed coordinates
+    """
+
+    if np is not None:
+        try:
+            packed = np.asarray(coordinates, dtype=float)
+        except (TypeError, ValueError):
+            # ragged or null coordinates; fall through to lists
+            pass
+        else:
+            if packed.ndim == 2:
+                return packed[:, :dims] if dims else packed
+
+    return [list(c[:dims]) if dims else list(c) for c in coordinates]
+
+
+def _unpack(packed):
+    """
+    Return packed coordinates as a list of lists.
+
+    :param packed: <numpy.ndarray|list> Packed coordinates
+    :return: <list> Coordinates
+    """
+
+    return packed.tolist() if np is not None and isinstance(packed, np.ndarray) else packed
+
+
+def _reverse(packed):
+    """
+    Return packed coordinates in reverse order.
+
+    :param packed: <numpy.ndarray|list> Packed coordinates
+    :return: <numpy.ndarray|list> Packed coordinates
+    """
+
+    return packed[::-1]
+
+
+def _close(packed):
+    """
+    Return packed ring coordinates with the first coordinate repeated at the end, if not already.
+
+    :param packed: <numpy.ndarray|list> Packed ring coordinates
+    :return: <numpy.ndarray|list> Packed ring coordinates
+    """
+
+    if len(packed) == 0:
+        return packed
+
+    if np is not None and isinstance(packed, np.ndarray):
+        if not np.array_equal(packed[0, :2], packed[-1, :2]):
+            packed = np.vstack([packed, packed[:1]])
+    elif packed[0][:2] != packed[-1][:2]:
+        packed = packed + [packed[0]]
+
+    return packed
+
+
+def _signed_area(packed):
+    """
+    Return the signed area of a closed ring; positive for counter-clockwise rings.
+
+    :param packed: <numpy.ndarray|list> Packed ring coordinates
+    :return: <float> Signed area
+    """
+
+    if np is not None and isinstance(packed, np.ndarray):
+        x = packed[:, 0]
+        y = packed[:, 1]
+        return 0.5 * float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+
+    return 0.5 * sum(packed[i][0] * packed[i + 1][1] - packed[i + 1][0] * packed[i][1]
+                     for i in range(len(packed) - 1))
+
+
+def _contains(packed, point):
+    """
+    Check whether a point falls inside a closed ring (even-odd rule).
+
+    :param packed: <numpy.ndarray|list> Packed ring coordinates
+    :param point: <list> Point as [x, y, ...]
+    :return: <bool>
+    """
+
+    x0, y0 = point[0], point[1]
+
+    if np is not None and isinstance(packed, np.ndarray):
+        xi, yi = packed[:-1, 0], packed[:-1, 1]
+        xj, yj = packed[1:, 0], packed[1:, 1]
+        crosses = (yi > y0) != (yj > y0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = (xj - xi) * (y0 - yi) / (yj - yi) + xi
+        return bool(np.count_nonzero(crosses & (x0 < x_cross)) % 2)
+
+    inside = False
+    for i in range(len(packed) - 1):
+        xi, yi = packed[i][0], packed[i][1]
+        xj, yj = packed[i + 1][0], packed[i + 1][1]
+        if (yi > y0) != (yj > y0) and x0 < (xj - xi) * (y0 - yi) / (yj - yi) + xi:
+            inside = not inside
+
+    return inside
+
+
+def _polygons(rings, dims=None):
+    """
+    Return GeoJSON polygons (lists of rings) from ESRI rings.
+
+    ESRI exterior rings are clockwise and holes counter-clockwise; GeoJSON (RFC 7946) exterior rings are
+    counter-clockwise and holes clockwise. Each hole is assigned to the smallest exterior ring containing it. Holes
+    outside every exterior ring, and rings of a geometry with no clockwise rings, are written as exterior rings.
+    Every ring is written in the orientation its role requires, whatever its input winding.
+
+    :param rings: <list> ESRI rings
+    :param dims: <int> Number of dimensions to keep; all if None
+    :return: <list> Polygons as lists of packed rings (exterior first)
+    """
+
+    exteriors = []
+    holes = []
+
+    for ring in rings:
+        packed = _close(_pack(ring, dims))
+        if len(packed) < 4:
+            continue
+        area = _signed_area(packed)
+        # store exteriors counter-clockwise and holes clockwise (GeoJSON orientation)
+        if area < 0:
+            exteriors.append((-area, _reverse(packed)))
+        else:
+            holes.append((area, _reverse(packed)))
+
+    if not exteriors:
+        exteriors, holes = [(area, _reverse(packed)) for area, packed in holes], []
+
+    polygons = [[packed] for area, packed in exteriors]
+
+    for hole_area, hole in holes:
+        containing = [i for i, (area, exterior) in enumerate(exteriors)
+                      if area >= hole_area and _contains(exterior, hole[0])]
+        if containing:
+            i = min(containing, key=lambda j: exteriors[j][0])
+            polygons[i].append(hole)
+        else:
+            polygons.append([_reverse(hole)])
+
+    return polygons
+
+
+def _dimensions(geometry):
+    """
+    Return the number of coordinate dimensions to keep for a geometry.
+
+    GeoJSON positions cannot carry M values, so M is dropped from [x, y, m] and [x, y, z, m] coordinates.
+
+    :param geometry: <dict> ESRI JSON geometry
+    :return: <int> Number of dimensions, or None to keep all
+    """
+
+    if geometry.get('hasM'):
+        return 3 if geometry.get('hasZ') else 2
+
+    return None
+
+
+def esri_to_geojson_geometry(geometry):
+    """
+    Return the GeoJSON equivalent of an ESRI JSON geometry.
+
+    Points, multipoints, polylines, polygons and envelopes are supported. Polylines with several paths become
+    MultiLineStrings and polygons with several exterior rings become MultiPolygons. Empty geometries return None.
+
+    :param geometry: <dict> ESRI JSON geometry
+    :return: <dict> GeoJSON geometry, or None
+    """
+
+    if not geometry:
+        return None
+
+    dims = _dimensions(geometry)
+
+    if 'x' in geometry:
+        if geometry['x'] is None or geometry['x'] == 'NaN':
+            return None
+        coordinates = [geometry['x'], geometry['y']]
+        if geometry.get('z') is not None:
+            coordinates.append(geometry['z'])
+        return {'type': 'Point', 'coordinates': coordinates}
+
+    if 'points' in geometry:
+        if not geometry['points']:
+            return None
+        return {'type': 'MultiPoint', 'coordinates': _unpack(_pack(geometry['points'], dims))}
+
+    if 'paths' in geometry:
+        paths = [_unpack(_pack(path, dims)) for path in geometry['paths'] if path]
+        if not paths:
+            return None
+        if len(paths) == 1:
+            return {'type': 'LineString', 'coordinates': paths[0]}
+        return {'type': 'MultiLineString', 'coordinates': paths}
+
+    if 'rings' in geometry:
+        polygons = [[_unpack(ring) for ring in polygon] for polygon in _polygons(geometry['rings'], dims)]
+        if not polygons:
+            return None
+        if len(polygons) == 1:
+            return {'type': 'Polygon', 'coordinates': polygons[0]}
+        return {'type': 'MultiPolygon', 'coordinates': polygons}
+
+    if 'xmin' in geometry:
+        if geometry['xmin'] is None or geometry['xmin'] == 'NaN':
+            return None
+        xmin, ymin, xmax, ymax = geometry['xmin'], geometry['ymin'], geometry['xmax'], geometry['ymax']
+        return {'type': 'Polygon',
+                'coordinates': [[[xmin, ymin], [xmax, ymin], [xmax, ymax], [xmin, ymax], [xmin, ymin]]]}
+
+    if 'curvePaths' in geometry or 'curveRings' in geometry:
+        raise Exception('Curve geometries are not supported; query with returnTrueCurves=false.')
+
+    raise Exception('There is no conversion for the specified ESRI geometry.')
+
+
+def esri_to_geojson_feature(feature):
+    """
+    Return the GeoJSON equivalent of an ESRI JSON feature.
+
+    :param feature: <dict> ESRI JSON feature
+    :return: <dict> GeoJSON feature
+    """
+
+    return {'type': 'Feature',
+            'geometry': esri_to_geojson_geometry(feature.get('geometry')),
+            'properties': feature.get('attributes') or {}}
+
+
+def _dequantize_part(part, transform, deltas):
+    """
+    Return dequantized coordinates for one part (path, ring or point list).
+
+    :param part: <list> Quantized coordinates
+    :param transform: <dict> Query result transform
+    :param deltas: <bool> Coordinates after the first are offsets from the previous coordinate
+    :return: <list> Coordinates
+    """
+
+    x_scale, y_scale = transform['scale'][:2]
+    x_translate, y_translate = transform['translate'][:2]
+    upper_left = transform.get('originPosition', 'upperLeft') == 'upperLeft'
+    x = y = 0
+    coordinates = []
+
+    for c in part:
+        x, y = (x + c[0], y + c[1]) if deltas else (c[0], c[1])
+        coordinates.append([x * x_scale + x_translate,
+                            y_translate - y * y_scale if upper_left else y * y_scale + y_translate] + list(c[2:]))
+
+    return coordinates
+
+
+def dequantize_geometry(geometry, transform):
+    """
+    Return an ESRI JSON geometry from a quantized query result (quantizationParameters) in map coordinates.
+
+    Point coordinates are absolute; within each multipoint, path and ring, coordinates after the first are offsets
+    from the previous coordinate.
+
+    :param geometry: <dict> Quantized ESRI JSON geometry
+    :param transform: <dict> Query result transform (originPosition, scale and translate)
+    :return: <dict> ESRI JSON geometry
+    """
+
+    if not geometry:
+        return geometry
+
+    geometry = dict(geometry)
+
+    if 'x' in geometry:
+        if geometry['x'] is not None and geometry['x'] != 'NaN':
+            geometry['x'], geometry['y'] = _dequantize_part([[geometry['x'], geometry['y']]], transform, False)[0]
+    elif 'points' in geometry:
+        geometry['points'] = _dequantize_part(geometry['points'], transform, True)
+    else:
+        for key in ('paths', 'rings'):
+            if key in geometry:
+                geometry[key] = [_dequantize_part(part, transform, True) for part in geometry[key]]
+
+    return geometry
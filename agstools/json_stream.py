@@ -0,0 +1,199 @@
+import re
+import json
+import codecs
+import logging
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = ' \t\n\r'
+_decoder = json.JSONDecoder()
+_STRUCTURE = re.compile(r'[{}\[\]"]')
+_STRING_END = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[,\]}\s]')
+
+
+class _ChunkReader(object):
+    """Buffer decoded text from an iterable of byte chunks for incremental JSON parsing."""
+
+    def __init__(self, chunks):
+        """
+        Class initializer.
+
+        :param chunks: <iter> Iterable of bytes (e.g. requests.Response.iter_content())
+        """
+
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """
+        Append the next chunk to the buffer, discarding text that has already been parsed.
+
+        :return: <bool> False if there is no more data
+        """
+
+        if self.eof:
+            return False
+
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.eof = True
+            self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(b'', final=True)
+            self.pos = 0
+            return False
+
+        self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Return the next non-whitespace character without consuming it.
+
+        :return: <str> Character
+        """
+
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError('Unexpected end of JSON document.')
+
+    def expect(self, characters):
+        """
+        Consume the next non-whitespace character, which must be one of characters.
+
+        :param characters: <str> Allowed characters
+        :return: <str> Character
+        """
+
+        c = self.peek()
+        if c not in characters:
+            raise ValueError('Expected one of {0!r} at position {1}, found {2!r}.'.format(characters, self.pos, c))
+        self.pos += 1
+        return c
+
+    def __scan(self, offset, depth, string):
+        """
+        Scan the buffer for the end of the object, array or string starting at self.pos.
+
+        Scanning resumes from a previous scan state, so each character is only scanned once however many chunks the
+        value spans.
+
+        :param offset: <int> Scan position, relative to self.pos
+        :param depth: <int> Number of open objects and arrays at the scan position
+        :param string: <bool> Whether the scan position is inside a string
+        :return: <tuple> Buffer index just past the end of the value (None if the value continues past the buffer),
+                         and the scan state (offset, depth, string) to resume from
+        """
+
+        buffer = self.buffer
+        i = self.pos + offset
+
+        while True:
+            if string:
+                m = _STRING_END.search(buffer, i)
+                if m is None:
+                    i = len(buffer)
+                    break
+                if m.group() == '\\':
+                    # skip the escaped character, or rescan from the backslash once it has arrived
+                    if m.end() == len(buffer):
+                        i = m.start()
+                        break
+                    i = m.end() + 1
+                    continue
+                string = False
+                i = m.end()
+                if depth == 0:
+                    return i, None
+            else:
+                m = _STRUCTURE.search(buffer, i)
+                if m is None:
+                    i = len(buffer)
+                    break
+                c = m.group()
+                i = m.end()
+                if c == '"':
+                    string = True
+                elif c in '{[':
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return i, None
+
+        return None, (i - self.pos, depth, string)
+
+    def value(self):
+        """
+        Consume and return the next complete JSON value.
+
+        More chunks are read until the end of the value has been found, then the value is decoded once.
+
+        :return: <object> Decoded value
+        """
+
+        if self.peek() in '{["':
+            state = (0, 0, False)
+            while True:
+                end, state = self.__scan(*state)
+                if end is not None:
+                    break
+                if not self.fill():
+                    raise ValueError('Unexpected end of JSON document.')
+        else:
+            # a number or literal ends at the next delimiter, which may be in a later chunk
+            while _SCALAR_END.search(self.buffer, self.pos) is None and self.fill():
+                pass
+
+        obj, self.pos = _decoder.raw_decode(self.buffer, self.pos)
+
+        return obj
+
+
+def iter_array_items(chunks, key='features', members=None):
+    """
+    Yield the items of a top-level array member of a JSON object as they are decoded from a byte stream.
+
+    Only one item is held in memory at a time. Other top-level members are decoded whole and, if members is given,
+    stored in it (e.g. 'exceededTransferLimit' or 'error').
+
+    :param chunks: <iter> Iterable of bytes (e.g. requests.Response.iter_content())
+    :param key: <str> Name of the top-level array member
+    :param members: <dict> Dict to receive the other top-level members, optional
+    :return: <iterator> Decoded array items
+    """
+
+    reader = _ChunkReader(chunks)
+    reader.expect('{')
+
+    if reader.peek() == '}':
+        return
+
+    while True:
+        name = reader.value()
+        reader.expect(':')
+
+        if name == key and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            value = reader.value()
+            if members is not None:
+                members[name] = value
+
+        if reader.expect(',}') == '}':
+            return
@@ -0,0 +1,442 @@
+import struct
+import logging
+
+logger = logging.getLogger(__name__)
+
+# FeatureCollectionPBuffer enums (esri FeatureCollection.proto)
+_GEOMETRY_TYPES = {0: 'esriGeometryPoint',
+                   1: 'esriGeometryMultipoint',
+                   2: 'esriGeometryPolyline',
+                   3: 'esriGeometryPolygon',
+                   4: 'esriGeometryMultiPatch',
+                   127: 'esriGeometryNull'}
+
+_FIELD_TYPES = {0: 'esriFieldTypeSmallInteger',
+                1: 'esriFieldTypeInteger',
+                2: 'esriFieldTypeSingle',
+                3: 'esriFieldTypeDouble',
+                4: 'esriFieldTypeString',
+                5: 'esriFieldTypeDate',
+                6: 'esriFieldTypeOID',
+                7: 'esriFieldTypeGeometry',
+                8: 'esriFieldTypeBlob',
+                9: 'esriFieldTypeRaster',
+                10: 'esriFieldTypeGUID',
+                11: 'esriFieldTypeGlobalID',
+                12: 'esriFieldTypeXML',
+                13: 'esriFieldTypeBigInteger',
+                14: 'esriFieldTypeDateOnly',
+                15: 'esriFieldTypeTimeOnly',
+                16: 'esriFieldTypeTimestampOffset'}
+
+_UPPER_LEFT = 0
+_LOWER_LEFT = 1
+
+# wire types
+_VARINT = 0
+_FIXED64 = 1
+_BYTES = 2
+_FIXED32 = 5
+
+
+def _read_varint(buf, pos):
+    """
+    Read a base 128 varint.
+
+    :param buf: <memoryview> Message buffer
+    :param pos: <int> Start position
+    :return: <tuple> Value, next position
+    """
+
+    result = 0
+    shift = 0
+
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value):
+    """
+    Decode a zigzag-encoded (sint32/sint64) value.
+
+    :param value: <int> Encoded value
+    :return: <int> Value
+    """
+
+    return (value >> 1) ^ -(value & 1)
+
+
+def _signed(value):
+    """
+    Decode a two's complement (int32/int64) varint value.
+
+    :param value: <int> Encoded value
+    :return: <int> Value
+    """
+
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _iter_fields(buf):
+    """
+    Yield the fields of a message.
+
+    Length-delimited values are returned as memoryview slices, fixed-size values as bytes and varints as ints.
+
+    :param buf: <memoryview> Message buffer
+    :return: <iterator> Tuples of (field number, wire type, value)
+    """
+
+    pos = 0
+    end = len(buf)
+
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field_number = key >> 3
+        wire_type = key & 0x7
+
+        if wire_type == _VARINT:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == _BYTES:
+            length, pos = _read_varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        elif wire_type == _FIXED64:
+            value = bytes(buf[pos:pos + 8])
+            pos += 8
+        elif wire_type == _FIXED32:
+            value = bytes(buf[pos:pos + 4])
+            pos += 4
+        else:
+            raise Exception('Unsupported protocol buffer wire type {0}.'.format(wire_type))
+
+        yield field_number, wire_type, value
+
+
+def _packed_varints(wire_type, value):
+    """
+    Return the values of a repeated varint field entry (packed or not).
+
+    :param wire_type: <int> Wire type
+    :param value: <int|memoryview> Field value
+    :return: <list> Values
+    """
+
+    if wire_type == _VARINT:
+        return [value]
+
+    values = []
+    pos = 0
+    end = len(value)
+
+    while pos < end:
+        v, pos = _read_varint(value, pos)
+        values.append(v)
+
+    return values
+
+
+def _string(value):
+    """
+    Decode a string field value.
+
+    :param value: <memoryview> Field value
+    :return: <str> String
+    """
+
+    return bytes(value).decode('utf-8')
+
+
+def _decode_value(buf):
+    """
+    Decode a Value message; an empty message is a null value.
+
+    :param buf: <memoryview> Message buffer
+    :return: <object> Value
+    """
+
+    for field_number, wire_type, value in _iter_fields(buf):
+        if field_number == 1:
+            return _string(value)
+        if field_number == 2:
+            return struct.unpack('<f', value)[0]
+        if field_number == 3:
+            return struct.unpack('<d', value)[0]
+        if field_number in (4, 8):
+            return _zigzag(value)
+        if field_number in (5, 7):
+            return value
+        if field_number == 6:
+            return _signed(value)
+        if field_number == 9:
+            return bool(value)
+
+    return None
+
+
+def _decode_message(buf, decoders):
+    """
+    Decode a message of scalar and string fields.
+
+    :param buf: <memoryview> Message buffer
+    :param decoders: <dict> Map of field number to (name, decode function)
+    :return: <dict> Decoded fields
+    """
+
+    result = {}
+
+    for field_number, wire_type, value in _iter_fields(buf):
+        if field_number in decoders:
+            name, decode = decoders[field_number]
+            result[name] = decode(value)
+
+    return result
+
+
+def _double(value):
+    """
+    Decode a double field value.
+
+    :param value: <bytes> Field value
+    :return: <float> Value
+    """
+
+    return struct.unpack('<d', value)[0]
+
+
+def _decode_field(buf):
+    """
+    Decode a Field message as an ESRI JSON field.
+
+    :param buf: <memoryview> Message buffer
+    :return: <dict> Field
+    """
+
+    field = _decode_message(buf, {1: ('name', _string),
+                                  2: ('type', lambda v: _FIELD_TYPES.get(v, v)),
+                                  3: ('alias', _string)})
+    field.setdefault('type', _FIELD_TYPES[0])
+
+    return field
+
+
+def _decode_spatial_reference(buf):
+    """
+    Decode a SpatialReference message.
+
+    :param buf: <memoryview> Message buffer
+    :return: <dict> Spatial reference
+    """
+
+    return _decode_message(buf, {1: ('wkid', int),
+                                 2: ('latestWkid', int),
+                                 3: ('vcsWkid', int),
+                                 4: ('latestVcsWkid', int),
+                                 5: ('wkt', _string)})
+
+
+def _decode_transform(buf):
+    """
+    Decode a Transform message.
+
+    :param buf: <memoryview> Message buffer
+    :return: <dict> Transform with origin, scale (x, y, m, z) and translate (x, y, m, z)
+    """
+
+    transform = {'origin': _UPPER_LEFT, 'scale': [1.0, 1.0, 1.0, 1.0], 'translate': [0.0, 0.0, 0.0, 0.0]}
+
+    for field_number, wire_type, value in _iter_fields(buf):
+        if field_number == 1:
+            transform['origin'] = value
+        elif field_number in (2, 3):
+            target = transform['scale' if field_number == 2 else 'translate']
+            for i, w, v in _iter_fields(value):
+                if 1 <= i <= 4:
+                    target[i - 1] = _double(v)
+
+    return transform
+
+
+def _decode_coords(buf, has_z, has_m, transform):
+    """
+    Decode a Geometry message into dequantized vertices and part lengths.
+
+    Coordinates are zigzag-encoded deltas from the previous vertex, per dimension, across all parts.
+
+    :param buf: <memoryview> Message buffer
+    :param has_z: <bool> Vertices include z values
+    :param has_m: <bool> Vertices include m values
+    :param transform: <dict> Quantization transform
+    :return: <tuple> List of vertices, list of part lengths
+    """
+
+    lengths = []
+    coords = []
+
+    for field_number, wire_type, value in _iter_fields(buf):
+        if field_number == 2:
+            lengths.extend(_packed_varints(wire_type, value))
+        elif field_number == 3:
+            coords.extend(_zigzag(v) for v in _packed_varints(wire_type, value))
+
+    dims = 2 + bool(has_z) + bool(has_m)
+    x_scale, y_scale, m_scale, z_scale = transform['scale']
+    x_translate, y_translate, m_translate, z_translate = transform['translate']
+    upper_left = transform['origin'] == _UPPER_LEFT
+    totals = [0] * dims
+    vertices = []
+
+    for i in range(0, len(coords) - dims + 1, dims):
+        for d in range(dims):
+            totals[d] += coords[i + d]
+
+        y = y_translate - totals[1] * y_scale if upper_left else totals[1] * y_scale + y_translate
+        vertex = [totals[0] * x_scale + x_translate, y]
+        if has_z:
+            vertex.append(totals[2] * z_scale + z_translate)
+        if has_m:
+            vertex.append(totals[-1] * m_scale + m_translate)
+        vertices.append(vertex)
+
+    return vertices, lengths
+
+
+def _decode_geometry(buf, geometry_type, has_z, has_m, transform):
+    """
+    Decode a Geometry message as an ESRI JSON geometry.
+
+    :param buf: <memoryview> Message buffer
+    :param geometry_type: <str> ESRI geometry type
+    :param has_z: <bool> Vertices include z values
+    :param has_m: <bool> Vertices include m values
+    :param transform: <dict> Quantization transform
+    :return: <dict> ESRI JSON geometry
+    """
+
+    vertices, lengths = _decode_coords(buf, has_z, has_m, transform)
+
+    if geometry_type == 'esriGeometryPoint':
+        if not vertices:
+            return None
+        geometry = {'x': vertices[0][0], 'y': vertices[0][1]}
+        if has_z:
+            geometry['z'] = vertices[0][2]
+        if has_m:
+            geometry['m'] = vertices[0][-1]
+        return geometry
+
+    if geometry_type == 'esriGeometryMultipoint':
+        geometry = {'points': vertices}
+    else:
+        parts = []
+        start = 0
+        for length in lengths or [len(vertices)]:
+            parts.append(vertices[start:start + length])
+            start += length
+        geometry = {'rings' if geometry_type == 'esriGeometryPolygon' else 'paths': parts}
+
+    if has_z:
+        geometry['hasZ'] = True
+    if has_m:
+        geometry['hasM'] = True
+
+    return geometry
+
+
+def _decode_feature_result(buf):
+    """
+    Decode a FeatureResult message as an ESRI JSON query result.
+
+    :param buf: <memoryview> Message buffer
+    :return: <dict> Query result
+    """
+
+    result = {'fields': [], 'features': []}
+    geometry_type = _GEOMETRY_TYPES[0]
+    # coordinates are not quantized if the result has no transform
+    transform = {'origin': _LOWER_LEFT, 'scale': [1.0, 1.0, 1.0, 1.0], 'translate': [0.0, 0.0, 0.0, 0.0]}
+    feature_bufs = []
+
+    for field_number, wire_type, value in _iter_fields(buf):
+        if field_number == 1:
+            result['objectIdFieldName'] = _string(value)
+        elif field_number == 3:
+            result['globalIdFieldName'] = _string(value)
+        elif field_number == 7:
+            geometry_type = _GEOMETRY_TYPES.get(value, value)
+        elif field_number == 8:
+            result['spatialReference'] = _decode_spatial_reference(value)
+        elif field_number == 9:
+            result['exceededTransferLimit'] = bool(value)
+        elif field_number == 10:
+            result['hasZ'] = bool(value)
+        elif field_number == 11:
+            result['hasM'] = bool(value)
+        elif field_number == 12:
+            transform = _decode_transform(value)
+        elif field_number == 13:
+            result['fields'].append(_decode_field(value))
+        elif field_number == 15:
+            # decoded once the fields, geometry type and transform (which may follow) are known
+            feature_bufs.append(value)
+
+    result['geometryType'] = geometry_type
+    has_z = result.get('hasZ', False)
+    has_m = result.get('hasM', False)
+    field_names = [f['name'] for f in result['fields']]
+
+    for feature_buf in feature_bufs:
+        values = []
+        feature = {}
+
+        for field_number, wire_type, value in _iter_fields(feature_buf):
+            if field_number == 1:
+                values.append(_decode_value(value))
+            elif field_number == 2:
+                feature['geometry'] = _decode_geometry(value, geometry_type, has_z, has_m, transform)
+            elif field_number == 4:
+                feature['centroid'] = _decode_geometry(value, _GEOMETRY_TYPES[0], False, False, transform)
+
+        feature['attributes'] = dict(zip(field_names, values))
+        result['features'].append(feature)
+
+    return result
+
+
+def decode_query_result(content):
+    """
+    Decode a feature service query response in protocol buffer format (f=pbf) as the equivalent ESRI JSON result.
+
+    Feature, count (returnCountOnly) and object ID (returnIdsOnly) results are supported. Quantized coordinates
+    are converted back to map coordinates with the result transform.
+
+    :param content: <bytes> Response body
+    :return: <dict> Query result as ESRI JSON
+    """
+
+    buf = memoryview(content)
+
+    for field_number, wire_type, value in _iter_fields(buf):
+        if field_number != 2:
+            continue
+
+        for result_type, w, result in _iter_fields(value):
+            if result_type == 1:
+                return _decode_feature_result(result)
+            if result_type == 2:
+                return dict({'count': 0}, **_decode_message(result, {1: ('count', int)}))
+            if result_type == 3:
+                ids = {'objectIds': []}
+                for i, w2, v in _iter_fields(result):
+                    if i == 1:
+                        ids['objectIdFieldName'] = _string(v)
+                    elif i == 3:
+                        ids['objectIds'].extend(_packed_varints(w2, v))
+                return ids
+
+    return {'features': []}
@@ -0,0 +1,157 @@
+import json
+import time
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SyncStateStore(object):
+    """Persist per-feature sync state in a single-file SQLite database.
+
+    For each job, records uid -> (source OID, target OID, content hash, last synced time), plus named values such as
+    incremental sync high-water marks. Several jobs can share one database file.
+    """
+
+    def __init__(self, path, job_name, batch_size=1000):
+        """
+        Class initializer.
+
+        :param path: <str> Path to SQLite database file; created if it does not exist
+        :param job_name: <str> Name identifying the sync or import job
+        :param batch_size: <int> Number of records written per transaction
+        """
+
+        self.path = path
+        self.job_name = job_name
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(path)
+        self.__create_tables()
+
+    def __create_tables(self):
+        """
+        Create the state tables if they do not exist.
+
+        :return: None
+        """
+
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS features ('
+                              'job TEXT NOT NULL, uid NOT NULL, src_oid INTEGER, tgt_oid INTEGER, hash TEXT, '
+                              'synced REAL, PRIMARY KEY (job, uid))')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS marks ('
+                              'job TEXT NOT NULL, name TEXT NOT NULL, value TEXT, PRIMARY KEY (job, name))')
+
+    def __batches(self, items):
+        """
+        Yield lists of up to self.batch_size items.
+
+        :param items: <iter> Items
+        :return: <iterator> Lists of items
+        """
+
+        batch = []
+
+        for item in items:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def count(self):
+        """
+        Get the number of feature records for this job.
+
+        :return: <int> Record count
+        """
+
+        return self.conn.execute('SELECT COUNT(*) FROM features WHERE job = ?', (self.job_name,)).fetchone()[0]
+
+    def index(self):
+        """
+        Get feature records for this job.
+
+        :return: <dict> Map of uid to (source OID, target OID, hash)
+        """
+
+        cursor = self.conn.execute('SELECT uid, src_oid, tgt_oid, hash FROM features WHERE job = ?', (self.job_name,))
+        return {uid: (src_oid, tgt_oid, content_hash) for uid, src_oid, tgt_oid, content_hash in cursor}
+
+    def upsert(self, records):
+        """
+        Insert or replace feature records for this job, in batched transactions.
+
+        :param records: <iter> Tuples of (uid, source OID, target OID, hash)
+        :return: None
+        """
+
+        synced = time.time()
+
+        for batch in self.__batches(records):
+            with self.conn:
+                self.conn.executemany('INSERT OR REPLACE INTO features (job, uid, src_oid, tgt_oid, hash, synced) '
+                                      'VALUES (?, ?, ?, ?, ?, ?)',
+                                      [(self.job_name, uid, src_oid, tgt_oid, content_hash, synced)
+                                       for uid, src_oid, tgt_oid, content_hash in batch])
+
+    def delete(self, uids):
+        """
+        Delete feature records for this job, in batched transactions.
+
+        :param uids: <iter> Unique IDs
+        :return: None
+        """
+
+        for batch in self.__batches(uids):
+            with self.conn:
+                self.conn.executemany('DELETE FROM features WHERE job = ? AND uid = ?',
+                                      [(self.job_name, uid) for uid in batch])
+
+    def get_mark(self, name, default=None):
+        """
+        Get a named value (e.g. a high-water mark) for this job.
+
+        :param name: <str> Value name
+        :param default: <object> Value returned if name has not been set
+        :return: <object> JSON-serializable value
+        """
+
+        row = self.conn.execute('SELECT value FROM marks WHERE job = ? AND name = ?',
+                                (self.job_name, name)).fetchone()
+        return json.loads(row[0]) if row is not None else default
+
+    def set_mark(self, name, value):
+        """
+        Set a named value (e.g. a high-water mark) for this job.
+
+        :param name: <str> Value name
+        :param value: <object> JSON-serializable value
+        :return: None
+        """
+
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO marks (job, name, value) VALUES (?, ?, ?)',
+                              (self.job_name, name, json.dumps(value)))
+
+    def clear(self):
+        """
+        Delete all feature records and named values for this job.
+
+        :return: None
+        """
+
+        with self.conn:
+            self.conn.execute('DELETE FROM features WHERE job = ?', (self.job_name,))
+            self.conn.execute('DELETE FROM marks WHERE job = ?', (self.job_name,))
+
+    def close(self):
+        """
+        Close the database connection.
+
+        :return: None
+        """
+
+        self.conn.close()
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+from agstools.utility import get_token_info
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# tokens shared by all providers in the process, keyed by (token URL, username), each key with its own lock so that
+# a slow login for one key does not block the others
+_tokens = {}
+_token_locks = {}
+_token_locks_lock = threading.Lock()
+
+
+class TokenProvider(object):
+    """Supply ArcGIS Online / ArcGIS Server tokens, cached until shortly before they expire.
+
+    Tokens are cached in memory per (token URL, username), so every provider (and every feature layer using one) in
+    a process shares a single login. With cache_path, tokens are also cached in a file shared by processes; the file
+    is locked while it is read and written, so concurrent jobs log in once between them.
+    """
+
+    def __init__(self, token_url, username, password, expiration=60, refresh_margin=300, cache_path=None):
+        """
+        Class initializer.
+
+        :param token_url: <str> Token request REST endpoint (e.g. .../sharing/rest/generateToken)
+        :param username: <str> Username
+        :param password: <str> Password
+        :param expiration: <int> Requested token lifetime in minutes
+        :param refresh_margin: <int> Seconds before expiry at which a cached token is replaced; at most half of the
+                               token lifetime
+        :param cache_path: <str> Path to token cache file (.json) shared by processes, optional
+        """
+
+        self.token_url = token_url
+        self.username = username
+        self.password = password
+        self.expiration = expiration
+        self.refresh_margin = refresh_margin
+        self.cache_path = cache_path
+
+    @property
+    def key(self):
+        """
+        Get the cache key for tokens from this provider.
+
+        :return: <str> Cache key
+        """
+
+        return '{0}@{1}'.format(self.username, self.token_url)
+
+    def __key_lock(self):
+        """
+        Get the lock guarding cached tokens for this provider's key.
+
+        :return: <threading.Lock> Lock
+        """
+
+        with _token_locks_lock:
+            return _token_locks.setdefault(self.key, threading.Lock())
+
+    def __is_fresh(self, entry):
+        """
+        Check whether a cached token entry is usable for at least refresh_margin seconds.
+
+        The margin is limited to half of the token lifetime, so a token shorter-lived than refresh_margin is still
+        used rather than replaced on every request.
+
+        :param entry: <dict> Cached token entry with 'token', 'expires' (milliseconds since epoch) and optionally
+                      'issued' (seconds since epoch)
+        :return: <bool>
+        """
+
+        if not entry:
+            return False
+
+        lifetime = entry['expires'] / 1e3 - entry['issued'] if 'issued' in entry else self.expiration * 60
+        margin = min(self.refresh_margin, lifetime / 2)
+
+        return entry['expires'] / 1e3 - margin > time.time()
+
+    @contextlib.contextmanager
+    def __locked_cache(self):
+        """
+        Hold an exclusive lock on the token cache file while the block runs.
+
+        :return: <contextlib.contextmanager>
+        """
+
+        with open(self.cache_path + '.lock', 'a+') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def __read_cache(self):
+        """
+        Return the token cache file entries (the cache file must be locked).
+
+        :return: <dict> Map of cache keys to token entries
+        """
+
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def __write_cache(self, entries):
+        """
+        Replace the token cache file entries (the cache file must be locked), dropping expired tokens.
+
+        The file is written under a temporary name, readable by the owner only, and moved into place once complete.
+
+        :param entries: <dict> Map of cache keys to token entries
+        :return: None
+        """
+
+        entries = {k: v for k, v in entries.items() if v['expires'] / 1e3 > time.time()}
+        temp_path = self.cache_path + '.part'
+
+        with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            f.write(json.dumps(entries))
+
+        os.replace(temp_path, self.cache_path)
+
+    def __request_token(self):
+        """
+        Return a new token entry from the token endpoint.
+
+        :return: <dict> Token entry with 'token', 'expires' (milliseconds since epoch) and 'issued' (seconds since
+                 epoch)
+        """
+
+        logger.debug("Requesting token ({0}).".format(self.key))
+        issued = time.time()
+        response = get_token_info(self.token_url, self.username, self.password, self.expiration)
+        expires = response.get('expires') or (issued + self.expiration * 60) * 1e3
+
+        return {'token': response['token'], 'expires': expires, 'issued': issued}
+
+    def get_token(self, refresh=False):
+        """
+        Get a token that is valid for at least refresh_margin seconds.
+
+        The in-memory cache is checked first, then the cache file (if any); a new token is only requested if neither
+        holds a fresh one, and it is then stored in both.
+
+        :param refresh: <bool> Request a new token even if a cached token is fresh
+        :return: <str> Token
+        """
+
+        with self.__key_lock():
+            entry = _tokens.get(self.key)
+            if not refresh and self.__is_fresh(entry):
+                return entry['token']
+
+            if self.cache_path is None:
+                entry = self.__request_token()
+            else:
+                with self.__locked_cache():
+                    entries = self.__read_cache()
+                    entry = entries.get(self.key)
+                    if refresh or not self.__is_fresh(entry):
+                        entry = self.__request_token()
+                        entries[self.key] = entry
+                        self.__write_cache(entries)
+
+            _tokens[self.key] = entry
+
+            return entry['token']
+
+    def invalidate(self, token=None):
+        """
+        Remove a token rejected by the server from the caches, so that the next .get_token() requests a new one.
+
+        Only a cached token equal to token is removed, so a new token cached by another thread or process is kept.
+
+        :param token: <str> Rejected token; removes any cached token if None
+        :return: None
+        """
+
+        with self.__key_lock():
+            entry = _tokens.get(self.key)
+            if entry and (token is None or entry['token'] == token):
+                del _tokens[self.key]
+
+            if self.cache_path is not None:
+                with self.__locked_cache():
+                    entries = self.__read_cache()
+                    entry = entries.get(self.key)
+                    if entry and (token is None or entry['token'] == token):
+                        del entries[self.key]
+                        self.__write_cache(entries)
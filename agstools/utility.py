@@ -1,8 +1,22 @@
 import json
 import urllib
+import hashlib
+import threading
 import contextlib
+import requests
+from itertools import islice
+from collections.abc import Sequence
+from requests.adapters import HTTPAdapter
 from dateutil import tz
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
 
 def parse_connection_string(connection_string):
     """
@@ -36,10 +50,49 @@ def submit_request(request):
         return job_info
 
 
+def get_token_info(token_url, username, password, expiration=None):
+    """
+    Return an authentication token and its expiry time from ArcGIS Online or ArcGIS Server.
+
+    :param token_url: <str> token request REST endpoint
+    :param username: <str> admin username
+    :param password: <str> admin password
+    :param expiration: <int> Requested token lifetime in minutes, optional (defaults to the server default)
+    :return: <dict> Token response, including 'token' and 'expires' (milliseconds since epoch)
+    """
+
+    url_parts = urllib.parse.urlparse(token_url)
+    host_url = url_parts.scheme + '://' + url_parts.netloc
+
+    params = {"username": username,
+              "password": password,
+              "referer": host_url,
+              "f": "json"}
+    if expiration is not None:
+        params["expiration"] = expiration
+
+    data = urllib.parse.urlencode(params)
+    data_encoded = data.encode("utf-8")
+    request = urllib.request.Request(token_url, data=data_encoded)
+    token_response = submit_request(request)
+
+    if "token" in token_response:
+        return token_response
+
+    error_mess = token_response.get("error", {}).get("message") or ""
+    if "This request needs to be made over https." in error_mess:
+        token_url = token_url.replace("http://", "https://")
+        return get_token_info(token_url, username, password, expiration)
+
+    raise Exception("Portal error: {} ".format(error_mess))
+
+
 def get_token(token_url, username, password):
     """
      Return an authentication token from ArcGIS Online or ArcGIS Server.
 
+    See token_provider.TokenProvider for tokens that are cached and refreshed before they expire.
+
     :param token_url: <str> token request REST endpoint
     :param username: <str> admin username
     :param password: <str> admin password
@@ -47,31 +100,56 @@ def get_token(token_url, username, password):
     """
 
     if token_url is not None:
-        url_parts = urllib.parse.urlparse(token_url)
-        host_url = url_parts.scheme + '://' + url_parts.netloc
-
-        params = {"username": username,
-                  "password": password,
-                  "referer": host_url,
-                  "f": "json"}
-
-        data = urllib.parse.urlencode(params)
-        data_encoded = data.encode("utf-8")
-        request = urllib.request.Request(token_url, data=data_encoded)
-        token_response = submit_request(request)
-
-        if "token" in token_response:
-            token = token_response.get("token")
-            return token
-        else:
-            if "error" in token_response:
-                error_mess = token_response.get("error", {}).get("message")
-                if "This request needs to be made over https." in error_mess:
-                    token_url = token_url.replace("http://", "https://")
-                    token = get_token(token_url, username, password)
-                    return token
-                else:
-                    raise Exception("Portal error: {} ".format(error_mess))
+        return get_token_info(token_url, username, password)["token"]
+
+
+def get_session(url, certificate=None, pool_size=10):
+    """
+    Return a pooled, keep-alive HTTP session shared by all callers for the same host, certificate and pool size.
+
+    Sessions are created once per (scheme, host, certificate, pool_size) and reused, so repeated requests against the
+    same server share open connections instead of performing a new TCP/TLS handshake for each request. Callers that
+    ask for a different pool_size get a separate session (and connection pool) for the same host.
+
+    :param url: <str> Any URL on the target host
+    :param certificate: <str> Path to certificate file (.pem)
+    :param pool_size: <int> Maximum number of connections kept open to the host
+    :return: <requests.Session>
+    """
+
+    url_parts = urllib.parse.urlparse(url)
+    key = (url_parts.scheme, url_parts.netloc, certificate, pool_size)
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'Connection': 'keep-alive'})
+
+            if certificate is not None:
+                session.verify = certificate
+
+            _sessions[key] = session
+
+    return session
+
+
+def loads(content):
+    """
+    Return the object decoded from a JSON document, using orjson when it is installed.
+
+    :param content: <bytes> JSON document
+    :return: <object>
+    """
+
+    if orjson is not None:
+        return orjson.loads(content)
+
+    return json.loads(content)
 
 
 def merge_dicts(x, y):
@@ -92,13 +170,112 @@ def chunk_iterable(i, n):
     """
     Yield n-sized chunks from iterable i.
 
+    Sequences are sliced; other iterables (e.g. generators) are consumed lazily, one chunk (list) at a time.
+
     :param i: <iter> any iterable type
     :param n: <int> chunk size
     :return: <iterator>
     """
 
-    for j in range(0, len(i), n):
-        yield i[j:j+n]
+    if isinstance(i, Sequence):
+        for j in range(0, len(i), n):
+            yield i[j:j+n]
+        return
+
+    iterator = iter(i)
+    chunk = list(islice(iterator, n))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, n))
+
+
+def oid_ranges(oids):
+    """
+    Return runs of consecutive object IDs.
+
+    :param oids: <iter> Object IDs (any order; duplicates ignored)
+    :return: <list> Tuples of (first OID, last OID)
+    """
+
+    ranges = []
+
+    for oid in sorted(set(oids)):
+        if ranges and oid == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], oid)
+        else:
+            ranges.append((oid, oid))
+
+    return ranges
+
+
+def _oid_terms(oids, min_run=3):
+    """
+    Yield (first, last) object ID terms, with runs shorter than min_run split into single IDs (first == last).
+
+    :param oids: <iter> Object IDs
+    :param min_run: <int> Minimum run length kept as a range
+    :return: <iterator> Tuples of (first, last)
+    """
+
+    for first, last in oid_ranges(oids):
+        if last - first + 1 >= min_run:
+            yield first, last
+        else:
+            for o in range(first, last + 1):
+                yield o, o
+
+
+def _oid_terms_where_clause(oid_field, terms):
+    """
+    Return a where clause selecting object ID terms from _oid_terms().
+
+    :param oid_field: <str> OID field name
+    :param terms: <list> Tuples of (first, last)
+    :return: <str> Where clause
+    """
+
+    clauses = ['{0} BETWEEN {1} AND {2}'.format(oid_field, first, last) for first, last in terms if first != last]
+    singles = [str(first) for first, last in terms if first == last]
+
+    if singles:
+        clauses.append('{0} IN ({1})'.format(oid_field, ', '.join(singles)))
+
+    return ' OR '.join(clauses) if clauses else '1=0'
+
+
+def oid_where_clause(oid_field, oids, min_run=3):
+    """
+    Return a where clause selecting object IDs, with runs of consecutive IDs compressed to BETWEEN terms.
+
+    e.g. OBJECTID BETWEEN 1 AND 500 OR OBJECTID IN (502, 504)
+
+    The clause is not bounded in length; see oid_where_clauses() for large or scattered sets of object IDs.
+
+    :param oid_field: <str> OID field name
+    :param oids: <iter> Object IDs
+    :param min_run: <int> Minimum run length written as a BETWEEN term; shorter runs are listed individually
+    :return: <str> Where clause
+    """
+
+    return _oid_terms_where_clause(oid_field, list(_oid_terms(oids, min_run)))
+
+
+def oid_where_clauses(oid_field, oids, max_terms=500, min_run=3):
+    """
+    Yield where clauses selecting object IDs, each with at most max_terms BETWEEN terms and listed IDs.
+
+    Bounding each clause keeps it within database IN list limits (e.g. 1000 items in Oracle) and URL and where
+    clause length limits, however scattered the object IDs are.
+
+    :param oid_field: <str> OID field name
+    :param oids: <iter> Object IDs
+    :param max_terms: <int> Maximum number of BETWEEN terms and listed IDs per clause
+    :param min_run: <int> Minimum run length written as a BETWEEN term; shorter runs are listed individually
+    :return: <iterator> Where clauses
+    """
+
+    for terms in chunk_iterable(_oid_terms(oids, min_run), max_terms):
+        yield _oid_terms_where_clause(oid_field, terms)
 
 
 def features_as_json(features=[]):
@@ -112,6 +289,60 @@ def features_as_json(features=[]):
     return json.dumps(features)
 
 
+def _normalize_value(value, precision):
+    """
+    Return value with floats rounded to precision and whole-number floats converted to int.
+
+    :param value: <object> Attribute value or coordinate structure
+    :param precision: <int> Number of decimal places
+    :return: <object>
+    """
+
+    if isinstance(value, float):
+        value = round(value, precision)
+        return int(value) if value.is_integer() else value
+    if isinstance(value, (list, tuple)):
+        return [_normalize_value(v, precision) for v in value]
+    if isinstance(value, dict):
+        return {k: _normalize_value(v, precision) for k, v in value.items()}
+
+    return value
+
+
+def hash_attributes(attributes, attribute_names=None, precision=8):
+    """
+    Return a hash of feature attribute values that is independent of attribute order and float representation.
+
+    :param attributes: <dict> Feature attributes
+    :param attribute_names: <iter> Names of attributes to include; all attributes if None
+    :param precision: <int> Number of decimal places compared for float values
+    :return: <str> Hex digest
+    """
+
+    if attribute_names is not None:
+        attributes = {k: attributes.get(k) for k in attribute_names}
+
+    normalized = json.dumps(_normalize_value(attributes, precision), sort_keys=True)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def hash_geometry(geometry, precision=8):
+    """
+    Return a hash of an ESRI JSON geometry, with coordinates rounded to precision and spatial reference ignored.
+
+    :param geometry: <dict> ESRI JSON geometry
+    :param precision: <int> Number of decimal places compared for coordinates
+    :return: <str> Hex digest
+    """
+
+    if geometry is None:
+        return None
+
+    geometry = {k: v for k, v in geometry.items() if k != 'spatialReference'}
+    normalized = json.dumps(_normalize_value(geometry, precision), sort_keys=True)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
 def geom_esri_to_geojson(esri_geom_type):
     """
     Return GeoJSON equivalent of ESRI geometry type.
@@ -127,7 +358,7 @@ def geom_esri_to_geojson(esri_geom_type):
     try:
         return geom_type_map[esri_geom_type]
 
-    except IndexError:
+    except KeyError:
         raise Exception("There is no conversion for the specified ESRI geometry type.")
 
 
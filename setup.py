@@ -17,6 +17,9 @@ setuptools.setup(
         'python-dateutil',
         'requests'
     ],
+    extras_require={
+        'fast': ['orjson', 'numpy']
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: Microsoft :: Windows"
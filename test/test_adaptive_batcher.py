@@ -0,0 +1,56 @@
+import requests
+from agstools.adaptive_batcher import AdaptiveBatcher
+from unittest import TestCase
+
+
+def http_error(status_code):
+    """Return an HTTPError for a response with status_code."""
+
+    response = requests.Response()
+    response.status_code = status_code
+
+    return requests.exceptions.HTTPError(response=response)
+
+
+class TestAdaptiveBatcher(TestCase):
+
+    def test_record(self):
+        """Test that the size moves toward the target duration by at most a factor of two per batch."""
+
+        batcher = AdaptiveBatcher(size=100, min_size=10, max_size=1000, target_seconds=5.0)
+        self.assertEqual(batcher.record(100, 0.1), 200)
+        self.assertEqual(batcher.record(200, 4.0), 250)
+        self.assertEqual(batcher.record(250, 100.0), 125)
+        self.assertEqual(batcher.record(0, 1.0), 125)
+
+    def test_limits(self):
+        """Test that byte limits and the minimum and maximum sizes bound the size."""
+
+        batcher = AdaptiveBatcher(size=100, min_size=10, max_size=150, max_request_bytes=1000)
+        self.assertEqual(batcher.record(100, 0.1), 150)
+        self.assertEqual(batcher.record(150, 0.1, request_bytes=3000), 75)
+        self.assertEqual(AdaptiveBatcher(size=5, min_size=10).size, 10)
+
+    def test_back_off(self):
+        """Test halving, the minimum size and the ceiling after a too large failure."""
+
+        batcher = AdaptiveBatcher(size=100, min_size=20, max_size=1000)
+        self.assertTrue(batcher.back_off('too_large'))
+        self.assertEqual(batcher.size, 50)
+        self.assertEqual(batcher.record(50, 0.01), 99)
+        self.assertTrue(batcher.back_off())
+        self.assertTrue(batcher.back_off())
+        self.assertEqual(batcher.size, 24)
+        self.assertTrue(batcher.back_off())
+        self.assertEqual(batcher.size, 20)
+        self.assertFalse(batcher.back_off())
+
+    def test_back_off_reason(self):
+        """Test failure reasons from errors."""
+
+        self.assertEqual(AdaptiveBatcher.back_off_reason(requests.exceptions.ReadTimeout()), 'timeout')
+        self.assertEqual(AdaptiveBatcher.back_off_reason(http_error(413)), 'too_large')
+        self.assertEqual(AdaptiveBatcher.back_off_reason(http_error(504)), 'timeout')
+        self.assertEqual(AdaptiveBatcher.back_off_reason(Exception('Request too large')), 'too_large')
+        self.assertIsNone(AdaptiveBatcher.back_off_reason(http_error(500)))
+        self.assertIsNone(AdaptiveBatcher.back_off_reason(Exception('Invalid token')))
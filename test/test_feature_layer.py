@@ -31,3 +31,17 @@ class TestFeatureLayer(TestCase):
 
         definition = self.feature_layer.definition()
         self.assertTrue('geometryType' in definition.keys())
+
+    def test_query_features_batch_concurrent(self):
+        """Test FeatureLayer.query_features_batch() with concurrent batch requests."""
+
+        features = self.feature_layer.query_features_batch(where='1=1', outFields='*')
+        concurrent_features = self.feature_layer.query_features_batch(where='1=1', outFields='*', max_workers=4)
+        self.assertEqual(features, concurrent_features)
+
+    def test_iter_features(self):
+        """Test FeatureLayer.iter_features() yields the same features as .query_features_batch()."""
+
+        features = self.feature_layer.query_features_batch(where='1=1', outFields='*')
+        streamed_features = list(self.feature_layer.iter_features(where='1=1', outFields='*', prefetch=True))
+        self.assertEqual(features, streamed_features)
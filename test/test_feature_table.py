@@ -0,0 +1,60 @@
+from datetime import timezone
+from agstools.feature_table import FeatureTable
+from unittest import TestCase
+
+
+class TestFeatureTable(TestCase):
+
+    def setUp(self):
+        """Setup features with nulls, missing attributes and missing geometries."""
+
+        self.features = [
+            {'attributes': {'OBJECTID': 1, 'NAME': 'a', 'VALUE': 1.5, 'DATE': 0}, 'geometry': {'x': 1, 'y': 2}},
+            {'attributes': {'OBJECTID': 2, 'NAME': None, 'VALUE': None, 'DATE': None}, 'geometry': None},
+            {'attributes': {'OBJECTID': 3, 'VALUE': 2.5, 'EXTRA': 'x'}},
+            {'attributes': {'OBJECTID': 2 ** 70, 'NAME': 'a', 'VALUE': 3}, 'geometry': {'x': 3, 'y': 4}}]
+        self.table = FeatureTable.from_features(self.features, {'DATE': 'esriFieldTypeDate'})
+
+    def test_round_trip(self):
+        """Test that features convert back unchanged, including nulls, missing attributes and geometries."""
+
+        self.assertEqual(len(self.table), 4)
+        self.assertEqual(self.table.to_features(), self.features)
+        self.assertEqual(self.table.field_names, ['OBJECTID', 'NAME', 'VALUE', 'DATE', 'EXTRA'])
+
+    def test_columns(self):
+        """Test column values and indexes."""
+
+        self.assertEqual(self.table.column('VALUE'), [1.5, None, 2.5, 3])
+        self.assertEqual(self.table.column('EXTRA'), [None, None, 'x', None])
+        self.assertEqual(self.table.index('OBJECTID', 'NAME'), {1: 'a', 2: None, 3: None, 2 ** 70: 'a'})
+
+    def test_attribute_operations(self):
+        """Test replacing, removing, adding and setting attributes."""
+
+        self.table.replace_attributes({'NAME': 'LABEL', 'OBJECTID': 'OBJECTID'})
+        self.table.remove_attributes(['EXTRA'])
+        self.table.add_attributes({'STATUS': 'new'})
+        self.table.set_values('VALUE', 0)
+        self.assertEqual(self.table.feature(2), {'attributes': {'OBJECTID': 3, 'VALUE': 0, 'STATUS': 'new'}})
+        self.assertEqual(self.table.feature(0)['attributes'],
+                         {'OBJECTID': 1, 'VALUE': 0, 'DATE': 0, 'LABEL': 'a', 'STATUS': 'new'})
+
+        with self.assertRaises(Exception):
+            self.table.replace_attributes({'LABEL': 'VALUE'})
+        with self.assertRaises(Exception):
+            self.table.add_attributes({'STATUS': None})
+
+    def test_replace_values(self):
+        """Test that only present values are replaced."""
+
+        self.table.replace_values({'a': 'b', None: 'null'}, ['NAME'])
+        self.assertEqual(self.table.column('NAME'), ['b', 'null', None, 'b'])
+        self.assertNotIn('NAME', self.table.feature(2)['attributes'])
+
+    def test_format_dates(self):
+        """Test that date values are formatted and nulls kept."""
+
+        self.table.format_dates(tz=timezone.utc)
+        self.assertEqual(self.table.column('DATE'), ['1970-01-01', None, None, None])
+        self.assertEqual(self.table.field_types['DATE'], 'esriFieldTypeString')
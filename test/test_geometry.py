@@ -0,0 +1,80 @@
+from agstools.geometry import esri_to_geojson_geometry, dequantize_geometry
+from unittest import TestCase
+
+
+def signed_area(ring):
+    """Return the signed area of a closed ring; positive for counter-clockwise rings."""
+
+    return 0.5 * sum(ring[i][0] * ring[i + 1][1] - ring[i + 1][0] * ring[i][1] for i in range(len(ring) - 1))
+
+
+# clockwise (ESRI exterior) and counter-clockwise (ESRI hole) rings
+OUTER_CW = [[0, 0], [0, 10], [10, 10], [10, 0], [0, 0]]
+HOLE_CCW = [[2, 2], [4, 2], [4, 4], [2, 4], [2, 2]]
+OTHER_CW = [[20, 0], [20, 5], [25, 5], [25, 0], [20, 0]]
+
+
+class TestGeometry(TestCase):
+
+    def test_polygon_winding(self):
+        """Test that exterior rings become counter-clockwise and holes clockwise (RFC 7946)."""
+
+        geometry = esri_to_geojson_geometry({'rings': [OUTER_CW, HOLE_CCW]})
+        self.assertEqual(geometry['type'], 'Polygon')
+        exterior, hole = geometry['coordinates']
+        self.assertGreater(signed_area(exterior), 0)
+        self.assertLess(signed_area(hole), 0)
+
+    def test_multipolygon_hole_assignment(self):
+        """Test that each hole is assigned to the exterior ring containing it."""
+
+        geometry = esri_to_geojson_geometry({'rings': [OTHER_CW, HOLE_CCW, OUTER_CW]})
+        self.assertEqual(geometry['type'], 'MultiPolygon')
+        self.assertEqual(sorted(len(p) for p in geometry['coordinates']), [1, 2])
+        for polygon in geometry['coordinates']:
+            self.assertGreater(signed_area(polygon[0]), 0)
+            for hole in polygon[1:]:
+                self.assertLess(signed_area(hole), 0)
+
+    def test_all_counter_clockwise(self):
+        """Test that rings of a geometry with no clockwise rings are all written as counter-clockwise exteriors."""
+
+        geometry = esri_to_geojson_geometry({'rings': [list(reversed(OUTER_CW)), list(reversed(OTHER_CW))]})
+        self.assertEqual(geometry['type'], 'MultiPolygon')
+        for polygon in geometry['coordinates']:
+            self.assertEqual(len(polygon), 1)
+            self.assertGreater(signed_area(polygon[0]), 0)
+
+    def test_orphan_hole(self):
+        """Test that a hole outside every exterior ring is written as a counter-clockwise exterior."""
+
+        orphan = [[30, 30], [32, 30], [32, 32], [30, 32], [30, 30]]
+        geometry = esri_to_geojson_geometry({'rings': [OUTER_CW, orphan]})
+        self.assertEqual(geometry['type'], 'MultiPolygon')
+        for polygon in geometry['coordinates']:
+            self.assertGreater(signed_area(polygon[0]), 0)
+
+    def test_unclosed_ring(self):
+        """Test that rings are closed."""
+
+        ring = esri_to_geojson_geometry({'rings': [OUTER_CW[:-1]]})['coordinates'][0]
+        self.assertEqual(ring[0], ring[-1])
+        self.assertEqual(len(ring), 5)
+
+    def test_m_values_dropped(self):
+        """Test that M values are dropped and Z values kept."""
+
+        self.assertEqual(esri_to_geojson_geometry({'paths': [[[0, 0, 5], [1, 1, 6]]], 'hasM': True}),
+                         {'type': 'LineString', 'coordinates': [[0, 0], [1, 1]]})
+        self.assertEqual(esri_to_geojson_geometry({'points': [[0, 0, 1, 5]], 'hasZ': True, 'hasM': True}),
+                         {'type': 'MultiPoint', 'coordinates': [[0, 0, 1]]})
+
+    def test_dequantize(self):
+        """Test dequantizing points (absolute) and paths (deltas) for both origin positions."""
+
+        upper = {'originPosition': 'upperLeft', 'scale': [0.5, 0.5], 'translate': [100, 200]}
+        lower = dict(upper, originPosition='lowerLeft')
+        self.assertEqual(dequantize_geometry({'x': 4, 'y': 6}, upper), {'x': 102.0, 'y': 197.0})
+        self.assertEqual(dequantize_geometry({'x': 4, 'y': 6}, lower), {'x': 102.0, 'y': 203.0})
+        self.assertEqual(dequantize_geometry({'paths': [[[0, 0], [2, 2], [1, -1]]]}, lower),
+                         {'paths': [[[100.0, 200.0], [101.0, 201.0], [101.5, 200.5]]]})
@@ -0,0 +1,58 @@
+import json
+from agstools.json_stream import iter_array_items
+from unittest import TestCase
+
+
+def split(content, size):
+    """Split bytes into chunks of size bytes."""
+
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+class TestJsonStream(TestCase):
+
+    def setUp(self):
+        """Setup a query result with values that straddle chunk boundaries."""
+
+        self.features = [{'attributes': {'OBJECTID': i, 'NAME': 'a "quoted" \\ name ]} é', 'VALUE': -12.5e-3 * i,
+                                         'FLAG': i % 2 == 0, 'EMPTY': None},
+                          'geometry': {'paths': [[[i, i + 1], [i + 2.25, i + 3]]]}} for i in range(20)]
+        self.result = {'objectIdFieldName': 'OBJECTID', 'features': self.features, 'exceededTransferLimit': True}
+        self.content = json.dumps(self.result, ensure_ascii=False).encode('utf-8')
+
+    def test_chunk_sizes(self):
+        """Test that items and other members decode the same for every chunk size."""
+
+        for size in (1, 2, 3, 7, 64, len(self.content)):
+            members = {}
+            items = list(iter_array_items(split(self.content, size), members=members))
+            self.assertEqual(items, self.features)
+            self.assertEqual(members, {'objectIdFieldName': 'OBJECTID', 'exceededTransferLimit': True})
+
+    def test_split_at_every_position(self):
+        """Test splitting the document into two chunks at every byte, including inside multibyte characters."""
+
+        for i in range(1, len(self.content)):
+            items = list(iter_array_items([self.content[:i], self.content[i:]]))
+            self.assertEqual(items, self.features)
+
+    def test_scalar_items(self):
+        """Test numbers and literals split across chunks."""
+
+        content = b'{"features": [12345, -0.5e10, true, null, "s", [], {}]}'
+        self.assertEqual(list(iter_array_items(split(content, 2))), [12345, -0.5e10, True, None, 's', [], {}])
+
+    def test_empty(self):
+        """Test empty objects and arrays, and a missing array member."""
+
+        self.assertEqual(list(iter_array_items([b'{}'])), [])
+        self.assertEqual(list(iter_array_items([b'{"features": [ ]}'])), [])
+        members = {}
+        self.assertEqual(list(iter_array_items([b'{"error": {"code": 498}}'], members=members)), [])
+        self.assertEqual(members, {'error': {'code': 498}})
+
+    def test_truncated(self):
+        """Test that a truncated document raises an error."""
+
+        with self.assertRaises(ValueError):
+            list(iter_array_items(split(self.content[:-10], 16)))
@@ -0,0 +1,154 @@
+import struct
+from agstools.pbf import decode_query_result
+from unittest import TestCase
+
+
+def varint(value):
+    """Encode a base 128 varint."""
+
+    out = bytearray()
+    while True:
+        b = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def zigzag(value):
+    """Zigzag-encode a signed value."""
+
+    return (value << 1) ^ (value >> 63)
+
+
+def field_varint(number, value):
+    """Encode a varint field."""
+
+    return varint(number << 3) + varint(value)
+
+
+def field_double(number, value):
+    """Encode a double (fixed64) field."""
+
+    return varint(number << 3 | 1) + struct.pack('<d', value)
+
+
+def field_bytes(number, value):
+    """Encode a length-delimited field."""
+
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return varint(number << 3 | 2) + varint(len(value)) + value
+
+
+def packed(number, values):
+    """Encode a packed repeated varint field."""
+
+    return field_bytes(number, b''.join(varint(v) for v in values))
+
+
+def transform(origin, scale, translate):
+    """Encode a Transform message; scale and translate are (x, y, m, z)."""
+
+    return (field_varint(1, origin) +
+            field_bytes(2, b''.join(field_double(i + 1, v) for i, v in enumerate(scale))) +
+            field_bytes(3, b''.join(field_double(i + 1, v) for i, v in enumerate(translate))))
+
+
+def geometry(coords, lengths=()):
+    """Encode a Geometry message from coordinate deltas."""
+
+    return (packed(2, lengths) if lengths else b'') + packed(3, [zigzag(c) for c in coords])
+
+
+def feature_collection(result_type, result):
+    """Wrap a result message in QueryResult and FeatureCollectionPBuffer messages."""
+
+    return field_bytes(2, field_bytes(result_type, result))
+
+
+def feature_result(geometry_type, features, fields=(), transform_buf=None, has_z=False, has_m=False):
+    """Encode a FeatureResult message."""
+
+    buf = field_bytes(1, 'OBJECTID') + field_varint(7, geometry_type)
+    if has_z:
+        buf += field_varint(10, 1)
+    if has_m:
+        buf += field_varint(11, 1)
+    for name, field_type in fields:
+        buf += field_bytes(13, field_bytes(1, name) + field_varint(2, field_type))
+    for values, geometry_buf in features:
+        buf += field_bytes(15, b''.join(field_bytes(1, v) for v in values) + field_bytes(2, geometry_buf))
+    # the transform may follow the features
+    if transform_buf is not None:
+        buf += field_bytes(12, transform_buf)
+
+    return feature_collection(1, buf)
+
+
+class TestPbf(TestCase):
+
+    def test_point_upper_left(self):
+        """Test that y is measured down from the translate origin for upperLeft transforms."""
+
+        content = feature_result(0, [([], geometry([4, 6]))],
+                                 transform_buf=transform(0, (0.5, 0.5, 1, 1), (100, 200, 0, 0)))
+        result = decode_query_result(content)
+        self.assertEqual(result['geometryType'], 'esriGeometryPoint')
+        self.assertEqual(result['features'][0]['geometry'], {'x': 102.0, 'y': 197.0})
+
+    def test_point_lower_left(self):
+        """Test that y is measured up from the translate origin for lowerLeft transforms."""
+
+        content = feature_result(0, [([], geometry([4, 6]))],
+                                 transform_buf=transform(1, (0.5, 0.5, 1, 1), (100, 200, 0, 0)))
+        result = decode_query_result(content)
+        self.assertEqual(result['features'][0]['geometry'], {'x': 102.0, 'y': 203.0})
+
+    def test_point_z_m(self):
+        """Test that z and m use their own scale and translate, with m last in each vertex."""
+
+        content = feature_result(0, [([], geometry([1, 2, 3, 4]))], has_z=True, has_m=True,
+                                 transform_buf=transform(1, (1, 1, 0.5, 0.25), (0, 0, 10, 20)))
+        result = decode_query_result(content)
+        self.assertEqual(result['features'][0]['geometry'], {'x': 1.0, 'y': 2.0, 'z': 20.75, 'm': 12.0})
+
+    def test_multipart_deltas(self):
+        """Test that coordinate deltas run across parts, split by the part lengths."""
+
+        content = feature_result(2, [([], geometry([0, 0, 2, 2, 1, -1, 3, 0], lengths=[2, 2]))],
+                                 transform_buf=transform(1, (1, 1, 1, 1), (0, 0, 0, 0)))
+        result = decode_query_result(content)
+        self.assertEqual(result['features'][0]['geometry'],
+                         {'paths': [[[0.0, 0.0], [2.0, 2.0]], [[3.0, 1.0], [6.0, 1.0]]]})
+
+    def test_polygon_z_deltas(self):
+        """Test that z deltas accumulate alongside x and y."""
+
+        coords = [0, 0, 5, 10, 0, 1, 0, 10, -1, -10, -10, 0]
+        content = feature_result(3, [([], geometry(coords, lengths=[4]))], has_z=True,
+                                 transform_buf=transform(1, (1, 1, 1, 1), (0, 0, 0, 0)))
+        rings = decode_query_result(content)['features'][0]['geometry']['rings']
+        self.assertEqual(rings, [[[0.0, 0.0, 5.0], [10.0, 0.0, 6.0], [10.0, 10.0, 5.0], [0.0, 0.0, 5.0]]])
+
+    def test_attributes(self):
+        """Test attribute values by type, including nulls."""
+
+        fields = [('OBJECTID', 6), ('NAME', 4), ('VALUE', 3), ('DELTA', 1), ('EMPTY', 4)]
+        values = [field_varint(5, 7), field_bytes(1, 'café'), field_double(3, 1.5),
+                  field_varint(6, (-3) & 0xffffffffffffffff), b'']
+        result = decode_query_result(feature_result(0, [(values, geometry([0, 0]))], fields=fields))
+        self.assertEqual([f['type'] for f in result['fields']],
+                         ['esriFieldTypeOID', 'esriFieldTypeString', 'esriFieldTypeDouble',
+                          'esriFieldTypeInteger', 'esriFieldTypeString'])
+        self.assertEqual(result['features'][0]['attributes'],
+                         {'OBJECTID': 7, 'NAME': 'café', 'VALUE': 1.5, 'DELTA': -3, 'EMPTY': None})
+
+    def test_count_and_ids(self):
+        """Test returnCountOnly and returnIdsOnly results."""
+
+        self.assertEqual(decode_query_result(feature_collection(2, field_varint(1, 300))), {'count': 300})
+        ids = decode_query_result(feature_collection(3, field_bytes(1, 'OBJECTID') + packed(3, [1, 2, 300])))
+        self.assertEqual(ids, {'objectIdFieldName': 'OBJECTID', 'objectIds': [1, 2, 300]})
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+from agstools.sync_state_store import SyncStateStore
+from unittest import TestCase
+
+
+class TestSyncStateStore(TestCase):
+
+    def setUp(self):
+        """Setup a store in a temporary folder."""
+
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'state.db')
+        self.store = SyncStateStore(self.path, 'job', batch_size=2)
+
+    def tearDown(self):
+        """Close the store and remove the temporary folder."""
+
+        self.store.close()
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        """Test that records and marks are read back after reopening the database."""
+
+        records = [('a', 1, 11, 'h1'), ('b', 2, 12, None), (3, None, 13, 'h3')]
+        self.store.upsert(iter(records))
+        self.store.set_mark('editDate', {'value': 1700000000000})
+        self.store.close()
+
+        self.store = SyncStateStore(self.path, 'job')
+        self.assertEqual(self.store.count(), 3)
+        self.assertEqual(self.store.index(), {uid: (src_oid, tgt_oid, content_hash)
+                                              for uid, src_oid, tgt_oid, content_hash in records})
+        self.assertEqual(self.store.get_mark('editDate'), {'value': 1700000000000})
+        self.assertIsNone(self.store.get_mark('missing'))
+        self.assertEqual(self.store.get_mark('missing', 0), 0)
+
+    def test_upsert_replaces(self):
+        """Test that upserting a uid replaces its record."""
+
+        self.store.upsert([('a', 1, 11, 'h1')])
+        self.store.upsert([('a', 1, 11, 'h2')])
+        self.assertEqual(self.store.index(), {'a': (1, 11, 'h2')})
+
+    def test_delete_and_clear(self):
+        """Test deleting records and clearing a job."""
+
+        self.store.upsert([('a', 1, 11, None), ('b', 2, 12, None), ('c', 3, 13, None)])
+        self.store.delete(['a', 'c', 'missing'])
+        self.assertEqual(list(self.store.index()), ['b'])
+
+        self.store.set_mark('editDate', 1)
+        self.store.clear()
+        self.assertEqual(self.store.count(), 0)
+        self.assertIsNone(self.store.get_mark('editDate'))
+
+    def test_jobs_isolated(self):
+        """Test that jobs sharing a database do not see each other's state."""
+
+        other = SyncStateStore(self.path, 'other')
+        try:
+            self.store.upsert([('a', 1, 11, None)])
+            self.store.set_mark('editDate', 1)
+            other.upsert([('a', 2, 22, None)])
+            other.clear()
+            self.assertEqual(self.store.index(), {'a': (1, 11, None)})
+            self.assertEqual(self.store.get_mark('editDate'), 1)
+            self.assertEqual(other.count(), 0)
+        finally:
+            other.close()
@@ -0,0 +1,46 @@
+from agstools.utility import chunk_iterable, oid_ranges, oid_where_clause, oid_where_clauses
+from unittest import TestCase
+
+
+class TestUtility(TestCase):
+
+    def test_chunk_iterable(self):
+        """Test chunking sequences and generators."""
+
+        self.assertEqual(list(chunk_iterable([1, 2, 3, 4, 5], 2)), [[1, 2], [3, 4], [5]])
+        self.assertEqual(list(chunk_iterable((i for i in range(5)), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(chunk_iterable(iter([]), 2)), [])
+
+    def test_oid_ranges(self):
+        """Test runs of consecutive object IDs, in any order and with duplicates."""
+
+        self.assertEqual(oid_ranges([5, 3, 4, 1, 9, 10, 4]), [(1, 1), (3, 5), (9, 10)])
+        self.assertEqual(oid_ranges([]), [])
+
+    def test_oid_where_clause(self):
+        """Test that long runs become BETWEEN terms and short runs are listed."""
+
+        self.assertEqual(oid_where_clause('OBJECTID', list(range(1, 501)) + [502, 504, 505]),
+                         'OBJECTID BETWEEN 1 AND 500 OR OBJECTID IN (502, 504, 505)')
+        self.assertEqual(oid_where_clause('OBJECTID', [1, 2, 3], min_run=4), 'OBJECTID IN (1, 2, 3)')
+        self.assertEqual(oid_where_clause('OBJECTID', []), '1=0')
+
+    def test_oid_where_clauses(self):
+        """Test that clauses are bounded in terms and together select every object ID once."""
+
+        oids = list(range(0, 3000, 2)) + list(range(5000, 6000))
+        clauses = list(oid_where_clauses('OBJECTID', oids, max_terms=100))
+        self.assertEqual(len(clauses), 16)
+
+        selected = []
+        for clause in clauses:
+            self.assertLessEqual(clause.count('BETWEEN') + clause.count(',') + clause.count(' IN '), 100)
+            for term in clause.split(' OR '):
+                if ' BETWEEN ' in term:
+                    first, last = term.split(' BETWEEN ')[1].split(' AND ')
+                    selected.extend(range(int(first), int(last) + 1))
+                else:
+                    selected.extend(int(o) for o in term.split('(')[1].rstrip(')').split(', '))
+
+        self.assertEqual(sorted(selected), oids)
+        self.assertEqual(list(oid_where_clauses('OBJECTID', [])), [])